@@ -17,11 +17,26 @@ def build_dataloader(cfg, split="training", is_distributed=False, world_size=Non
     -------
     ezflow.data.DataloaderCreator
 
+    Notes
+    -----
+    Datasets are mixed with an ezflow.data.MixtureSampler if SAMPLING_WEIGHT or REPEAT_FACTOR
+    is set in the config of a dataset. Datasets without a REPEAT_FACTOR are sampled once per epoch.
+    MIXTURE_NUM_SAMPLES optionally sets the number of samples of an epoch.
+
+    If STREAM_FRAMES is True, the validation datasets are streamed scene by scene
+    so that the frames shared by consecutive pairs are decoded once.
+
+    If BUCKET_BY_SIZE is True, the validation samples are batched by image size
+    so that datasets with images of different sizes can be evaluated without cropping.
+
     """
     from .dataloader import DataloaderCreator
 
     # TODO: assert mandatory config in cfg.data
 
+    stream_frames = split.lower() == "validation" and cfg.get("STREAM_FRAMES", False)
+    bucket_by_size = split.lower() == "validation" and cfg.get("BUCKET_BY_SIZE", False)
+
     dataloader_creator = DataloaderCreator(
         batch_size=cfg.BATCH_SIZE,
         pin_memory=cfg.PIN_MEMORY,
@@ -32,18 +47,68 @@ def build_dataloader(cfg, split="training", is_distributed=False, world_size=Non
         append_valid_mask=cfg.APPEND_VALID_MASK,
         distributed=is_distributed,
         world_size=world_size,
+        uint8_images=cfg.get("UINT8_IMAGES", False),
+        stream_frames=stream_frames,
+        bucket_by_size=bucket_by_size,
     )
 
     data_cfg = cfg.TRAIN_DATASET if split.lower() == "training" else cfg.VAL_DATASET
 
+    norm_params = cfg.NORM_PARAMS
+    batch_aug_cfg = cfg.get("BATCH_AUGMENTATION", None)
+    if split.lower() == "training" and batch_aug_cfg is not None and batch_aug_cfg.USE:
+        from ..functional import FUNCTIONAL_REGISTRY
+
+        batch_augmentor = FUNCTIONAL_REGISTRY.get("BatchFlowAugmentor")(
+            crop_size=batch_aug_cfg.CROP_SIZE,
+            sparse_transform=batch_aug_cfg.get("SPARSE_TRANSFORM", False),
+            norm_params=cfg.NORM_PARAMS,
+            **batch_aug_cfg.PARAMS,
+        )
+        dataloader_creator.set_batch_augmentor(
+            batch_augmentor, on_device=batch_aug_cfg.get("ON_DEVICE", False)
+        )
+
+        # Images are normalized by the batch augmentor after the color augmentations
+        norm_params = {"use": False}
+
+    weights, repeat_factors = [], []
     for key in data_cfg:
+        weights.append(data_cfg[key].get("SAMPLING_WEIGHT", None))
+        repeat_factors.append(data_cfg[key].get("REPEAT_FACTOR", None))
+
         data_cfg[key].INIT_SEED = cfg.INIT_SEED
-        data_cfg[key].NORM_PARAMS = cfg.NORM_PARAMS
+        data_cfg[key].NORM_PARAMS = norm_params
         data_cfg[key].APPEND_VALID_MASK = cfg.APPEND_VALID_MASK
 
-        dataset = DATASET_REGISTRY.get(key)(data_cfg[key])
+        if data_cfg[key].get("SHARD_DIR", None) is not None:
+            # Read the dataset from shards written by ezflow.data.write_flow_shards
+            dataset = DATASET_REGISTRY.get("ShardedFlowDataset")(data_cfg[key])
+        elif data_cfg[key].get("TAR_DIR", None) is not None:
+            # Read the dataset sequentially from tar shards written by ezflow.data.write_tar_shards
+            dataset = DATASET_REGISTRY.get("TarFlowDataset")(data_cfg[key])
+        else:
+            dataset = DATASET_REGISTRY.get(key)(data_cfg[key])
+
         dataloader_creator.add_dataset(dataset)
 
+    if any(w is not None for w in weights):
+        assert all(
+            w is not None for w in weights
+        ), "SAMPLING_WEIGHT must be set for every dataset"
+        assert all(
+            r is None for r in repeat_factors
+        ), "Only one of SAMPLING_WEIGHT and REPEAT_FACTOR can be used"
+        dataloader_creator.set_mixture(
+            weights=weights, num_samples=cfg.get("MIXTURE_NUM_SAMPLES", None)
+        )
+
+    elif any(r is not None for r in repeat_factors):
+        dataloader_creator.set_mixture(
+            repeat_factors=[1.0 if r is None else r for r in repeat_factors],
+            num_samples=cfg.get("MIXTURE_NUM_SAMPLES", None),
+        )
+
     return dataloader_creator
 
 
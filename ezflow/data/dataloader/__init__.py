@@ -1,2 +1,5 @@
+from .bucket_sampler import BucketBatchSampler, get_image_sizes
 from .dataloader_creator import DataloaderCreator
 from .device_dataloader import DeviceDataLoader
+from .mixture_sampler import MixtureSampler
+from .resumable_sampler import ResumableSampler, WorkerSeeder
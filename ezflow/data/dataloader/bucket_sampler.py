@@ -0,0 +1,123 @@
+import math
+
+import torch
+from torch.utils.data import ConcatDataset, Sampler
+
+
+def get_image_sizes(dataset):
+    """
+    Returns the image size of every sample of a dataset or of a concatenation of datasets,
+    without decoding the images.
+
+    Parameters
+    ----------
+    dataset : BaseDataset or torch.utils.data.ConcatDataset
+        The dataset
+
+    Returns
+    -------
+    :obj:`list` of :obj:`tuple`
+        The (height, width) of the images of every sample
+    """
+    if isinstance(dataset, ConcatDataset):
+        return [size for d in dataset.datasets for size in get_image_sizes(d)]
+
+    return [dataset.get_image_size(index) for index in range(len(dataset))]
+
+
+class BucketBatchSampler(Sampler):
+    """
+    A batch sampler grouping the samples of a dataset by image size, so that datasets with
+    images of different sizes, such as KITTI, can be evaluated with large batches without
+    cropping the images to a common size. Every batch holds samples of a single size.
+
+    Without shuffling, the batches follow the order of the dataset within every size and the
+    sizes follow the order in which they first appear in the dataset.
+
+    The batches are shared between distributed processes, each process keeps every
+    num_replicas-th batch, so that the processes may receive one batch more than the others.
+
+    Parameters
+    ----------
+    sizes : :obj:`list` of :obj:`tuple`
+        The (height, width) of the images of every sample, see get_image_sizes
+    batch_size : int
+        Number of samples per batch
+    shuffle : bool, default : False
+        If True, the samples of every size and the batches are shuffled at every epoch
+    drop_last : bool, default : False
+        If True, the last incomplete batch of every size is dropped
+    num_replicas : int, default : 1
+        Number of distributed processes
+    rank : int, default : 0
+        Rank of the current process
+    seed : int, default : 0
+        Random seed shared by the distributed processes
+    """
+
+    def __init__(
+        self,
+        sizes,
+        batch_size,
+        shuffle=False,
+        drop_last=False,
+        num_replicas=1,
+        rank=0,
+        seed=0,
+    ):
+        assert batch_size > 0, "batch_size must be positive"
+
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+
+        self.buckets = {}
+        for index, size in enumerate(sizes):
+            self.buckets.setdefault(tuple(size), []).append(index)
+
+    def set_epoch(self, epoch):
+        """
+        Sets the epoch of the sampler, which determines the order of the batches if shuffle is True.
+
+        Parameters
+        ----------
+        epoch : int
+            The epoch number
+        """
+        self.epoch = epoch
+
+    def _batches(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+
+        batches = []
+        for indices in self.buckets.values():
+            if self.shuffle:
+                order = torch.randperm(len(indices), generator=generator).tolist()
+                indices = [indices[i] for i in order]
+
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start : start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+
+        if self.shuffle:
+            order = torch.randperm(len(batches), generator=generator).tolist()
+            batches = [batches[i] for i in order]
+
+        return batches[self.rank :: self.num_replicas]
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self):
+        round_fn = math.floor if self.drop_last else math.ceil
+        n_batches = sum(
+            round_fn(len(indices) / self.batch_size)
+            for indices in self.buckets.values()
+        )
+        return len(range(self.rank, n_batches, self.num_replicas))
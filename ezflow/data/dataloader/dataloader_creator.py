@@ -1,7 +1,31 @@
-from torch.utils.data.dataloader import DataLoader
-from torch.utils.data.distributed import DistributedSampler
+import torch
+import torch.distributed as dist
+from torch.utils.data import ChainDataset, ConcatDataset, IterableDataset
+from torch.utils.data.dataloader import DataLoader, default_collate
 
 from ..dataset import *
+from .bucket_sampler import BucketBatchSampler, get_image_sizes
+from .mixture_sampler import MixtureSampler
+from .resumable_sampler import ResumableSampler, WorkerSeeder
+
+
+class BatchAugmentCollate:
+    """
+    Collate function applying a batch augmentor to the collated samples
+    in the DataLoader worker processes.
+
+    Parameters
+    ----------
+    batch_augmentor : ezflow.functional.BatchFlowAugmentor
+        The batch augmentor
+    """
+
+    def __init__(self, batch_augmentor):
+        self.batch_augmentor = batch_augmentor
+
+    def __call__(self, batch):
+        inp, target = default_collate(batch)
+        return self.batch_augmentor.augment_batch(inp, target)
 
 
 class DataloaderCreator:
@@ -29,9 +53,22 @@ class DataloaderCreator:
     is_prediction : bool, default : False
         If True, only image data are loaded for prediction otherwise both images and flow data are loaded
     distributed : bool, default : False
-        If True, initializes DistributedSampler for Distributed Training
+        If True, the data is split between the processes of Distributed Training
     world_size : int, default : None
         The total number of GPU devices per node for Distributed Training
+    uint8_images : bool, default : False
+        If True, the datasets return images as uint8 tensors without normalization,
+        which reduces the size of the image batches by 4x. The normalization of the datasets
+        is then available as the normalize attribute after get_dataloader is called,
+        and is applied on the device by the trainer.
+    stream_frames : bool, default : False
+        If True, the datasets are streamed scene by scene with an ezflow.data.FrameStreamDataset,
+        which decodes the frames shared by consecutive pairs once. The samples are not shuffled,
+        which suits evaluation and sequential consumption.
+    bucket_by_size : bool, default : False
+        If True, the samples are batched with an ezflow.data.BucketBatchSampler, every batch
+        holds images of a single size so that datasets with images of different sizes
+        can be evaluated with batches of more than one sample without cropping.
     """
 
     def __init__(
@@ -46,6 +83,9 @@ class DataloaderCreator:
         is_prediction=False,
         distributed=False,
         world_size=1,
+        uint8_images=False,
+        stream_frames=False,
+        bucket_by_size=False,
     ):
         self.dataset_list = []
         self.batch_size = batch_size
@@ -56,10 +96,19 @@ class DataloaderCreator:
         self.init_seed = init_seed
         self.append_valid_mask = append_valid_mask
         self.is_prediction = is_prediction
+        self.uint8_images = uint8_images
+        self.normalize = None
+        self.stream_frames = stream_frames
+        self.bucket_by_size = bucket_by_size
 
         self.distributed = False
         self.world_size = 1
 
+        self.batch_augmentor = None
+        self.batch_augment_on_device = False
+
+        self.mixture = None
+
         if distributed:
             assert (
                 world_size > 1
@@ -389,6 +438,59 @@ class DataloaderCreator:
             )
         )
 
+    def add_ShardedFlowDataset(self, shard_dir, augment=False, **kwargs):
+        """
+        Adds a dataset packed into binary shards to the DataloaderCreator object.
+
+        Parameters
+        ----------
+        shard_dir : str
+            path of the directory containing the shards written by ezflow.data.write_flow_shards
+        augment : bool, default : True
+            If True, applies data augmentation
+        **kwargs
+            Arbitrary keyword arguments for augmentation
+            specifying crop_size and the probability of
+            color, eraser and spatial transformation
+        """
+        self.dataset_list.append(
+            ShardedFlowDataset(
+                shard_dir,
+                init_seed=self.init_seed,
+                is_prediction=self.is_prediction,
+                append_valid_mask=self.append_valid_mask,
+                augment=augment,
+                **kwargs,
+            )
+        )
+
+    def add_TarFlowDataset(self, tar_dir, augment=False, **kwargs):
+        """
+        Adds a dataset packed into tar shards to the DataloaderCreator object.
+        The shards are read sequentially, an iterable DataLoader is returned for such datasets.
+
+        Parameters
+        ----------
+        tar_dir : str
+            path of the directory containing the tar shards written by ezflow.data.write_tar_shards
+        augment : bool, default : True
+            If True, applies data augmentation
+        **kwargs
+            Arbitrary keyword arguments for augmentation
+            specifying crop_size and the probability of
+            color, eraser and spatial transformation
+        """
+        self.dataset_list.append(
+            TarFlowDataset(
+                tar_dir,
+                init_seed=self.init_seed,
+                is_prediction=self.is_prediction,
+                append_valid_mask=self.append_valid_mask,
+                augment=augment,
+                **kwargs,
+            )
+        )
+
     def add_dataset(self, dataset):
         """
         Add an optical flow dataset to the DataloaderCreator object.
@@ -403,6 +505,42 @@ class DataloaderCreator:
         ), "Invalid dataset type."
         self.dataset_list.append(dataset)
 
+    def set_batch_augmentor(self, batch_augmentor, on_device=False):
+        """
+        Sets a batch augmentor applied to the collated batches of the data loader.
+
+        Parameters
+        ----------
+        batch_augmentor : ezflow.functional.BatchFlowAugmentor
+            The batch augmentor
+        on_device : bool, default : False
+            If True, the trainer applies the augmentations on the training device,
+            otherwise they are applied on the CPU by the data loader after collation
+        """
+        self.batch_augmentor = batch_augmentor
+        self.batch_augment_on_device = on_device
+
+    def set_mixture(self, weights=None, repeat_factors=None, num_samples=None):
+        """
+        Samples the added datasets with an ezflow.data.MixtureSampler instead of
+        concatenating them, so that datasets do not need to be multiplied to be mixed.
+
+        Parameters
+        ----------
+        weights : :obj:`list` of :obj:`float`, optional
+            The sampling weights of the datasets, in the order in which they were added
+        repeat_factors : :obj:`list` of :obj:`float`, optional
+            The repeat factors of the datasets, in the order in which they were added
+        num_samples : int, optional
+            The number of samples of an epoch, by default the sum of the dataset sizes
+            multiplied by the repeat factors
+        """
+        self.mixture = {
+            "weights": weights,
+            "repeat_factors": repeat_factors,
+            "num_samples": num_samples,
+        }
+
     def get_dataloader(self, rank=0):
         """
         Gets the Dataloader for the added datasets.
@@ -419,19 +557,49 @@ class DataloaderCreator:
         """
         assert len(self.dataset_list) != 0, "No datasets were added"
 
+        if self.distributed and dist.is_available() and dist.is_initialized():
+            self._index_files_on_rank_zero_first(rank)
+
+        if self.uint8_images:
+            self.normalize = self.dataset_list[0].normalize
+            for dataset in self.dataset_list:
+                assert (
+                    dataset.normalize.use == self.normalize.use
+                    and list(dataset.normalize.mean) == list(self.normalize.mean)
+                    and list(dataset.normalize.std) == list(self.normalize.std)
+                ), "Datasets must use the same normalization to return uint8 images"
+                dataset.uint8_images = True
+
+        collate_fn = None
+        if self.batch_augmentor is not None and not self.batch_augment_on_device:
+            collate_fn = BatchAugmentCollate(self.batch_augmentor)
+
+        if self.stream_frames:
+            return self._get_stream_dataloader(rank, collate_fn)
+
+        if any(isinstance(d, IterableDataset) for d in self.dataset_list):
+            return self._get_iterable_dataloader(rank, collate_fn)
+
+        if self.mixture is not None:
+            return self._get_mixture_dataloader(rank, collate_fn)
+
         dataset = self.dataset_list[0]
 
         if len(self.dataset_list) > 1:
             for i in range(len(self.dataset_list) - 1):
                 dataset += self.dataset_list[i + 1]
 
+        if self.bucket_by_size:
+            return self._get_bucket_dataloader(dataset, rank, collate_fn)
+
         if self.distributed:
 
-            sampler = DistributedSampler(
+            sampler = ResumableSampler(
                 dataset,
                 rank=rank,
                 num_replicas=self.world_size,
                 shuffle=self.shuffle,
+                seed=self._get_sampler_seed(),
                 drop_last=self.drop_last,
             )
             data_loader = DataLoader(
@@ -440,16 +608,23 @@ class DataloaderCreator:
                 pin_memory=self.pin_memory,
                 num_workers=self.num_workers,
                 sampler=sampler,
+                collate_fn=collate_fn,
+                worker_init_fn=WorkerSeeder(sampler),
             )
 
         else:
+            sampler = ResumableSampler(
+                dataset, shuffle=self.shuffle, seed=self._get_sampler_seed()
+            )
             data_loader = DataLoader(
                 dataset,
                 batch_size=self.batch_size,
                 pin_memory=self.pin_memory,
-                shuffle=self.shuffle,
+                sampler=sampler,
                 num_workers=self.num_workers,
                 drop_last=self.drop_last,
+                collate_fn=collate_fn,
+                worker_init_fn=WorkerSeeder(sampler),
             )
 
         total_samples = len(data_loader) * (self.batch_size // self.world_size)
@@ -458,3 +633,170 @@ class DataloaderCreator:
         )
 
         return data_loader
+
+    def _get_sampler_seed(self):
+        """
+        Returns the seed of the samplers, which also seeds the DataLoader workers through
+        WorkerSeeder. It follows the global torch seed of the run, as the order of a shuffled
+        DataLoader does, and is restored from the state of the sampler on resume.
+        With distributed training, the seed of rank 0 is used by all the ranks.
+
+        Returns
+        -------
+        int
+            The seed of the samplers
+        """
+        seed = torch.initial_seed() % 2**32
+
+        if self.distributed and dist.is_available() and dist.is_initialized():
+            seeds = [seed]
+            dist.broadcast_object_list(seeds, src=0)
+            seed = seeds[0]
+
+        return seed
+
+    def _index_files_on_rank_zero_first(self, rank):
+        """
+        Builds the file lists of the datasets on rank 0 before the other ranks, so that
+        the file manifests enabled by io_params["manifest_dir"] are built only once and
+        read from disk by the other ranks instead of every rank scanning the directories.
+
+        Parameters
+        ----------
+        rank : int
+            The process id within a group for Distributed Training
+        """
+        if rank != 0:
+            # Wait for rank 0 to build the file manifests
+            dist.barrier()
+
+        for dataset in self.dataset_list:
+            if rank != 0:
+                dataset.rebuild_manifest = False
+            dataset.index_files()
+
+        if rank == 0:
+            dist.barrier()
+
+    def _get_mixture_dataloader(self, rank, collate_fn):
+        dataset = ConcatDataset(self.dataset_list)
+
+        sampler = MixtureSampler(
+            [len(d) for d in self.dataset_list],
+            num_replicas=self.world_size,
+            rank=rank,
+            seed=self._get_sampler_seed(),
+            **self.mixture,
+        )
+        data_loader = DataLoader(
+            dataset,
+            batch_size=self.batch_size // self.world_size,
+            pin_memory=self.pin_memory,
+            num_workers=self.num_workers,
+            sampler=sampler,
+            drop_last=self.drop_last,
+            collate_fn=collate_fn,
+            worker_init_fn=WorkerSeeder(sampler),
+        )
+
+        print(f"Mixture of {len(self.dataset_list)} datasets in device: {rank}")
+        for d, rate in zip(self.dataset_list, sampler.sampling_rates()):
+            print(
+                f"  {d.__class__.__name__}: {len(d)} image pairs, "
+                f"{100 * rate['fraction']:.1f}% of the samples, "
+                f"{rate['passes_per_epoch']:.2f} passes per epoch"
+            )
+
+        total_samples = len(data_loader) * (self.batch_size // self.world_size)
+        print(
+            f"Total image pairs loaded: {total_samples}/{sampler.total_size} in device: {rank}"
+        )
+
+        return data_loader
+
+    def _get_bucket_dataloader(self, dataset, rank, collate_fn):
+        sizes = get_image_sizes(dataset)
+        batch_sampler = BucketBatchSampler(
+            sizes,
+            batch_size=self.batch_size // self.world_size,
+            shuffle=self.shuffle,
+            drop_last=self.drop_last,
+            num_replicas=self.world_size,
+            rank=rank,
+        )
+        data_loader = DataLoader(
+            dataset,
+            batch_sampler=batch_sampler,
+            pin_memory=self.pin_memory,
+            num_workers=self.num_workers,
+            collate_fn=collate_fn,
+        )
+
+        print(
+            f"Batching {len(dataset)} image pairs of {len(batch_sampler.buckets)} "
+            f"image sizes into {len(data_loader)} batches in device: {rank}"
+        )
+
+        return data_loader
+
+    def _get_stream_dataloader(self, rank, collate_fn):
+        assert self.mixture is None, "Streamed datasets cannot be mixed"
+
+        streams = []
+        for d in self.dataset_list:
+            scene_offset = sum(len(s.scenes) for s in streams)
+            streams.append(
+                FrameStreamDataset(
+                    d,
+                    num_replicas=self.world_size,
+                    rank=rank,
+                    scene_offset=scene_offset,
+                )
+            )
+
+        dataset = ChainDataset(streams)
+        data_loader = DataLoader(
+            dataset,
+            batch_size=self.batch_size // self.world_size,
+            pin_memory=self.pin_memory,
+            num_workers=self.num_workers,
+            drop_last=self.drop_last,
+            collate_fn=collate_fn,
+        )
+
+        n_scenes = sum(len(d.scenes) for d in dataset.datasets)
+        print(
+            f"Streaming {len(dataset)} image pairs of {n_scenes} scenes in device: {rank}"
+        )
+
+        return data_loader
+
+    def _get_iterable_dataloader(self, rank, collate_fn):
+        assert self.mixture is None, "Iterable datasets cannot be mixed"
+        assert all(
+            isinstance(d, IterableDataset) for d in self.dataset_list
+        ), "Iterable datasets cannot be combined with map-style datasets"
+
+        for d in self.dataset_list:
+            # The datasets split their shards between the processes themselves
+            d.num_replicas = self.world_size
+            d.rank = rank
+            d.shuffle = d.shuffle and self.shuffle
+
+        dataset = ChainDataset(self.dataset_list)
+        data_loader = DataLoader(
+            dataset,
+            batch_size=self.batch_size // self.world_size,
+            pin_memory=self.pin_memory,
+            num_workers=self.num_workers,
+            drop_last=self.drop_last,
+            collate_fn=collate_fn,
+        )
+
+        print(
+            f"Total image pairs loaded: {len(dataset)} from "
+            f"{sum(len(d.shard_files) for d in self.dataset_list)} shards "
+            f"in device: {rank}"
+        )
+
+        return data_loader
@@ -1,34 +1,153 @@
-def to_device(data, device):
+import collections
+
+import torch
+
+
+def to_device(data, device, non_blocking=False):
+    """
+    Moves the tensors of a nested structure of lists, tuples and dicts to a device.
+
+    Parameters
+    ----------
+    data : torch.Tensor, list, tuple or dict
+        The data to move
+    device : torch.device
+        The compute device
+    non_blocking : bool, default : False
+        If True, the copies from pinned memory are asynchronous with respect to the host
+
+    Returns
+    -------
+    torch.Tensor, list, tuple or dict
+        The data on the device, with the same structure
+    """
+    if isinstance(data, list):
+        return [to_device(x, device, non_blocking) for x in data]
+
+    if isinstance(data, tuple):
+        return tuple(to_device(x, device, non_blocking) for x in data)
+
+    if isinstance(data, dict):
+        return {key: to_device(val, device, non_blocking) for key, val in data.items()}
+
+    if isinstance(data, torch.Tensor):
+        return data.to(device, non_blocking=non_blocking)
+
+    return data
+
+
+def pin_memory(data):
+    """
+    Copies the tensors of a nested structure of lists, tuples and dicts
+    to pinned memory, tensors which are already pinned are not copied.
+    """
+    if isinstance(data, list):
+        return [pin_memory(x) for x in data]
+
+    if isinstance(data, tuple):
+        return tuple(pin_memory(x) for x in data)
+
+    if isinstance(data, dict):
+        return {key: pin_memory(val) for key, val in data.items()}
+
+    if isinstance(data, torch.Tensor) and not data.is_pinned():
+        return data.pin_memory()
+
+    return data
+
+
+def _record_stream(data, stream):
     if isinstance(data, (list, tuple)):
-        return [to_device(x, device) for x in data]
+        for x in data:
+            _record_stream(x, stream)
+
+    elif isinstance(data, dict):
+        for val in data.values():
+            _record_stream(val, stream)
 
-    return data.to(device)
+    elif isinstance(data, torch.Tensor):
+        data.record_stream(stream)
 
 
 class DeviceDataLoader:
     """
     A data loader wrapper to move data to a specific compute device.
 
+    On CUDA devices, batches are prefetched: the next batches are copied to the device
+    from pinned memory on a side stream while the current batch is being processed,
+    so that host to device copies overlap compute. On other devices the batches are
+    moved when they are requested.
+
+    The attributes of the wrapped data loader, such as dataset and sampler, are
+    accessible from the wrapper.
+
     Parameters
     ----------
     data_loader : DataLoader
         The PyTorch DataLoader from torch.utils.data.dataloader
-    device : torch.device
-        The compute device
+    device : torch.device or None
+        The compute device, if None the batches are yielded unchanged
+    prefetch : int, default : 2
+        The number of batches copied to the device ahead of the batch being processed
     """
 
-    def __init__(self, data_loader, device):
+    def __init__(self, data_loader, device, prefetch=2):
 
         self.data_loader = data_loader
-        self.device = device
+        self.device = torch.device(device) if device is not None else None
+        self.prefetch = prefetch
+
+    def __getattr__(self, name):
+        if name == "data_loader":
+            raise AttributeError(name)
+
+        return getattr(self.data_loader, name)
 
     def __iter__(self):
         """
         Yield a batch of data after moving it to a device.
 
         """
-        for batch in self.data_loader:
-            yield to_device(batch, self.device)
+        if self.device is None:
+            yield from self.data_loader
+            return
+
+        if self.device.type != "cuda" or self.prefetch < 1:
+            for batch in self.data_loader:
+                yield to_device(batch, self.device)
+            return
+
+        stream = torch.cuda.Stream(self.device)
+        batches = collections.deque()
+        data_iter = iter(self.data_loader)
+
+        def preload():
+            try:
+                batch = next(data_iter)
+            except StopIteration:
+                return
+
+            batch = pin_memory(batch)
+            with torch.cuda.stream(stream):
+                batch = to_device(batch, self.device, non_blocking=True)
+
+            copied = torch.cuda.Event()
+            copied.record(stream)
+            batches.append((batch, copied))
+
+        for _ in range(self.prefetch):
+            preload()
+
+        while batches:
+            batch, copied = batches.popleft()
+
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(copied)
+            # The memory of the batch was allocated on the side stream
+            _record_stream(batch, current_stream)
+
+            preload()
+            yield batch
 
     def __len__(self):
         """
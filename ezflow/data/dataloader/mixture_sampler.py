@@ -0,0 +1,170 @@
+import torch
+from torch.utils.data import Sampler
+
+from .resumable_sampler import ResumableMixin
+
+
+class MixtureSampler(ResumableMixin, Sampler):
+    """
+    A sampler drawing the indices of a concatenation of datasets according to per-dataset
+    sampling weights, without materializing repeated index or file lists.
+
+    Every index is drawn by first picking a dataset with probability proportional to its weight,
+    then taking the next index of a random permutation of that dataset, which is reshuffled
+    once it is exhausted. Repeat factors are converted to weights proportional to the repeat
+    factor times the dataset size, so that a repeat factor of k samples a dataset as often as
+    k copies of it would in expectation.
+
+    The indices are shared between distributed processes like in
+    torch.utils.data.distributed.DistributedSampler: all the processes draw the same sequence
+    for a given seed and epoch and each process keeps every num_replicas-th index.
+
+    Like ResumableSampler, the sampler can resume an epoch from the state returned by
+    state_dict and moves on to the next epoch once an epoch is exhausted.
+
+    Parameters
+    ----------
+    dataset_sizes : :obj:`list` of :obj:`int`
+        The sizes of the concatenated datasets
+    weights : :obj:`list` of :obj:`float`, optional
+        The sampling weights of the datasets
+    repeat_factors : :obj:`list` of :obj:`float`, optional
+        The repeat factors of the datasets, used if weights is None.
+        If both are None, every dataset has a repeat factor of 1.
+    num_samples : int, optional
+        The number of samples of an epoch over all processes, by default the sum of the
+        dataset sizes multiplied by the repeat factors, or the sum of the dataset sizes
+    num_replicas : int, default : 1
+        Number of distributed processes
+    rank : int, default : 0
+        Rank of the current process
+    seed : int, default : 0
+        Random seed shared by the distributed processes
+    """
+
+    def __init__(
+        self,
+        dataset_sizes,
+        weights=None,
+        repeat_factors=None,
+        num_samples=None,
+        num_replicas=1,
+        rank=0,
+        seed=0,
+    ):
+        assert len(dataset_sizes) > 0, "No datasets to sample from"
+        assert all(size > 0 for size in dataset_sizes), "Datasets must not be empty"
+        assert (
+            weights is None or repeat_factors is None
+        ), "Only one of weights and repeat_factors can be set"
+
+        self.dataset_sizes = [int(size) for size in dataset_sizes]
+
+        if weights is None:
+            if repeat_factors is None:
+                repeat_factors = [1.0] * len(dataset_sizes)
+            assert len(repeat_factors) == len(dataset_sizes)
+            weights = [r * size for r, size in zip(repeat_factors, self.dataset_sizes)]
+
+            if num_samples is None:
+                num_samples = round(sum(weights))
+
+        assert len(weights) == len(dataset_sizes)
+        assert all(w >= 0 for w in weights) and sum(weights) > 0
+
+        self.weights = torch.tensor(weights, dtype=torch.float64) / sum(weights)
+
+        if num_samples is None:
+            num_samples = sum(self.dataset_sizes)
+
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self._init_position()
+
+        self.total_size = int(num_samples) // num_replicas * num_replicas
+        self.num_samples = self.total_size // num_replicas
+
+        self.offsets = [0]
+        for size in self.dataset_sizes[:-1]:
+            self.offsets.append(self.offsets[-1] + size)
+
+        # Number of indices drawn at once, a multiple of num_replicas
+        self.chunk_size = 4096 * num_replicas
+
+    def __iter__(self):
+        self._start_epoch()
+
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+
+        permutations = [torch.empty(0, dtype=torch.int64)] * len(self.dataset_sizes)
+
+        def draw(dataset_idx, count):
+            # Takes the next count indices of the permutation of a dataset
+            drawn = []
+            while count > 0:
+                if len(permutations[dataset_idx]) == 0:
+                    permutations[dataset_idx] = torch.randperm(
+                        self.dataset_sizes[dataset_idx], generator=generator
+                    )
+
+                taken = permutations[dataset_idx][:count]
+                permutations[dataset_idx] = permutations[dataset_idx][count:]
+                drawn.append(taken)
+                count -= len(taken)
+
+            return torch.cat(drawn) + self.offsets[dataset_idx]
+
+        # Indices of the current process to skip when resuming an epoch
+        skip = self.start_index
+
+        for start in range(0, self.total_size, self.chunk_size):
+            chunk_size = min(self.chunk_size, self.total_size - start)
+            choices = torch.multinomial(
+                self.weights, chunk_size, replacement=True, generator=generator
+            )
+
+            indices = torch.empty(chunk_size, dtype=torch.int64)
+            for dataset_idx in range(len(self.dataset_sizes)):
+                mask = choices == dataset_idx
+                count = int(mask.sum())
+                if count > 0:
+                    indices[mask] = draw(dataset_idx, count)
+
+            indices = indices[self.rank :: self.num_replicas]
+            if skip >= len(indices):
+                skip -= len(indices)
+                continue
+
+            yield from indices[skip:].tolist()
+            skip = 0
+
+        self._end_epoch()
+
+    def __len__(self):
+        return max(self.num_samples - self.start_index, 0)
+
+    def sampling_rates(self):
+        """
+        Returns the effective sampling rate of every dataset.
+
+        Returns
+        -------
+        :obj:`list` of :obj:`dict`
+            For every dataset, the fraction of the sampled indices drawn from it,
+            the expected number of samples drawn from it per epoch over all processes
+            and the expected number of passes over it per epoch
+        """
+        rates = []
+        for weight, size in zip(self.weights.tolist(), self.dataset_sizes):
+            samples = weight * self.total_size
+            rates.append(
+                {
+                    "fraction": weight,
+                    "samples_per_epoch": samples,
+                    "passes_per_epoch": samples / size,
+                }
+            )
+
+        return rates
@@ -0,0 +1,158 @@
+import hashlib
+import random
+
+import numpy as np
+import torch
+from torch.utils.data.distributed import DistributedSampler
+
+
+class ResumableMixin:
+    """
+    Epoch and position bookkeeping shared by the resumable samplers.
+
+    The samplers yield the indices of the current epoch from start_index on and move on to
+    the next epoch once an epoch is exhausted. The position of the epoch which is being iterated
+    is kept separately, since a DataLoader exhausts its sampler before the last batches of the
+    epoch are consumed.
+    """
+
+    def _init_position(self):
+        self.epoch = 0
+        self.start_index = 0
+        self._position = (0, 0)
+
+    def _start_epoch(self):
+        self._position = (self.epoch, self.start_index)
+
+    def _end_epoch(self):
+        self.epoch += 1
+        self.start_index = 0
+
+    def set_epoch(self, epoch):
+        """
+        Sets the epoch of the sampler and starts it from the beginning of the epoch.
+
+        Parameters
+        ----------
+        epoch : int
+            The epoch number
+        """
+        self.epoch = epoch
+        self.start_index = 0
+        self._position = (epoch, 0)
+
+    def state_dict(self, consumed=0):
+        """
+        Returns the state of the sampler.
+
+        Parameters
+        ----------
+        consumed : int, default : 0
+            The number of indices of the current epoch consumed since the sampler was last iterated
+
+        Returns
+        -------
+        dict
+            The seed, the epoch and the position in the epoch
+        """
+        epoch, start_index = self._position
+        return {
+            "seed": self.seed,
+            "epoch": epoch,
+            "start_index": start_index + consumed,
+        }
+
+    def load_state_dict(self, state_dict):
+        """
+        Restores the state of the sampler returned by state_dict.
+
+        Parameters
+        ----------
+        state_dict : dict
+            The state of the sampler
+        """
+        self.seed = state_dict["seed"]
+        self.epoch = state_dict["epoch"]
+        self.start_index = state_dict["start_index"]
+        self._position = (self.epoch, self.start_index)
+
+
+class ResumableSampler(ResumableMixin, DistributedSampler):
+    """
+    A DistributedSampler which can resume an epoch from any position.
+    It is also used without distributed training, with num_replicas=1.
+
+    The order of an epoch is determined by the seed and the epoch number. The state returned by
+    state_dict records how many indices of the current epoch were consumed, so that after
+    load_state_dict the sampler continues with the next index without yielding the consumed ones.
+    Once an epoch is exhausted the sampler moves on to the next epoch, set_epoch can be used
+    to set the epoch explicitly.
+
+    Parameters
+    ----------
+    dataset : torch.utils.data.Dataset
+        Dataset used for sampling
+    num_replicas : int, default : 1
+        Number of distributed processes
+    rank : int, default : 0
+        Rank of the current process
+    shuffle : bool, default : True
+        If True, the indices are shuffled
+    seed : int, default : 0
+        Random seed shared by the distributed processes
+    drop_last : bool, default : False
+        If True, the tail of the data is dropped to make it evenly divisible across processes
+    """
+
+    def __init__(
+        self, dataset, num_replicas=1, rank=0, shuffle=True, seed=0, drop_last=False
+    ):
+        super(ResumableSampler, self).__init__(
+            dataset,
+            num_replicas=num_replicas,
+            rank=rank,
+            shuffle=shuffle,
+            seed=seed,
+            drop_last=drop_last,
+        )
+        self._init_position()
+
+    def __iter__(self):
+        self._start_epoch()
+
+        indices = list(super(ResumableSampler, self).__iter__())
+        yield from indices[self.start_index :]
+
+        self._end_epoch()
+
+    def __len__(self):
+        return max(self.num_samples - self.start_index, 0)
+
+
+class WorkerSeeder:
+    """
+    A worker_init_fn seeding the torch, numpy and random generators of every DataLoader worker
+    from the seed, epoch and position of a resumable sampler, so that the random augmentations
+    of an epoch are reproducible and a resumed epoch does not reuse the seeds of its beginning.
+
+    Parameters
+    ----------
+    sampler : ResumableSampler or MixtureSampler
+        The sampler of the DataLoader
+    """
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+    def __call__(self, worker_id):
+        key = (self.sampler.seed, self.sampler.epoch, self.sampler.start_index)
+        if hasattr(self.sampler, "rank"):
+            key += (self.sampler.rank,)
+        key += (worker_id,)
+
+        digest = hashlib.blake2b(str(key).encode(), digest_size=4).digest()
+        seed = int.from_bytes(digest, "little")
+
+        torch.manual_seed(seed)
+        np.random.seed(seed)
+        random.seed(seed)
@@ -3,8 +3,12 @@ from .base_dataset import BaseDataset
 from .driving import Driving
 from .flying_chairs import FlyingChairs
 from .flying_things3d import FlyingThings3D, FlyingThings3DSubset
+from .frame_stream import FrameStreamDataset, split_scenes
 from .hd1k import HD1K
 from .kitti import Kitti
 from .kubric import Kubric
 from .monkaa import Monkaa
 from .mpi_sintel import MPISintel
+from .sample_cache import SharedSampleCache, sample_cache_stats
+from .sharded import ShardedFlowDataset, write_flow_shards
+from .tar_dataset import TarFlowDataset, write_tar_shards
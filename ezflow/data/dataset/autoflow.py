@@ -36,6 +36,8 @@ class AutoFlow(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -59,6 +61,7 @@ class AutoFlow(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(AutoFlow, self).__init__(
             init_seed=init_seed,
@@ -72,6 +75,7 @@ class AutoFlow(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
         self.is_prediction = is_prediction
@@ -80,6 +84,13 @@ class AutoFlow(BaseDataset):
         if augment:
             self.augmentor = FlowAugmentor(crop_size=crop_size, **aug_params)
 
+        self._defer_index(AutoFlow._scan_files, root_dir=root_dir)
+
+    @staticmethod
+    def _scan_files(root_dir):
+        image_list = []
+        flow_list = []
+
         scenes = [
             "static_40k_png_1_of_4",
             "static_40k_png_2_of_4",
@@ -95,8 +106,10 @@ class AutoFlow(BaseDataset):
                 if len(images) == 2:
                     assert len(flows) == 1
                     for i in range(len(flows)):
-                        self.flow_list += [flows[i]]
-                        self.image_list += [[images[i], images[i + 1]]]
+                        flow_list += [flows[i]]
+                        image_list += [[images[i], images[i + 1]]]
+
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -112,4 +125,5 @@ class AutoFlow(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
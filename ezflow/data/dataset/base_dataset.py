@@ -4,14 +4,18 @@ import numpy as np
 import torch
 import torch.utils.data as data
 import torchvision.transforms as transforms
+from PIL import Image
 
 from ...functional import Normalize, crop
 from ...utils import (
-    flow_to_bilinear_interpolation_weights,
+    flow_to_bilinear_interpolation_indices,
     get_flow_offsets,
+    profile_stage,
     read_flow,
     read_image,
 )
+from .manifest import load_or_build_manifest
+from .sample_cache import SharedSampleCache
 
 
 class BaseDataset(data.Dataset):
@@ -40,6 +44,22 @@ class BaseDataset(data.Dataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files.
+        If io_params["mmap_flow"] is True, .flo and .pfm flow files are memory-mapped
+        so that cropping only reads the required part of the file.
+        If io_params["cache_size_mb"] is greater than 0, decoded samples are cached
+        before augmentation in a shared memory arena of that size which is visible to all
+        the DataLoader workers. io_params["cache_max_entries"] limits the number of cached samples.
+        If io_params["manifest_dir"] is set, datasets which scan their directories store the
+        file lists in a manifest in this directory and reuse it as long as the scanned
+        directories are unchanged. If io_params["rebuild_manifest"] is True, the manifest is rebuilt.
+        If io_params["uint8_images"] is True, images are returned as uint8 tensors without normalization
+        so that they are converted to float and normalized once on the device.
+        io_params["image_decoder"] selects the image decoder of ezflow.utils.IMAGE_DECODER_REGISTRY,
+        one of "pil" (default), "opencv" and "torchvision".
+        Datasets which scan their directories do so when their file lists are first accessed,
+        for example by __len__ or __getitem__, unless io_params["lazy_index"] is False.
     """
 
     def __init__(
@@ -68,6 +88,7 @@ class BaseDataset(data.Dataset):
             "search_radius": 4,
             "offset_bias": [0, 0],
         },
+        io_params={"mmap_flow": False},
     ):
 
         self.is_prediction = is_prediction
@@ -81,14 +102,47 @@ class BaseDataset(data.Dataset):
         self.augment = augment
         self.augmentor = None
 
+        self.lazy_index = io_params.get("lazy_index", True)
+        self._pending_index = None
+        self._repeats = 1
+
         self.flow_list = []
         self.image_list = []
         self.normalize = Normalize(**norm_params)
 
+        self.mmap_flow = io_params.get("mmap_flow", False)
+        self.manifest_dir = io_params.get("manifest_dir", None)
+        self.rebuild_manifest = io_params.get("rebuild_manifest", False)
+        self.uint8_images = io_params.get("uint8_images", False)
+        self.image_decoder = io_params.get("image_decoder", "pil")
+
+        self.sample_cache = None
+        if io_params.get("cache_size_mb", 0) > 0:
+            self.sample_cache = SharedSampleCache(
+                capacity_bytes=int(io_params["cache_size_mb"] * 1024**2),
+                max_entries=io_params.get("cache_max_entries", 16384),
+            )
+
         self.flow_offsets = None
         if flow_offset_params["use"]:
             self.flow_offsets = get_flow_offsets(**flow_offset_params)
 
+        self.profiler = None
+
+    def set_profiler(self, profiler):
+        """
+        Records the time and the bytes produced by the stages of the data pipeline
+        with a profiler, including every augmentation of the augmentor.
+
+        Parameters
+        ----------
+        profiler : ezflow.utils.StageProfiler or None
+            The profiler, None disables profiling
+        """
+        self.profiler = profiler
+        if self.augmentor is not None:
+            self.augmentor.profiler = profiler
+
     def __getitem__(self, index):
         """
         Returns the corresponding images and the flow between them.
@@ -103,33 +157,55 @@ class BaseDataset(data.Dataset):
         tuple
             A tuple consisting of ((img1, img2), dict)
 
-            img1 and img2 of shape 3 x H x W.
+            img1 and img2 of shape 3 x H x W, uint8 if io_params["uint8_images"] is True.
             dictionary containing flow of shape 2 x H x W, valid mask of shape 1 x H x W
+            and, if flow_offset_params["use"] is True, the indices and weights of the
+            non-zero bilinear interpolation weights of shape 4 x H/8 x W/8
         """
 
+        self._init_worker_seed()
+
+        with profile_stage(self.profiler, "sample") as stage:
+            sample = self._load_sample(index % len(self.image_list))
+            sample = self._process_sample(*sample)
+            stage.output(sample)
+
+        return sample
+
+    def _init_worker_seed(self):
+        """
+        Seeds the numpy and random generators of a DataLoader worker process
+        from its torch seed, once per worker unless init_seed is True.
+        """
         if not self.init_seed:
             worker_info = torch.utils.data.get_worker_info()
             if worker_info is not None:
-                torch.manual_seed(worker_info.id)
-                np.random.seed(worker_info.id)
-                random.seed(worker_info.id)
+                # The torch seed of the worker is set by the DataLoader or its worker_init_fn
+                seed = torch.initial_seed() % 2**32
+                np.random.seed(seed)
+                random.seed(seed)
                 self.init_seed = True
 
-        index = index % len(self.image_list)
-
-        img1 = read_image(self.image_list[index][0])
-        img2 = read_image(self.image_list[index][1])
-
-        img1 = np.array(img1).astype(np.uint8)
-        img2 = np.array(img2).astype(np.uint8)
+    def _process_sample(self, img1, img2, flow, valid):
+        """
+        Augments, crops and converts a decoded sample to tensors.
 
-        if len(img1.shape) == 2:  # grayscale images
-            img1 = np.tile(img1[..., None], (1, 1, 3))
-            img2 = np.tile(img2[..., None], (1, 1, 3))
-        else:
-            img1 = img1[..., :3]
-            img2 = img2[..., :3]
+        Parameters
+        ----------
+        img1 : numpy.ndarray
+            First image of shape H x W x 3
+        img2 : numpy.ndarray
+            Second image of shape H x W x 3
+        flow : numpy.ndarray
+            Flow of shape H x W x 2, None if is_prediction is True
+        valid : numpy.ndarray
+            Valid mask of shape H x W, or None
 
+        Returns
+        -------
+        tuple
+            The sample as returned by __getitem__
+        """
         if self.is_prediction:
             if self.crop:
                 img1, img2, _, _ = crop(
@@ -142,41 +218,40 @@ class BaseDataset(data.Dataset):
                     sparse_transform=False,
                 )
 
-            img1 = torch.from_numpy(img1).permute(2, 0, 1).float()
-            img2 = torch.from_numpy(img2).permute(2, 0, 1).float()
-
-            img1, img2 = self.normalize(img1, img2)
-            return img1, img2
-
-        flow, valid = read_flow(self.flow_list[index])
-        flow = np.array(flow).astype(np.float32)
+            return self._images_to_tensor(img1, img2)
 
         if self.augment is True and self.augmentor is not None:
-            img1, img2, flow, valid = self.augmentor(img1, img2, flow, valid)
+            with profile_stage(self.profiler, "augment"):
+                img1, img2, flow, valid = self.augmentor(img1, img2, flow, valid)
 
         if self.crop is True:
-            img1, img2, flow, valid = crop(
-                img1,
-                img2,
-                flow,
-                valid=valid,
-                crop_size=self.crop_size,
-                crop_type=self.crop_type,
-                sparse_transform=self.sparse_transform,
-            )
+            with profile_stage(self.profiler, "crop") as stage:
+                img1, img2, flow, valid = crop(
+                    img1,
+                    img2,
+                    flow,
+                    valid=valid,
+                    crop_size=self.crop_size,
+                    crop_type=self.crop_type,
+                    sparse_transform=self.sparse_transform,
+                )
+                stage.output(img1, img2, flow, valid)
 
         if self.flow_offsets is not None:
-            offset_labs = self._flow_to_bilinear_interpolation_weights(flow, valid)
-            offset_labs = torch.from_numpy(offset_labs).float()
-            offset_labs = offset_labs.view(
-                offset_labs.shape[0], offset_labs.shape[1], -1
-            ).permute(2, 0, 1)
-
-        img1 = torch.from_numpy(img1).permute(2, 0, 1).float()
-        img2 = torch.from_numpy(img2).permute(2, 0, 1).float()
-        flow = torch.from_numpy(flow).permute(2, 0, 1).float()
+            with profile_stage(self.profiler, "flow_offsets") as stage:
+                (
+                    offset_idxs,
+                    offset_weights,
+                ) = self._flow_to_bilinear_interpolation_weights(flow, valid)
+                offset_idxs = torch.from_numpy(offset_idxs).permute(2, 0, 1)
+                offset_weights = torch.from_numpy(offset_weights).permute(2, 0, 1)
+                stage.output(offset_idxs, offset_weights)
+
+        with profile_stage(self.profiler, "to_tensor") as stage:
+            img1, img2 = self._images_to_tensor(img1, img2)
+            flow = torch.from_numpy(np.ascontiguousarray(flow)).permute(2, 0, 1).float()
+            stage.output(img1, img2, flow)
 
-        img1, img2 = self.normalize(img1, img2)
         target = {}
         target["flow_gt"] = flow
 
@@ -191,10 +266,283 @@ class BaseDataset(data.Dataset):
             target["valid"] = valid
 
         if self.flow_offsets is not None:
-            target["offset_labs"] = offset_labs
+            target["offset_idxs"] = offset_idxs
+            target["offset_weights"] = offset_weights
 
         return (img1, img2), target
 
+    def _images_to_tensor(self, img1, img2):
+        """
+        Converts the images of shape H x W x 3 to tensors of shape 3 x H x W.
+        Images are normalized float tensors, or uint8 tensors if uint8_images is True
+        in which case augmented images are rounded to the nearest integer.
+
+        Parameters
+        ----------
+        img1 : numpy.ndarray
+            First image
+        img2 : numpy.ndarray
+            Second image
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of (img1, img2)
+        """
+        if self.uint8_images:
+            images = []
+            for img in [img1, img2]:
+                if img.dtype != np.uint8:
+                    img = np.clip(np.rint(img), 0, 255).astype(np.uint8)
+                img = torch.from_numpy(np.ascontiguousarray(img))
+                images.append(img.permute(2, 0, 1))
+
+            return images[0], images[1]
+
+        img1 = torch.from_numpy(np.ascontiguousarray(img1)).permute(2, 0, 1).float()
+        img2 = torch.from_numpy(np.ascontiguousarray(img2)).permute(2, 0, 1).float()
+
+        return self.normalize(img1, img2)
+
+    @property
+    def image_list(self):
+        """
+        The image file pairs of the dataset, indexed when first accessed.
+
+        """
+        if self._pending_index is not None:
+            self.index_files()
+        return self._image_list
+
+    @image_list.setter
+    def image_list(self, image_list):
+        if self._pending_index is not None:
+            self.index_files()
+        self._image_list = image_list
+
+    @property
+    def flow_list(self):
+        """
+        The flow files of the dataset, indexed when first accessed.
+
+        """
+        if self._pending_index is not None:
+            self.index_files()
+        return self._flow_list
+
+    @flow_list.setter
+    def flow_list(self, flow_list):
+        if self._pending_index is not None:
+            self.index_files()
+        self._flow_list = flow_list
+
+    def index_files(self):
+        """
+        Builds the file lists of the dataset if their construction was deferred,
+        does nothing otherwise.
+
+        """
+        if self._pending_index is None:
+            return
+
+        scan_fn, scan_params = self._pending_index
+        self._pending_index = None
+
+        image_list, flow_list = self._index_files(scan_fn, **scan_params)
+        self._image_list = self._repeats * image_list
+        self._flow_list = self._repeats * flow_list
+        self._repeats = 1
+
+    def _defer_index(self, scan_fn, **scan_params):
+        """
+        Defers the construction of the file lists of the dataset until they are first accessed,
+        so that datasets which are never iterated do not scan their directories.
+        The file lists are built immediately if io_params["lazy_index"] is False.
+
+        Parameters
+        ----------
+        scan_fn : callable
+            Function scanning the dataset directories, called with scan_params
+        **scan_params
+            The parameters of scan_fn, must include root_dir
+        """
+        self._pending_index = (scan_fn, scan_params)
+        if not self.lazy_index:
+            self.index_files()
+
+    def _index_files(self, scan_fn, **scan_params):
+        """
+        Returns the image and flow file lists of the dataset, read from a manifest
+        if io_params["manifest_dir"] is set, otherwise by scanning the dataset directories.
+
+        Parameters
+        ----------
+        scan_fn : callable
+            Function scanning the dataset directories, called with scan_params
+        **scan_params
+            The parameters of scan_fn, must include root_dir
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of (image_list, flow_list)
+        """
+        if self.manifest_dir is None:
+            return scan_fn(**scan_params)
+
+        return load_or_build_manifest(
+            self.manifest_dir, scan_fn, rebuild=self.rebuild_manifest, **scan_params
+        )
+
+    def _load_sample(self, index):
+        """
+        Returns the decoded images, flow and valid mask at the given index
+        before augmentation, from the sample cache if available.
+
+        Parameters
+        ----------
+        index : int
+            specify the index location of the sample
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of (img1, img2, flow, valid).
+            flow and valid are None if is_prediction is True.
+        """
+        if self.sample_cache is not None:
+            # Keyed by the file names so that the repetitions of a multiplied dataset share an entry
+            cache_key = self.image_list[index]
+            with profile_stage(self.profiler, "cache_lookup") as stage:
+                sample = self.sample_cache.get(cache_key)
+                stage.output(sample)
+            if sample is not None:
+                return sample
+
+        with profile_stage(self.profiler, "read_image") as stage:
+            img1, img2 = self._read_images(index)
+            stage.output(img1, img2)
+
+        flow, valid = None, None
+        if not self.is_prediction:
+            with profile_stage(self.profiler, "read_flow") as stage:
+                flow, valid = self._read_flow(index)
+                stage.output(flow, valid)
+
+        if self.sample_cache is not None:
+            self.sample_cache.put(cache_key, img1, img2, flow, valid)
+
+        return img1, img2, flow, valid
+
+    def _read_images(self, index):
+        """
+        Reads the image pair at the given index as uint8 arrays of shape H x W x 3.
+
+        Parameters
+        ----------
+        index : int
+            specify the index location of the image pair
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of (img1, img2)
+        """
+        img1 = self._read_frame(self.image_list[index][0])
+        img2 = self._read_frame(self.image_list[index][1])
+
+        return img1, img2
+
+    def _read_frame(self, file_name):
+        """
+        Reads an image file as a uint8 array of shape H x W x 3.
+
+        Parameters
+        ----------
+        file_name : str
+            Path of the image file
+
+        Returns
+        -------
+        numpy.ndarray
+            The image
+        """
+        return self._to_rgb(read_image(file_name, decoder=self.image_decoder))
+
+    @staticmethod
+    def _to_rgb(img):
+        """
+        Converts a decoded image to a uint8 array of shape H x W x 3.
+
+        Parameters
+        ----------
+        img : numpy.ndarray or PIL.Image.Image
+            The decoded image
+
+        Returns
+        -------
+        numpy.ndarray
+            The image
+        """
+        if not isinstance(img, np.ndarray) or img.dtype != np.uint8:
+            img = np.array(img).astype(np.uint8)
+
+        if len(img.shape) == 2:  # grayscale images
+            return np.tile(img[..., None], (1, 1, 3))
+
+        return img[..., :3]
+
+    def _read_flow(self, index):
+        """
+        Reads the ground truth flow at the given index.
+
+        Parameters
+        ----------
+        index : int
+            specify the index location of the flow
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of (flow, valid)
+
+            flow of shape H x W x 2.
+            valid of shape H x W if available, otherwise None
+        """
+        flow, valid = read_flow(self.flow_list[index], mmap=self.mmap_flow)
+
+        if not self.mmap_flow:
+            flow = np.array(flow).astype(np.float32)
+
+        return flow, valid
+
+    def get_image_size(self, index):
+        """
+        Returns the size of the images of a sample without decoding them,
+        the crop size if crop is True. Augmentations which resize the images are not accounted for.
+
+        Parameters
+        ----------
+        index : int
+            specify the index location of the sample
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of (height, width)
+        """
+        if self.crop:
+            return tuple(self.crop_size)
+
+        return self._image_size(index % len(self.image_list))
+
+    def _image_size(self, index):
+        # Only the header of the image file is read
+        with Image.open(self.image_list[index][0]) as img:
+            width, height = img.size
+
+        return height, width
+
     def _flow_to_bilinear_interpolation_weights(self, flow, valid):
         max_flow = np.max(self.flow_offsets)
         valid_offsets = np.logical_and(
@@ -206,16 +554,20 @@ class BaseDataset(data.Dataset):
             valid = np.logical_and(valid, valid_offsets)
 
         flow_downsample = flow[::8, ::8]
-        offset_labs, dilation_labs = flow_to_bilinear_interpolation_weights(
+        return flow_to_bilinear_interpolation_indices(
             flow_downsample, valid[::8, ::8], self.flow_offsets
         )
-        return offset_labs
 
     def __rmul__(self, v):
         """
         Returns an instance of the dataset after multiplying with v.
 
         """
+        if self._pending_index is not None:
+            # Applied to the file lists once they are built
+            self._repeats *= v
+            return self
+
         self.flow_list = v * self.flow_list
         self.image_list = v * self.image_list
         return self
@@ -36,6 +36,8 @@ class Driving(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -58,6 +60,7 @@ class Driving(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(Driving, self).__init__(
             init_seed=init_seed,
@@ -71,6 +74,7 @@ class Driving(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
         self.is_prediction = is_prediction
@@ -79,6 +83,10 @@ class Driving(BaseDataset):
         if augment:
             self.augmentor = FlowAugmentor(crop_size=crop_size, **aug_params)
 
+        self._defer_index(Driving._scan_files, root_dir=root_dir)
+
+    @staticmethod
+    def _scan_files(root_dir):
         image_list = []
         flow_list = []
         img_dir = os.path.join(root_dir, "frames_cleanpass")
@@ -123,8 +131,7 @@ class Driving(BaseDataset):
                                     )
                                     flow_list.append(fl_paths[idx])
 
-        self.image_list = image_list
-        self.flow_list = flow_list
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -140,4 +147,5 @@ class Driving(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
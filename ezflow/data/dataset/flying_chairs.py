@@ -40,6 +40,8 @@ class FlyingChairs(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -64,6 +66,7 @@ class FlyingChairs(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(FlyingChairs, self).__init__(
             init_seed=init_seed,
@@ -77,6 +80,7 @@ class FlyingChairs(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
         assert (
             split.lower() == "training" or split.lower() == "validation"
@@ -88,6 +92,13 @@ class FlyingChairs(BaseDataset):
         if augment:
             self.augmentor = FlowAugmentor(crop_size=crop_size, **aug_params)
 
+        self._defer_index(FlyingChairs._scan_files, root_dir=root_dir, split=split)
+
+    @staticmethod
+    def _scan_files(root_dir, split):
+        image_list = []
+        flow_list = []
+
         images = sorted(glob(osp.join(root_dir, "*.ppm")))
         flows = sorted(glob(osp.join(root_dir, "*.flo")))
         assert len(images) // 2 == len(flows)
@@ -105,8 +116,10 @@ class FlyingChairs(BaseDataset):
             if (split == "training" and xid == 1) or (
                 split == "validation" and xid == 2
             ):
-                self.flow_list += [flows[i]]
-                self.image_list += [[images[2 * i], images[2 * i + 1]]]
+                flow_list += [flows[i]]
+                image_list += [[images[2 * i], images[2 * i + 1]]]
+
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -123,4 +136,5 @@ class FlyingChairs(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
@@ -40,6 +40,8 @@ class FlyingThings3D(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -65,6 +67,7 @@ class FlyingThings3D(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(FlyingThings3D, self).__init__(
             init_seed=init_seed,
@@ -78,6 +81,7 @@ class FlyingThings3D(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
         assert (
             split.lower() == "training" or split.lower() == "validation"
@@ -99,6 +103,15 @@ class FlyingThings3D(BaseDataset):
         if split.lower() == "validation":
             split = "TEST"
 
+        self._defer_index(
+            FlyingThings3D._scan_files, root_dir=root_dir, split=split, dstype=dstype
+        )
+
+    @staticmethod
+    def _scan_files(root_dir, split, dstype):
+        image_list = []
+        flow_list = []
+
         for cam in ["left"]:
             for direction in ["into_future", "into_past"]:
                 image_dirs = sorted(glob(osp.join(root_dir, dstype, split + "/*/*")))
@@ -114,11 +127,13 @@ class FlyingThings3D(BaseDataset):
                     flows = sorted(glob(osp.join(fdir, "*.pfm")))
                     for i in range(len(flows) - 1):
                         if direction == "into_future":
-                            self.image_list += [[images[i], images[i + 1]]]
-                            self.flow_list += [flows[i]]
+                            image_list += [[images[i], images[i + 1]]]
+                            flow_list += [flows[i]]
                         elif direction == "into_past":
-                            self.image_list += [[images[i + 1], images[i]]]
-                            self.flow_list += [flows[i + 1]]
+                            image_list += [[images[i + 1], images[i]]]
+                            flow_list += [flows[i + 1]]
+
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -136,6 +151,7 @@ class FlyingThings3D(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
 
 
@@ -163,6 +179,7 @@ class FlyingThings3DClean(FlyingThings3D):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(FlyingThings3DClean, self).__init__(
             root_dir=root_dir,
@@ -178,6 +195,7 @@ class FlyingThings3DClean(FlyingThings3D):
             aug_params=aug_params,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
     @classmethod
@@ -195,6 +213,7 @@ class FlyingThings3DClean(FlyingThings3D):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
 
 
@@ -222,6 +241,7 @@ class FlyingThings3DFinal(FlyingThings3D):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(FlyingThings3DFinal, self).__init__(
             root_dir=root_dir,
@@ -237,6 +257,7 @@ class FlyingThings3DFinal(FlyingThings3D):
             aug_params=aug_params,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
     @classmethod
@@ -254,6 +275,7 @@ class FlyingThings3DFinal(FlyingThings3D):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
 
 
@@ -282,6 +304,8 @@ class FlyingThings3DSubset(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -306,6 +330,7 @@ class FlyingThings3DSubset(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(FlyingThings3DSubset, self).__init__(
             init_seed=init_seed,
@@ -319,6 +344,7 @@ class FlyingThings3DSubset(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
         assert (
             split.lower() == "training" or split.lower() == "validation"
@@ -336,6 +362,12 @@ class FlyingThings3DSubset(BaseDataset):
         if split.lower() == "validation":
             split = "val"
 
+        self._defer_index(
+            FlyingThings3DSubset._scan_files, root_dir=root_dir, split=split
+        )
+
+    @staticmethod
+    def _scan_files(root_dir, split):
         image_list = []
         flow_list = []
         img_dir = osp.join(root_dir, split, "image_clean")
@@ -360,8 +392,7 @@ class FlyingThings3DSubset(BaseDataset):
                         image_list.append([cur_fn, nxt_fn])
                         flow_list.append(flow_fn)
 
-        self.image_list = image_list
-        self.flow_list = flow_list
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -378,4 +409,5 @@ class FlyingThings3DSubset(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
@@ -0,0 +1,132 @@
+from collections import OrderedDict
+
+import torch
+from torch.utils.data import IterableDataset
+
+from ...utils import profile_stage
+
+
+def split_scenes(image_list):
+    """
+    Splits the image pairs of a dataset into scenes, runs of consecutive pairs
+    in which every pair shares a frame with the previous pair.
+
+    Parameters
+    ----------
+    image_list : :obj:`list` of :obj:`list` of :obj:`str`
+        The image file pairs of a dataset
+
+    Returns
+    -------
+    :obj:`list` of :obj:`range`
+        The indices of the pairs of every scene
+    """
+    scenes = []
+    start = 0
+    for index in range(1, len(image_list)):
+        if not set(image_list[index]) & set(image_list[index - 1]):
+            scenes.append(range(start, index))
+            start = index
+
+    if len(image_list) > 0:
+        scenes.append(range(start, len(image_list)))
+
+    return scenes
+
+
+class FrameStreamDataset(IterableDataset):
+    """
+    Streams the samples of a video sequence dataset scene by scene, in the order of the dataset,
+    decoding every frame once. The decoded frames are kept in a small LRU cache, so that the frame
+    shared by two consecutive pairs is decoded for the first pair and reused for the second one,
+    which roughly halves the image decoding cost of datasets such as MPISintel, Kubric,
+    Monkaa, Driving and FlyingThings3D.
+
+    The scenes are sharded across the distributed processes and the DataLoader workers,
+    every scene is read by a single worker. The samples are the same as those of the wrapped
+    dataset, augmentations and cropping included. The targets also hold the index of the
+    scene of every sample as scene, offset by scene_offset, so that warm started evaluation
+    can follow every scene when the samples of several workers are interleaved.
+
+    Parameters
+    ----------
+    dataset : BaseDataset
+        A dataset whose image_list holds image file pairs
+    cache_frames : int, default : 4
+        The number of decoded frames kept in the cache of every worker
+    num_replicas : int, default : 1
+        Number of distributed processes
+    rank : int, default : 0
+        Rank of the current process
+    scene_offset : int, default : 0
+        Offset of the scene indices, to tell apart the scenes of several streamed datasets
+    """
+
+    def __init__(self, dataset, cache_frames=4, num_replicas=1, rank=0, scene_offset=0):
+
+        assert len(dataset.image_list) == 0 or isinstance(
+            dataset.image_list[0][0], str
+        ), "Frames can only be streamed from datasets of image files"
+
+        self.dataset = dataset
+        self.cache_frames = cache_frames
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.scene_offset = scene_offset
+
+        self.scenes = split_scenes(dataset.image_list)
+
+    def _worker_scenes(self):
+        scenes = list(enumerate(self.scenes))[self.rank :: self.num_replicas]
+
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is not None:
+            scenes = scenes[worker_info.id :: worker_info.num_workers]
+
+        return scenes
+
+    def __iter__(self):
+        dataset = self.dataset
+        dataset._init_worker_seed()
+
+        frames = OrderedDict()
+
+        def read_frame(file_name):
+            if file_name in frames:
+                frames.move_to_end(file_name)
+            else:
+                with profile_stage(dataset.profiler, "read_image") as stage:
+                    frames[file_name] = dataset._read_frame(file_name)
+                    stage.output(frames[file_name])
+
+                if len(frames) > self.cache_frames:
+                    frames.popitem(last=False)
+
+            # Augmentations may modify the images in place
+            return frames[file_name].copy()
+
+        for scene, indices in self._worker_scenes():
+            for index in indices:
+                with profile_stage(dataset.profiler, "sample") as stage:
+                    img1 = read_frame(dataset.image_list[index][0])
+                    img2 = read_frame(dataset.image_list[index][1])
+
+                    flow, valid = None, None
+                    if not dataset.is_prediction:
+                        with profile_stage(dataset.profiler, "read_flow") as flow_stage:
+                            flow, valid = dataset._read_flow(index)
+                            flow_stage.output(flow, valid)
+
+                    sample = dataset._process_sample(img1, img2, flow, valid)
+                    if not dataset.is_prediction:
+                        sample[1]["scene"] = torch.tensor(self.scene_offset + scene)
+                    stage.output(sample)
+
+                yield sample
+
+    def __len__(self):
+        """
+        Return the number of samples of the current process.
+
+        """
+        return sum(len(scene) for scene in self.scenes[self.rank :: self.num_replicas])
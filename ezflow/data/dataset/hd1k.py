@@ -36,6 +36,8 @@ class HD1K(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -59,6 +61,7 @@ class HD1K(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(HD1K, self).__init__(
             init_seed=init_seed,
@@ -72,6 +75,7 @@ class HD1K(BaseDataset):
             sparse_transform=True,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
         self.is_prediction = is_prediction
@@ -80,6 +84,13 @@ class HD1K(BaseDataset):
         if augment:
             self.augmentor = SparseFlowAugmentor(crop_size=crop_size, **aug_params)
 
+        self._defer_index(HD1K._scan_files, root_dir=root_dir)
+
+    @staticmethod
+    def _scan_files(root_dir):
+        image_list = []
+        flow_list = []
+
         seq_ix = 0
         while 1:
             flows = sorted(
@@ -93,11 +104,13 @@ class HD1K(BaseDataset):
                 break
 
             for i in range(len(flows) - 1):
-                self.flow_list += [flows[i]]
-                self.image_list += [[images[i], images[i + 1]]]
+                flow_list += [flows[i]]
+                image_list += [[images[i], images[i + 1]]]
 
             seq_ix += 1
 
+        return image_list, flow_list
+
     @classmethod
     def from_config(cls, cfg):
         return {
@@ -112,4 +125,5 @@ class HD1K(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
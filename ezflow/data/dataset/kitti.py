@@ -38,6 +38,8 @@ class Kitti(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -62,6 +64,7 @@ class Kitti(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(Kitti, self).__init__(
             init_seed=init_seed,
@@ -75,6 +78,7 @@ class Kitti(BaseDataset):
             sparse_transform=True,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
         assert (
             split.lower() == "training" or split.lower() == "validation"
@@ -91,15 +95,29 @@ class Kitti(BaseDataset):
             split = "testing"
             self.is_prediction = True
 
+        self._defer_index(
+            Kitti._scan_files,
+            root_dir=root_dir,
+            split=split,
+            is_prediction=self.is_prediction,
+        )
+
+    @staticmethod
+    def _scan_files(root_dir, split, is_prediction):
+        image_list = []
+        flow_list = []
+
         root_dir = osp.join(root_dir, split)
         images1 = sorted(glob(osp.join(root_dir, "image_2/*_10.png")))
         images2 = sorted(glob(osp.join(root_dir, "image_2/*_11.png")))
 
         for img1, img2 in zip(images1, images2):
-            self.image_list += [[img1, img2]]
+            image_list += [[img1, img2]]
+
+        if not is_prediction:
+            flow_list += sorted(glob(osp.join(root_dir, "flow_occ/*_10.png")))
 
-        if not self.is_prediction:
-            self.flow_list += sorted(glob(osp.join(root_dir, "flow_occ/*_10.png")))
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -116,4 +134,5 @@ class Kitti(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
@@ -1,15 +1,12 @@
 import os
 import os.path as osp
-import random
 from glob import glob
 
 import numpy as np
-import torch
-import torch.utils.data as data
 
 from ...config import configurable
-from ...functional import FlowAugmentor, Normalize, crop
-from ...utils import read_flow, read_image
+from ...functional import FlowAugmentor
+from ...utils import read_flow
 from ..build import DATASET_REGISTRY
 from .base_dataset import BaseDataset
 
@@ -66,6 +63,8 @@ class Kubric(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -92,6 +91,7 @@ class Kubric(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(Kubric, self).__init__(
             init_seed=init_seed,
@@ -105,6 +105,7 @@ class Kubric(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
         assert (
@@ -120,6 +121,19 @@ class Kubric(BaseDataset):
 
         split = split.lower()
 
+        self._defer_index(
+            Kubric._scan_files,
+            root_dir=root_dir,
+            split=split,
+            use_backward_flow=use_backward_flow,
+            is_prediction=self.is_prediction,
+        )
+
+    @staticmethod
+    def _scan_files(root_dir, split, use_backward_flow, is_prediction):
+        image_list = []
+        flow_list = []
+
         image_root = osp.join(root_dir, split, "images")
 
         if use_backward_flow:
@@ -128,12 +142,14 @@ class Kubric(BaseDataset):
             flow_root = osp.join(root_dir, split, "forward_flow")
 
         for scene in os.listdir(image_root):
-            image_list = sorted(glob(osp.join(image_root, scene, "*.png")))
-            for i in range(len(image_list) - 1):
-                self.image_list += [[image_list[i], image_list[i + 1]]]
+            images = sorted(glob(osp.join(image_root, scene, "*.png")))
+            for i in range(len(images) - 1):
+                image_list += [[images[i], images[i + 1]]]
 
-            if not self.is_prediction:
-                self.flow_list += sorted(glob(osp.join(flow_root, scene, "*.flo")))
+            if not is_prediction:
+                flow_list += sorted(glob(osp.join(flow_root, scene, "*.flo")))
+
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -152,44 +168,26 @@ class Kubric(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
 
-    def __getitem__(self, index):
+    def _read_flow(self, index):
         """
-        Returns the corresponding images and the flow between them.
+        Reads the ground truth flow at the given index and optionally
+        swaps the column major flow to row major.
 
         Parameters
         ----------
         index : int
-            specify the index location for access to Dataset item
+            specify the index location of the flow
 
         Returns
         -------
         tuple
-            A tuple consisting of ((img1, img2), flow)
-
-            img1 and img2 of shape 3 x H x W.
-            flow of shape 2 x H x W if append_valid_mask is False.
-            flow of shape 3 x H x W if append_valid_mask is True.
+            A tuple consisting of (flow, valid)
         """
-
-        if not self.init_seed:
-            worker_info = torch.utils.data.get_worker_info()
-            if worker_info is not None:
-                torch.manual_seed(worker_info.id)
-                np.random.seed(worker_info.id)
-                random.seed(worker_info.id)
-                self.init_seed = True
-
-        index = index % len(self.image_list)
-
-        img1 = read_image(self.image_list[index][0])
-        img2 = read_image(self.image_list[index][1])
-        flow, valid = read_flow(self.flow_list[index])
-
+        flow, valid = read_flow(self.flow_list[index], mmap=self.mmap_flow)
         flow = np.array(flow).astype(np.float32)
-        img1 = np.array(img1).astype(np.uint8)
-        img2 = np.array(img2).astype(np.uint8)
 
         if self.swap:
             flow_temp = np.zeros_like(flow)
@@ -202,62 +200,4 @@ class Kubric(BaseDataset):
             del flow
             flow = flow_temp
 
-        if len(img1.shape) == 2:  # grayscale images
-            img1 = np.tile(img1[..., None], (1, 1, 3))
-            img2 = np.tile(img2[..., None], (1, 1, 3))
-        else:
-            img1 = img1[..., :3]
-            img2 = img2[..., :3]
-
-        if self.is_prediction:
-
-            img1 = torch.from_numpy(img1).permute(2, 0, 1).float()
-            img2 = torch.from_numpy(img2).permute(2, 0, 1).float()
-
-            img1, img2 = self.normalize(img1, img2)
-
-            return img1, img2
-
-        if self.augment is True and self.augmentor is not None:
-            img1, img2, flow, valid = self.augmentor(img1, img2, flow, valid)
-
-        if self.crop is True:
-            img1, img2, flow, valid = crop(
-                img1,
-                img2,
-                flow,
-                valid=valid,
-                crop_size=self.crop_size,
-                crop_type=self.crop_type,
-                sparse_transform=self.sparse_transform,
-            )
-
-        if self.flow_offsets is not None:
-            offset_labs = self._flow_to_bilinear_interpolation_weights(flow, valid)
-            offset_labs = torch.from_numpy(offset_labs).float()
-            offset_labs = offset_labs.view(
-                offset_labs.shape[0], offset_labs.shape[1], -1
-            ).permute(2, 0, 1)
-
-        img1 = torch.from_numpy(img1).permute(2, 0, 1).float()
-        img2 = torch.from_numpy(img2).permute(2, 0, 1).float()
-        flow = torch.from_numpy(flow).permute(2, 0, 1).float()
-
-        img1, img2 = self.normalize(img1, img2)
-        target = {}
-        target["flow_gt"] = flow
-
-        if self.append_valid_mask:
-            if valid is not None:
-                valid = torch.from_numpy(valid)
-            else:
-                valid = (flow[0].abs() < 1000) & (flow[1].abs() < 1000)
-
-            valid = valid.float()
-            valid = torch.unsqueeze(valid, dim=0)
-            target["valid"] = valid
-
-        if self.flow_offsets is not None:
-            target["offset_labs"] = offset_labs
-
-        return (img1, img2), target
+        return flow, valid
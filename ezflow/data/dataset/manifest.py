@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import os.path as osp
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+def _manifest_path(manifest_dir, scan_name, scan_params):
+    key = json.dumps({"scan": scan_name, "params": scan_params}, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return osp.join(manifest_dir, f"{scan_name}-{digest}.json")
+
+
+def _directory_mtimes(root_dir, image_list, flow_list):
+    """
+    Returns the modification times of the root directory, of every directory
+    containing a listed file and of every directory between them, so that new
+    subdirectories at any depth invalidate the manifest.
+    """
+    leaf_dirs = set()
+    for images in image_list:
+        leaf_dirs.update(osp.dirname(f) for f in images)
+    leaf_dirs.update(osp.dirname(f) for f in flow_list)
+
+    dirs = {root_dir}
+    for d in leaf_dirs:
+        # Walk up from every leaf directory to the root directory
+        while d not in dirs:
+            dirs.add(d)
+            parent = osp.dirname(d)
+            if parent == d or not d.startswith(root_dir):
+                break
+            d = parent
+
+    mtimes = {}
+    for d in sorted(dirs):
+        try:
+            mtimes[d] = os.stat(d).st_mtime_ns
+        except OSError:
+            mtimes[d] = None
+
+    return mtimes
+
+
+def _is_valid(manifest, scan_name, scan_params):
+    if manifest.get("format_version") != MANIFEST_FORMAT_VERSION:
+        return False
+
+    if manifest.get("scan") != scan_name or manifest.get("params") != scan_params:
+        return False
+
+    for d, mtime in manifest["mtimes"].items():
+        try:
+            if os.stat(d).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+
+    return True
+
+
+def load_or_build_manifest(manifest_dir, scan_fn, rebuild=False, **scan_params):
+    """
+    Returns the image and flow file lists of a dataset from a manifest file.
+    The manifest is rebuilt by scanning the dataset directories if it does not exist,
+    if rebuild is True or if the modification time of a dataset directory has changed.
+
+    Parameters
+    ----------
+    manifest_dir : str
+        path of the directory in which the manifests are stored
+    scan_fn : callable
+        Function scanning the dataset directories, called with scan_params.
+        Must return a tuple of (image_list, flow_list).
+    rebuild : bool, default : False
+        If True, the dataset directories are scanned and the manifest is rewritten
+    **scan_params
+        The parameters of scan_fn, must include root_dir
+
+    Returns
+    -------
+    tuple
+        A tuple consisting of (image_list, flow_list)
+    """
+    scan_params["root_dir"] = osp.abspath(scan_params["root_dir"])
+    scan_name = scan_fn.__qualname__.replace(".", "_")
+    manifest_path = _manifest_path(manifest_dir, scan_name, scan_params)
+
+    if not rebuild and osp.exists(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        if _is_valid(manifest, scan_name, scan_params):
+            return manifest["image_list"], manifest["flow_list"]
+
+    image_list, flow_list = scan_fn(**scan_params)
+
+    manifest = {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "scan": scan_name,
+        "params": scan_params,
+        "mtimes": _directory_mtimes(scan_params["root_dir"], image_list, flow_list),
+        "image_list": image_list,
+        "flow_list": flow_list,
+    }
+
+    os.makedirs(manifest_dir, exist_ok=True)
+
+    # Write to a temporary file first so that concurrent readers never see a partial manifest
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+    return image_list, flow_list
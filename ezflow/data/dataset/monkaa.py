@@ -36,6 +36,8 @@ class Monkaa(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -59,6 +61,7 @@ class Monkaa(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(Monkaa, self).__init__(
             init_seed=init_seed,
@@ -72,6 +75,7 @@ class Monkaa(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
         self.is_prediction = is_prediction
@@ -80,6 +84,10 @@ class Monkaa(BaseDataset):
         if augment:
             self.augmentor = FlowAugmentor(crop_size=crop_size, **aug_params)
 
+        self._defer_index(Monkaa._scan_files, root_dir=root_dir)
+
+    @staticmethod
+    def _scan_files(root_dir):
         image_list = []
         flow_list = []
         img_dir = os.path.join(root_dir, "frames_cleanpass")
@@ -103,8 +111,7 @@ class Monkaa(BaseDataset):
                             image_list.append([im_paths[idx], im_paths[idx + 1]])
                             flow_list.append(fl_paths[idx])
 
-        self.image_list = image_list
-        self.flow_list = flow_list
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -120,4 +127,5 @@ class Monkaa(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
@@ -41,6 +41,8 @@ class MPISintel(BaseDataset):
         The parameters for normalization
     flow_offset_params: :obj:`dict`, optional
         The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
     """
 
     @configurable
@@ -66,6 +68,7 @@ class MPISintel(BaseDataset):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(MPISintel, self).__init__(
             init_seed=init_seed,
@@ -79,6 +82,7 @@ class MPISintel(BaseDataset):
             sparse_transform=False,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
         assert (
@@ -100,16 +104,31 @@ class MPISintel(BaseDataset):
             split = "test"
             self.is_prediction = True
 
+        self._defer_index(
+            MPISintel._scan_files,
+            root_dir=root_dir,
+            split=split,
+            dstype=dstype,
+            is_prediction=self.is_prediction,
+        )
+
+    @staticmethod
+    def _scan_files(root_dir, split, dstype, is_prediction):
+        image_list = []
+        flow_list = []
+
         image_root = osp.join(root_dir, split, dstype)
         flow_root = osp.join(root_dir, split, "flow")
 
         for scene in os.listdir(image_root):
-            image_list = sorted(glob(osp.join(image_root, scene, "*.png")))
-            for i in range(len(image_list) - 1):
-                self.image_list += [[image_list[i], image_list[i + 1]]]
+            images = sorted(glob(osp.join(image_root, scene, "*.png")))
+            for i in range(len(images) - 1):
+                image_list += [[images[i], images[i + 1]]]
+
+            if not is_prediction:
+                flow_list += sorted(glob(osp.join(flow_root, scene, "*.flo")))
 
-            if not self.is_prediction:
-                self.flow_list += sorted(glob(osp.join(flow_root, scene, "*.flo")))
+        return image_list, flow_list
 
     @classmethod
     def from_config(cls, cfg):
@@ -127,6 +146,7 @@ class MPISintel(BaseDataset):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
 
 
@@ -154,6 +174,7 @@ class MPISintelClean(MPISintel):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(MPISintelClean, self).__init__(
             root_dir=root_dir,
@@ -169,6 +190,7 @@ class MPISintelClean(MPISintel):
             aug_params=aug_params,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
     @classmethod
@@ -186,6 +208,7 @@ class MPISintelClean(MPISintel):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
 
 
@@ -213,6 +236,7 @@ class MPISintelFinal(MPISintel):
         },
         norm_params={"use": False},
         flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
     ):
         super(MPISintelFinal, self).__init__(
             root_dir=root_dir,
@@ -228,6 +252,7 @@ class MPISintelFinal(MPISintel):
             aug_params=aug_params,
             norm_params=norm_params,
             flow_offset_params=flow_offset_params,
+            io_params=io_params,
         )
 
     @classmethod
@@ -245,4 +270,5 @@ class MPISintelFinal(MPISintel):
             "aug_params": cfg.AUGMENTATION.PARAMS,
             "norm_params": cfg.NORM_PARAMS,
             "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
         }
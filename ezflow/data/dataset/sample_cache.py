@@ -0,0 +1,301 @@
+import multiprocessing as mp
+
+import numpy as np
+from torch.utils.data import ConcatDataset
+
+from ...utils import SharedArraysMixin, stable_hash
+
+# Columns of the entry table
+_KEY, _OFFSET, _NBYTES, _HEIGHT, _WIDTH, _FLAGS, _LAST_USED = range(7)
+_N_COLUMNS = 7
+
+# Slots of the statistics array
+_HITS, _MISSES, _CLOCK = range(3)
+_N_STATS = 3
+
+# Flags of an entry
+_HAS_FLOW = 1
+_HAS_VALID = 2
+
+# Every array of an entry starts at a multiple of this many bytes
+_ALIGNMENT = 8
+
+
+def _aligned(nbytes):
+    return (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _entry_layout(height, width, flags):
+    """
+    Returns the (name, offset, shape, dtype) of every array of an entry
+    and the total size of the entry.
+    """
+    arrays = [
+        ("img1", (height, width, 3), np.uint8),
+        ("img2", (height, width, 3), np.uint8),
+    ]
+    if flags & _HAS_FLOW:
+        arrays.append(("flow", (height, width, 2), np.float32))
+    if flags & _HAS_VALID:
+        arrays.append(("valid", (height, width), np.float32))
+
+    layout = []
+    offset = 0
+    for name, shape, dtype in arrays:
+        layout.append((name, offset, shape, dtype))
+        offset += _aligned(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+    return layout, offset
+
+
+class SharedSampleCache(SharedArraysMixin):
+    """
+    A cache of decoded samples stored in a shared memory arena with a fixed byte budget.
+    The cache is created in the main process and is visible to all the DataLoader
+    worker processes. When the budget is exhausted the least recently used samples are evicted.
+
+    Samples are stored before augmentation, images as uint8 arrays of shape H x W x 3,
+    flow as a float32 array of shape H x W x 2 and the valid mask as a float32 array of shape H x W.
+
+    Parameters
+    ----------
+    capacity_bytes : int
+        The size of the arena used to store samples in bytes
+    max_entries : int, default : 16384
+        The maximum number of samples that can be cached
+    """
+
+    _attached_attrs = ("_table", "_stats", "_arena")
+
+    def __init__(self, capacity_bytes, max_entries=16384):
+
+        self.capacity_bytes = int(capacity_bytes)
+        self.max_entries = int(max_entries)
+
+        self._lock = mp.Lock()
+        self._create_shared_memory(self._total_bytes())
+
+        self._table[:, _KEY] = -1
+        self._stats[:] = 0
+
+    def _total_bytes(self):
+        return self._arena_start() + self.capacity_bytes
+
+    def _arena_start(self):
+        return 8 * (self.max_entries * _N_COLUMNS + _N_STATS)
+
+    def _attach(self):
+        buf = self._shm.buf
+        self._table = np.ndarray(
+            (self.max_entries, _N_COLUMNS), dtype=np.int64, buffer=buf
+        )
+        self._stats = np.ndarray(
+            (_N_STATS,), dtype=np.int64, buffer=buf, offset=8 * self._table.size
+        )
+        self._arena = np.ndarray(
+            (self.capacity_bytes,),
+            dtype=np.uint8,
+            buffer=buf,
+            offset=self._arena_start(),
+        )
+
+    def _lookup(self, key):
+        rows = np.flatnonzero(self._table[:, _KEY] == stable_hash(key))
+        return rows[0] if len(rows) > 0 else None
+
+    def _touch(self, row):
+        self._stats[_CLOCK] += 1
+        self._table[row, _LAST_USED] = self._stats[_CLOCK]
+
+    def _evict_lru(self):
+        live = np.flatnonzero(self._table[:, _KEY] >= 0)
+        if len(live) == 0:
+            return False
+
+        row = live[np.argmin(self._table[live, _LAST_USED])]
+        self._table[row, _KEY] = -1
+        return True
+
+    def _find_free_range(self, nbytes):
+        live = np.flatnonzero(self._table[:, _KEY] >= 0)
+        order = np.argsort(self._table[live, _OFFSET])
+
+        start = 0
+        for row in live[order]:
+            if self._table[row, _OFFSET] - start >= nbytes:
+                return start
+            start = self._table[row, _OFFSET] + self._table[row, _NBYTES]
+
+        if self.capacity_bytes - start >= nbytes:
+            return start
+
+        return None
+
+    def get(self, key):
+        """
+        Returns a copy of the cached sample.
+
+        Parameters
+        ----------
+        key : object
+            The key of the sample, for example the file names of the sample
+
+        Returns
+        -------
+        tuple or None
+            A tuple consisting of (img1, img2, flow, valid) if the sample is cached, otherwise None.
+            flow and valid are None if they were not cached.
+        """
+        with self._lock:
+            row = self._lookup(key)
+
+            if row is None:
+                self._stats[_MISSES] += 1
+                return None
+
+            self._stats[_HITS] += 1
+            self._touch(row)
+
+            start = self._table[row, _OFFSET]
+            layout, _ = _entry_layout(
+                self._table[row, _HEIGHT],
+                self._table[row, _WIDTH],
+                self._table[row, _FLAGS],
+            )
+
+            sample = {}
+            for name, offset, shape, dtype in layout:
+                nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+                data = self._arena[start + offset : start + offset + nbytes]
+                sample[name] = data.view(dtype).reshape(shape).copy()
+
+        return sample["img1"], sample["img2"], sample.get("flow"), sample.get("valid")
+
+    def put(self, key, img1, img2, flow=None, valid=None):
+        """
+        Adds a sample to the cache, evicting the least recently used samples if required.
+
+        Parameters
+        ----------
+        key : object
+            The key of the sample, for example the file names of the sample
+        img1 : numpy.ndarray
+            First image of shape H x W x 3
+        img2 : numpy.ndarray
+            Second image of shape H x W x 3
+        flow : numpy.ndarray, optional
+            Flow of shape H x W x 2
+        valid : numpy.ndarray, optional
+            Valid mask of shape H x W
+
+        Returns
+        -------
+        bool
+            True if the sample was added to the cache
+        """
+        height, width = img1.shape[:2]
+        flags = (_HAS_FLOW if flow is not None else 0) | (
+            _HAS_VALID if valid is not None else 0
+        )
+        layout, nbytes = _entry_layout(height, width, flags)
+
+        if nbytes > self.capacity_bytes:
+            return False
+
+        arrays = {"img1": img1, "img2": img2, "flow": flow, "valid": valid}
+
+        with self._lock:
+            if self._lookup(key) is not None:
+                # Another worker has cached the sample in the meantime
+                return True
+
+            if not np.any(self._table[:, _KEY] < 0):
+                self._evict_lru()
+
+            start = self._find_free_range(nbytes)
+            while start is None and self._evict_lru():
+                start = self._find_free_range(nbytes)
+
+            if start is None:
+                return False
+
+            for name, offset, shape, dtype in layout:
+                data = np.ascontiguousarray(arrays[name], dtype=dtype)
+                data = data.reshape(-1).view(np.uint8)
+                self._arena[start + offset : start + offset + data.size] = data
+
+            row = np.flatnonzero(self._table[:, _KEY] < 0)[0]
+            self._table[row] = (
+                stable_hash(key),
+                start,
+                nbytes,
+                height,
+                width,
+                flags,
+                0,
+            )
+            self._touch(row)
+
+        return True
+
+    def stats(self):
+        """
+        Returns the cache statistics aggregated over all processes.
+
+        Returns
+        -------
+        dict
+            Number of hits, misses, cached samples and cached bytes
+        """
+        with self._lock:
+            live = self._table[:, _KEY] >= 0
+            return {
+                "hits": int(self._stats[_HITS]),
+                "misses": int(self._stats[_MISSES]),
+                "entries": int(live.sum()),
+                "bytes": int(self._table[live, _NBYTES].sum()),
+            }
+
+
+def sample_cache_stats(dataset):
+    """
+    Returns the sample cache statistics summed over a dataset and its sub-datasets.
+
+    Parameters
+    ----------
+    dataset : torch.utils.data.Dataset
+        A dataset or a concatenation of datasets
+
+    Returns
+    -------
+    dict or None
+        Number of hits, misses, cached samples and cached bytes and the hit rate,
+        None if no dataset uses a sample cache
+    """
+    if isinstance(dataset, ConcatDataset):
+        datasets = dataset.datasets
+    else:
+        datasets = [dataset]
+
+    total = None
+    for ds in datasets:
+        if isinstance(ds, ConcatDataset):
+            stats = sample_cache_stats(ds)
+        elif getattr(ds, "sample_cache", None) is not None:
+            stats = ds.sample_cache.stats()
+        else:
+            stats = None
+
+        if stats is None:
+            continue
+
+        if total is None:
+            total = {"hits": 0, "misses": 0, "entries": 0, "bytes": 0}
+        for key in total:
+            total[key] += stats[key]
+
+    if total is not None:
+        lookups = total["hits"] + total["misses"]
+        total["hit_rate"] = total["hits"] / lookups if lookups > 0 else 0.0
+
+    return total
@@ -0,0 +1,315 @@
+import json
+import os
+import os.path as osp
+
+import numpy as np
+
+from ...config import configurable
+from ...functional import FlowAugmentor, SparseFlowAugmentor
+from ..build import DATASET_REGISTRY
+from .base_dataset import BaseDataset
+
+SHARD_FORMAT_VERSION = 1
+SHARD_META_FILE = "meta.json"
+SHARD_INDEX_FILE = "index.npy"
+
+# Columns of the shard index
+_SHARD, _OFFSET, _HEIGHT, _WIDTH, _HAS_VALID = range(5)
+
+# Every section of a record starts at a multiple of this many bytes
+_ALIGNMENT = 8
+
+
+def _aligned(nbytes):
+    return (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _record_layout(height, width, flow_itemsize, has_flow, has_valid):
+    """
+    Returns the byte offsets of img1, img2, flow and valid within a record
+    and the total size of the record.
+    """
+    img_nbytes = _aligned(height * width * 3)
+    flow_nbytes = _aligned(height * width * 2 * flow_itemsize) if has_flow else 0
+    valid_nbytes = _aligned(height * width) if has_valid else 0
+
+    img1_start = 0
+    img2_start = img_nbytes
+    flow_start = img2_start + img_nbytes
+    valid_start = flow_start + flow_nbytes
+
+    return img1_start, img2_start, flow_start, valid_start, valid_start + valid_nbytes
+
+
+def _write_array(f, arr):
+    data = np.ascontiguousarray(arr).tobytes()
+    f.write(data)
+    f.write(b"\0" * (_aligned(len(data)) - len(data)))
+
+
+def write_flow_shards(dataset, shard_dir, samples_per_shard=1000, flow_dtype="float16"):
+    """
+    Packs the image pairs and ground truth flow of a dataset into fixed layout
+    binary shards which can be read by :class:`ShardedFlowDataset`.
+
+    Each record of a shard stores the two frames as raw uint8 H x W x 3 arrays,
+    the flow as a H x W x 2 array of flow_dtype and, for sparse datasets, the
+    valid mask as a uint8 H x W array. The location and shape of every record
+    is stored in an index file next to the shards.
+
+    Parameters
+    ----------
+    dataset : BaseDataset
+        The dataset to be packed. The samples are read without augmentation or cropping.
+    shard_dir : str
+        path of the output directory for the shards
+    samples_per_shard : int, default : 1000
+        Maximum number of samples written to a single shard
+    flow_dtype : str, default : "float16"
+        The data type used to store the flow, one of "float16", "float32"
+
+    Returns
+    -------
+    dict
+        The metadata of the written shards
+    """
+    assert isinstance(dataset, BaseDataset), "Invalid dataset type."
+
+    flow_dtype = np.dtype(flow_dtype)
+    assert flow_dtype in (
+        np.dtype(np.float16),
+        np.dtype(np.float32),
+    ), "Incorrect flow_dtype values. Accepted flow_dtype values: float16, float32"
+
+    os.makedirs(shard_dir, exist_ok=True)
+
+    has_flow = not dataset.is_prediction and len(dataset.flow_list) > 0
+    num_samples = len(dataset.image_list)
+
+    index = np.zeros((num_samples, 5), dtype=np.int64)
+    shards = []
+    f = None
+    offset = 0
+
+    for idx in range(num_samples):
+        if idx % samples_per_shard == 0:
+            if f is not None:
+                f.close()
+
+            shards.append("shard_%05d.bin" % len(shards))
+            f = open(osp.join(shard_dir, shards[-1]), "wb")
+            offset = 0
+
+        img1, img2 = dataset._read_images(idx)
+        height, width = img1.shape[:2]
+
+        flow, valid = dataset._read_flow(idx) if has_flow else (None, None)
+        has_valid = valid is not None
+
+        _write_array(f, img1.astype(np.uint8))
+        _write_array(f, img2.astype(np.uint8))
+        if has_flow:
+            _write_array(f, flow.astype(flow_dtype))
+        if has_valid:
+            _write_array(f, (valid >= 1).astype(np.uint8))
+
+        index[idx] = (len(shards) - 1, offset, height, width, int(has_valid))
+        offset += _record_layout(
+            height, width, flow_dtype.itemsize, has_flow, has_valid
+        )[-1]
+
+    if f is not None:
+        f.close()
+
+    np.save(osp.join(shard_dir, SHARD_INDEX_FILE), index)
+
+    meta = {
+        "format_version": SHARD_FORMAT_VERSION,
+        "source": dataset.__class__.__name__,
+        "num_samples": num_samples,
+        "shards": shards,
+        "has_flow": has_flow,
+        "flow_dtype": flow_dtype.name,
+        "sparse_transform": dataset.sparse_transform,
+    }
+    with open(osp.join(shard_dir, SHARD_META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+@DATASET_REGISTRY.register()
+class ShardedFlowDataset(BaseDataset):
+    """
+    Dataset Class for reading optical flow datasets packed into binary shards by
+    :func:`write_flow_shards`. The shards are memory-mapped and samples are served as
+    zero-copy views, which avoids opening and decoding individual image and flow files.
+
+    Parameters
+    ----------
+    shard_dir : str
+        path of the directory containing the shards
+    is_prediction : bool, default : False
+        If True, only image data are loaded for prediction otherwise both images and flow data are loaded
+    init_seed : bool, default : False
+        If True, sets random seed to worker
+    append_valid_mask : bool, default :  False
+        If True, appends the valid flow mask to the original flow mask at dim=0
+    crop: bool, default : True
+        Whether to perform cropping
+    crop_size : :obj:`tuple` of :obj:`int`
+        The size of the image crop
+    crop_type : :obj:`str`, default : 'center'
+        The type of croppping to be performed, one of "center", "random"
+    augment : bool, default : True
+        If True, applies data augmentation
+    aug_params : :obj:`dict`, optional
+        The parameters for data augmentation
+    norm_params : :obj:`dict`, optional
+        The parameters for normalization
+    flow_offset_params: :obj:`dict`, optional
+        The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
+    """
+
+    @configurable
+    def __init__(
+        self,
+        shard_dir,
+        is_prediction=False,
+        init_seed=False,
+        append_valid_mask=False,
+        crop=False,
+        crop_size=(256, 256),
+        crop_type="center",
+        augment=True,
+        aug_params={
+            "eraser_aug_params": {"enabled": False},
+            "noise_aug_params": {"enabled": False},
+            "flip_aug_params": {"enabled": False},
+            "color_aug_params": {"enabled": False},
+            "spatial_aug_params": {"enabled": False},
+            "advanced_spatial_aug_params": {"enabled": False},
+        },
+        norm_params={"use": False},
+        flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
+    ):
+        with open(osp.join(shard_dir, SHARD_META_FILE)) as f:
+            meta = json.load(f)
+
+        assert (
+            meta["format_version"] == SHARD_FORMAT_VERSION
+        ), f"Unsupported shard format version: {meta['format_version']}"
+
+        super(ShardedFlowDataset, self).__init__(
+            init_seed=init_seed,
+            is_prediction=is_prediction,
+            append_valid_mask=append_valid_mask,
+            crop=crop,
+            crop_size=crop_size,
+            crop_type=crop_type,
+            augment=augment,
+            aug_params=aug_params,
+            sparse_transform=meta["sparse_transform"],
+            norm_params=norm_params,
+            flow_offset_params=flow_offset_params,
+            io_params=io_params,
+        )
+
+        self.is_prediction = is_prediction or not meta["has_flow"]
+        self.append_valid_mask = append_valid_mask
+
+        if augment:
+            if self.sparse_transform:
+                self.augmentor = SparseFlowAugmentor(crop_size=crop_size, **aug_params)
+            else:
+                self.augmentor = FlowAugmentor(crop_size=crop_size, **aug_params)
+
+        self.shard_dir = shard_dir
+        self.shard_files = [osp.join(shard_dir, name) for name in meta["shards"]]
+        self.has_flow = meta["has_flow"]
+        self.flow_dtype = np.dtype(meta["flow_dtype"])
+
+        self.index = np.load(osp.join(shard_dir, SHARD_INDEX_FILE))
+        assert len(self.index) == meta["num_samples"], "Corrupted shard index."
+
+        # The lists hold record ids so that list based operations
+        # such as dataset multiplication work as for file based datasets.
+        self.image_list = list(range(meta["num_samples"]))
+        if self.has_flow:
+            self.flow_list = list(range(meta["num_samples"]))
+
+        self._shards = None
+
+    @classmethod
+    def from_config(cls, cfg):
+        return {
+            "shard_dir": cfg.SHARD_DIR,
+            "is_prediction": cfg.IS_PREDICTION,
+            "init_seed": cfg.INIT_SEED,
+            "append_valid_mask": cfg.APPEND_VALID_MASK,
+            "crop": cfg.CROP.USE,
+            "crop_size": cfg.CROP.SIZE,
+            "crop_type": cfg.CROP.TYPE,
+            "augment": cfg.AUGMENTATION.USE,
+            "aug_params": cfg.AUGMENTATION.PARAMS,
+            "norm_params": cfg.NORM_PARAMS,
+            "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
+        }
+
+    def __getstate__(self):
+        # Memory maps are opened lazily in every worker process
+        # instead of being pickled along with the dataset.
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def _record(self, record_id):
+        if self._shards is None:
+            # Copy-on-write mapping, in-place augmentations never touch the shards on disk.
+            self._shards = [
+                np.memmap(shard_file, dtype=np.uint8, mode="c")
+                for shard_file in self.shard_files
+            ]
+
+        shard, offset, height, width, has_valid = self.index[record_id]
+        layout = _record_layout(
+            height, width, self.flow_dtype.itemsize, self.has_flow, has_valid
+        )
+        return self._shards[shard], offset, height, width, bool(has_valid), layout
+
+    def _image_size(self, index):
+        _, _, height, width, _ = self.index[self.image_list[index]]
+        return int(height), int(width)
+
+    def _read_images(self, index):
+        buf, offset, height, width, _, layout = self._record(self.image_list[index])
+        img1_start, img2_start = layout[:2]
+        nbytes = height * width * 3
+
+        img1 = buf[offset + img1_start : offset + img1_start + nbytes]
+        img2 = buf[offset + img2_start : offset + img2_start + nbytes]
+
+        return img1.reshape(height, width, 3), img2.reshape(height, width, 3)
+
+    def _read_flow(self, index):
+        buf, offset, height, width, has_valid, layout = self._record(
+            self.flow_list[index]
+        )
+        flow_start, valid_start = layout[2:4]
+        nbytes = height * width * 2 * self.flow_dtype.itemsize
+
+        flow = buf[offset + flow_start : offset + flow_start + nbytes]
+        flow = flow.view(self.flow_dtype).reshape(height, width, 2)
+        if self.flow_dtype != np.float32:
+            flow = flow.astype(np.float32)
+
+        valid = None
+        if has_valid:
+            valid = buf[offset + valid_start : offset + valid_start + height * width]
+            valid = valid.reshape(height, width).astype(np.float32)
+
+        return flow, valid
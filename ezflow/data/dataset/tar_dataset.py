@@ -0,0 +1,457 @@
+import io
+import itertools
+import json
+import os
+import os.path as osp
+import random
+import tarfile
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset
+
+from ...config import configurable
+from ...functional import FlowAugmentor, SparseFlowAugmentor
+from ...utils import IMAGE_DECODER_REGISTRY, profile_stage
+from ..build import DATASET_REGISTRY
+from .base_dataset import BaseDataset
+
+TAR_FORMAT_VERSION = 1
+TAR_META_FILE = "meta.json"
+
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _array_bytes(arr):
+    buf = io.BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _encoded_images(dataset, index):
+    """
+    Returns the extension and the encoded bytes of the two frames of a sample.
+    The image files of datasets which read their frames from files are copied as they are,
+    other frames are encoded as PNG.
+    """
+    files = dataset.image_list[index]
+    reads_files = (
+        type(dataset)._read_images is BaseDataset._read_images
+        and type(dataset)._read_frame is BaseDataset._read_frame
+    )
+
+    if reads_files and all(isinstance(f, str) for f in files):
+        images = []
+        for file_name in files:
+            with open(file_name, "rb") as f:
+                images.append((osp.splitext(file_name)[1].lower(), f.read()))
+        return images
+
+    return [
+        (".png", cv2.imencode(".png", img[..., ::-1])[1].tobytes())
+        for img in dataset._read_images(index)
+    ]
+
+
+def write_tar_shards(dataset, tar_dir, samples_per_shard=1000, flow_dtype="float16"):
+    """
+    Packs the image pairs and ground truth flow of a dataset into tar archives which are read
+    sequentially by :class:`TarFlowDataset`.
+
+    Every sample is stored as consecutive members sharing a key, in the layout of WebDataset:
+    <key>.img1.<ext> and <key>.img2.<ext> hold the encoded frames, <key>.flow.npy the flow as a
+    H x W x 2 array of flow_dtype and, for sparse datasets, <key>.valid.npy the valid mask as a
+    uint8 H x W array.
+
+    Parameters
+    ----------
+    dataset : BaseDataset
+        The dataset to be packed. The samples are read without augmentation or cropping.
+    tar_dir : str
+        path of the output directory for the tar shards
+    samples_per_shard : int, default : 1000
+        Maximum number of samples written to a single shard
+    flow_dtype : str, default : "float16"
+        The data type used to store the flow, one of "float16", "float32"
+
+    Returns
+    -------
+    dict
+        The metadata of the written shards
+    """
+    assert isinstance(dataset, BaseDataset), "Invalid dataset type."
+
+    flow_dtype = np.dtype(flow_dtype)
+    assert flow_dtype in (
+        np.dtype(np.float16),
+        np.dtype(np.float32),
+    ), "Incorrect flow_dtype values. Accepted flow_dtype values: float16, float32"
+
+    os.makedirs(tar_dir, exist_ok=True)
+
+    has_flow = not dataset.is_prediction and len(dataset.flow_list) > 0
+    num_samples = len(dataset.image_list)
+
+    shards = []
+    shard_sizes = []
+    tar = None
+
+    for idx in range(num_samples):
+        if idx % samples_per_shard == 0:
+            if tar is not None:
+                tar.close()
+
+            shards.append("shard_%05d.tar" % len(shards))
+            shard_sizes.append(0)
+            tar = tarfile.open(osp.join(tar_dir, shards[-1]), "w")
+
+        key = "%09d" % idx
+        for name, (ext, data) in zip(["img1", "img2"], _encoded_images(dataset, idx)):
+            _add_member(tar, f"{key}.{name}{ext}", data)
+
+        if has_flow:
+            flow, valid = dataset._read_flow(idx)
+            _add_member(tar, f"{key}.flow.npy", _array_bytes(flow.astype(flow_dtype)))
+            if valid is not None:
+                valid = (np.asarray(valid) >= 1).astype(np.uint8)
+                _add_member(tar, f"{key}.valid.npy", _array_bytes(valid))
+
+        shard_sizes[-1] += 1
+
+    if tar is not None:
+        tar.close()
+
+    meta = {
+        "format_version": TAR_FORMAT_VERSION,
+        "source": dataset.__class__.__name__,
+        "num_samples": num_samples,
+        "shards": shards,
+        "shard_sizes": shard_sizes,
+        "has_flow": has_flow,
+        "flow_dtype": flow_dtype.name,
+        "sparse_transform": dataset.sparse_transform,
+    }
+    with open(osp.join(tar_dir, TAR_META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+def _iter_tar_samples(tar_file):
+    """
+    Reads a tar shard sequentially and yields its samples as dicts of the bytes
+    of their members, keyed by the member names without the sample key.
+    """
+    sample, key = {}, None
+
+    # Stream mode, the shard is read from start to end without seeking
+    with tarfile.open(tar_file, mode="r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            member_key, field = member.name.split(".", 1)
+            if member_key != key:
+                if sample:
+                    yield sample
+                sample, key = {}, member_key
+
+            sample[field] = tar.extractfile(member).read()
+
+    if sample:
+        yield sample
+
+
+def _shuffle_buffer(samples, buffer_size, rng):
+    """
+    Shuffles a stream of samples with a buffer of buffer_size samples.
+    """
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+
+        index = rng.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = sample
+
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def _field(sample, name):
+    for field, data in sample.items():
+        if field.split(".", 1)[0] == name:
+            return data
+
+    return None
+
+
+@DATASET_REGISTRY.register()
+class TarFlowDataset(BaseDataset, IterableDataset):
+    """
+    Iterable Dataset Class for reading optical flow datasets packed into tar shards by
+    :func:`write_tar_shards`. Every shard is read sequentially from start to end, which suits
+    file systems on which large sequential reads are fast and random accesses to small files
+    are slow. The samples are augmented, cropped and returned like those of the other datasets.
+
+    The shards are split between the distributed processes and the DataLoader workers, so
+    datasets should be written with at least num_replicas x num_workers shards. Otherwise every
+    worker reads all the shards of its process and keeps a part of their samples.
+    With more than one process, every process yields len(dataset) samples per epoch,
+    cycling through its shards if needed, so that the processes run the same number of steps.
+
+    Parameters
+    ----------
+    tar_dir : str
+        path of the directory containing the tar shards
+    is_prediction : bool, default : False
+        If True, only image data are loaded for prediction otherwise both images and flow data are loaded
+    init_seed : bool, default : False
+        If True, sets random seed to worker
+    append_valid_mask : bool, default :  False
+        If True, appends the valid flow mask to the original flow mask at dim=0
+    crop: bool, default : True
+        Whether to perform cropping
+    crop_size : :obj:`tuple` of :obj:`int`
+        The size of the image crop
+    crop_type : :obj:`str`, default : 'center'
+        The type of croppping to be performed, one of "center", "random"
+    augment : bool, default : True
+        If True, applies data augmentation
+    aug_params : :obj:`dict`, optional
+        The parameters for data augmentation
+    norm_params : :obj:`dict`, optional
+        The parameters for normalization
+    flow_offset_params: :obj:`dict`, optional
+        The parameters for adding bilinear interpolated weights surrounding each ground truth flow values.
+    io_params : :obj:`dict`, optional
+        The parameters for reading image and flow files
+    shuffle : bool, default : True
+        If True, the order of the shards is shuffled at every epoch and the samples
+        are shuffled with a buffer
+    shuffle_buffer : int, default : 256
+        Number of samples of the shuffle buffer of every worker
+    seed : int, default : 0
+        Random seed of the order of the shards, shared by the distributed processes
+    num_replicas : int, default : 1
+        Number of distributed processes
+    rank : int, default : 0
+        Rank of the current process
+    """
+
+    @configurable
+    def __init__(
+        self,
+        tar_dir,
+        is_prediction=False,
+        init_seed=False,
+        append_valid_mask=False,
+        crop=False,
+        crop_size=(256, 256),
+        crop_type="center",
+        augment=True,
+        aug_params={
+            "eraser_aug_params": {"enabled": False},
+            "noise_aug_params": {"enabled": False},
+            "flip_aug_params": {"enabled": False},
+            "color_aug_params": {"enabled": False},
+            "spatial_aug_params": {"enabled": False},
+            "advanced_spatial_aug_params": {"enabled": False},
+        },
+        norm_params={"use": False},
+        flow_offset_params={"use": False},
+        io_params={"mmap_flow": False},
+        shuffle=True,
+        shuffle_buffer=256,
+        seed=0,
+        num_replicas=1,
+        rank=0,
+    ):
+        with open(osp.join(tar_dir, TAR_META_FILE)) as f:
+            meta = json.load(f)
+
+        assert (
+            meta["format_version"] == TAR_FORMAT_VERSION
+        ), f"Unsupported tar shard format version: {meta['format_version']}"
+
+        super(TarFlowDataset, self).__init__(
+            init_seed=init_seed,
+            is_prediction=is_prediction,
+            append_valid_mask=append_valid_mask,
+            crop=crop,
+            crop_size=crop_size,
+            crop_type=crop_type,
+            augment=augment,
+            aug_params=aug_params,
+            sparse_transform=meta["sparse_transform"],
+            norm_params=norm_params,
+            flow_offset_params=flow_offset_params,
+            io_params=io_params,
+        )
+
+        self.is_prediction = is_prediction or not meta["has_flow"]
+        self.append_valid_mask = append_valid_mask
+
+        if augment:
+            if self.sparse_transform:
+                self.augmentor = SparseFlowAugmentor(crop_size=crop_size, **aug_params)
+            else:
+                self.augmentor = FlowAugmentor(crop_size=crop_size, **aug_params)
+
+        self.tar_dir = tar_dir
+        self.shard_files = [osp.join(tar_dir, name) for name in meta["shards"]]
+        self.num_samples = meta["num_samples"]
+
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.repeats = 1
+
+    @classmethod
+    def from_config(cls, cfg):
+        return {
+            "tar_dir": cfg.TAR_DIR,
+            "is_prediction": cfg.IS_PREDICTION,
+            "init_seed": cfg.INIT_SEED,
+            "append_valid_mask": cfg.APPEND_VALID_MASK,
+            "crop": cfg.CROP.USE,
+            "crop_size": cfg.CROP.SIZE,
+            "crop_type": cfg.CROP.TYPE,
+            "augment": cfg.AUGMENTATION.USE,
+            "aug_params": cfg.AUGMENTATION.PARAMS,
+            "norm_params": cfg.NORM_PARAMS,
+            "flow_offset_params": cfg.FLOW_OFFSET_PARAMS,
+            "io_params": cfg.get("IO_PARAMS", {"mmap_flow": False}),
+            "shuffle_buffer": cfg.get("SHUFFLE_BUFFER", 256),
+        }
+
+    def set_epoch(self, epoch):
+        """
+        Sets the epoch of the dataset, which determines the order of the shards if shuffle is True.
+
+        Parameters
+        ----------
+        epoch : int
+            The epoch number
+        """
+        self.epoch = epoch
+
+    def _shard_order(self, repeat):
+        order = list(range(len(self.shard_files)))
+        if self.shuffle:
+            # Identical in all the processes, so that they read disjoint shards
+            rng = np.random.default_rng([self.seed, self.epoch, repeat])
+            order = rng.permutation(order).tolist()
+
+        return order
+
+    def _stream_samples(self, stream, n_streams):
+        """
+        Yields the encoded samples of a stream, every DataLoader worker of every process
+        reading a distinct stream of the n_streams streams.
+        """
+        repeat = 0
+        while self.num_replicas > 1 or repeat < self.repeats:
+            order = self._shard_order(repeat)
+            if len(order) >= n_streams:
+                shards, stride = order[stream::n_streams], 1
+            else:
+                shards, stride = order, n_streams
+
+            n_yielded = 0
+            counter = itertools.count()
+            for shard in shards:
+                for sample in _iter_tar_samples(self.shard_files[shard]):
+                    if stride == 1 or next(counter) % stride == stream:
+                        n_yielded += 1
+                        yield sample
+
+            if n_yielded == 0:
+                return
+            repeat += 1
+
+    def _decode_sample(self, sample):
+        # The frames are decoded from their bytes with the decoder of io_params["image_decoder"]
+        decode_image = IMAGE_DECODER_REGISTRY.get(self.image_decoder)
+
+        with profile_stage(self.profiler, "read_image") as stage:
+            img1, img2 = [
+                self._to_rgb(decode_image(_field(sample, name)))
+                for name in ["img1", "img2"]
+            ]
+            stage.output(img1, img2)
+
+        flow, valid = None, None
+        if not self.is_prediction:
+            with profile_stage(self.profiler, "read_flow") as stage:
+                flow = np.load(io.BytesIO(sample["flow.npy"])).astype(np.float32)
+                if "valid.npy" in sample:
+                    valid = np.load(io.BytesIO(sample["valid.npy"]))
+                    valid = valid.astype(np.float32)
+                stage.output(flow, valid)
+
+        return img1, img2, flow, valid
+
+    def __iter__(self):
+        self._init_worker_seed()
+
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id, num_workers = 0, 1
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+
+        samples = self._stream_samples(
+            self.rank * num_workers + worker_id, self.num_replicas * num_workers
+        )
+
+        if self.num_replicas > 1:
+            # Equal number of samples in every process
+            n_samples = len(self)
+            quota = n_samples // num_workers + int(worker_id < n_samples % num_workers)
+            samples = itertools.islice(samples, quota)
+
+        if self.shuffle and self.shuffle_buffer > 1:
+            # Seeded differently in every worker and for every epoch by the DataLoader
+            rng = random.Random(torch.initial_seed())
+            samples = _shuffle_buffer(samples, self.shuffle_buffer, rng)
+
+        for sample in samples:
+            with profile_stage(self.profiler, "sample") as stage:
+                sample = self._process_sample(*self._decode_sample(sample))
+                stage.output(sample)
+
+            yield sample
+
+    def __getitem__(self, index):
+        raise NotImplementedError(
+            "TarFlowDataset is an iterable dataset and does not support indexing"
+        )
+
+    def __rmul__(self, v):
+        """
+        Returns an instance of the dataset which iterates over its shards v times per epoch.
+
+        """
+        self.repeats *= v
+        return self
+
+    def __len__(self):
+        """
+        Return the number of samples of an epoch in the current process.
+
+        """
+        n_samples = self.num_samples * self.repeats
+        if self.num_replicas > 1:
+            return n_samples // self.num_replicas
+
+        return n_samples
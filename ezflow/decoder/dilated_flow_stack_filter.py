@@ -220,10 +220,30 @@ class DCVDilatedFlowStackFilterDecoder(BaseModule):
 
         return F.interpolate(flow, scale_factor=8, mode="bilinear", align_corners=False)
 
-    def forward(self, cost, context, flow_offsets):
+    def forward(self, cost, context, flow_offsets, return_all=False):
+        """
+        Parameters
+        ----------
+        cost : torch.Tensor
+            Dilated cost volume
+        context : :obj:`list` of torch.Tensor
+            Context feature maps of the first image
+        flow_offsets : torch.Tensor
+            Flow offsets of the cost volume
+        return_all : bool, default : False
+            If True, all the filtered flows are upsampled and returned in eval
+            state, as in training, instead of only the final one
+
+        Returns
+        -------
+        :obj:`list` of torch.Tensor
+            Upsampled flows
+        :obj:`list` of torch.Tensor
+            Flow logits
+        """
         flow_logits_list, up_mask_logits_list = self.cost_volume_filter(cost, context)
 
-        if self.training:
+        if self.training or return_all:
             flow_list = []
             for idx, flow_logits_i in enumerate(flow_logits_list):
                 flow_i, _ = self._logits_to_flow(flow_logits_i, flow_offsets)
@@ -1,4 +1,5 @@
 import time
+from collections import OrderedDict
 
 import numpy as np
 import torch
@@ -6,11 +7,46 @@ from torch.nn import DataParallel
 from torch.profiler import profile, record_function
 from tqdm import tqdm
 
-from ..utils import AverageMeter, InputPadder, endpointerror
+from ..data import DeviceDataLoader
+from ..functional import Normalize
+from ..utils import AverageMeter, InputPadder, endpointerror, forward_interpolate
 from .profiler import Profiler
 
 
-def warmup(model, dataloader, device, pad_divisor=1):
+def _images_to_device(img1, img2, device, norm_params=None):
+    """
+    Moves the images to the device. Images loaded as uint8 are converted
+    to float and normalized with norm_params on the device.
+    """
+    img1, img2 = img1.to(device), img2.to(device)
+
+    if img1.dtype == torch.uint8:
+        normalize = Normalize(**(norm_params or {"use": False}))
+        img1, img2 = normalize(img1.float(), img2.float())
+
+    return img1, img2
+
+
+class _PadderCache:
+    """
+    InputPadders of the image sizes met during inference, so that dataloaders whose batches
+    have different image sizes, such as those batched by ezflow.data.BucketBatchSampler,
+    are padded per size instead of with the padder of the first batch.
+    """
+
+    def __init__(self, divisor):
+        self.divisor = divisor
+        self.padders = {}
+
+    def __call__(self, img):
+        size = tuple(img.shape[-2:])
+        if size not in self.padders:
+            self.padders[size] = InputPadder(img.shape, divisor=self.divisor)
+
+        return self.padders[size]
+
+
+def warmup(model, dataloader, device, pad_divisor=1, norm_params=None):
     """Performs an iteration of dataloading and model prediction to warm up CUDA device
 
     Parameters
@@ -23,22 +59,32 @@ def warmup(model, dataloader, device, pad_divisor=1):
         Device (CUDA / CPU) to be used for prediction / inference
     pad_divisor : int, optional
         The divisor to make the image dimensions evenly divisible by using padding, by default 1
+    norm_params : dict, optional
+        The parameters for normalizing images returned as uint8 by the dataloader, on the device
     """
 
     inp, target = next(iter(dataloader))
-    img1, img2 = inp
+    img1, img2 = _images_to_device(*inp, device, norm_params)
 
     padder = InputPadder(img1.shape, divisor=pad_divisor)
     img1, img2 = padder.pad(img1, img2)
 
-    img1, img2 = img1.to(device), img2.to(device)
     for key, val in target.items():
         target[key] = val.to(device)
 
     _ = model(img1, img2)
 
 
-def run_inference(model, dataloader, device, metric_fn, flow_scale=1.0, pad_divisor=1):
+def run_inference(
+    model,
+    dataloader,
+    device,
+    metric_fn,
+    flow_scale=1.0,
+    pad_divisor=1,
+    norm_params=None,
+    warm_start=False,
+):
     """
     Uses a model to perform inference on a dataloader and captures inference time and evaluation metric
 
@@ -56,6 +102,13 @@ def run_inference(model, dataloader, device, metric_fn, flow_scale=1.0, pad_divi
         Scale factor to be applied to the predicted flow
     pad_divisor : int, optional
         The divisor to make the image dimensions evenly divisible by using padding, by default 1
+    norm_params : dict, optional
+        The parameters for normalizing images returned as uint8 by the dataloader, on the device
+    warm_start : bool, optional
+        If True, the flow of every sample is initialized with the forward interpolated low
+        resolution flow of the previous sample of its scene. Requires a model which returns
+        flow_low and accepts flow_init such as RAFT, and a dataloader streaming the scenes
+        with a batch size of 1, see DataloaderCreator(stream_frames=True)
 
     Returns
     -------
@@ -68,29 +121,46 @@ def run_inference(model, dataloader, device, metric_fn, flow_scale=1.0, pad_divi
 
     metric_meter = AverageMeter()
     times = []
+    n_samples = 0
 
-    inp, target = next(iter(dataloader))
-    batch_size = target["flow_gt"].shape[0]
     f1_list = []
-    padder = InputPadder(inp[0].shape, divisor=pad_divisor)
+    get_padder = _PadderCache(pad_divisor)
+
+    # Every DataLoader worker streams its scenes one after the other, so only the flow
+    # of the last scene of every worker is kept
+    loader = getattr(dataloader, "data_loader", dataloader)
+    n_streams = max(getattr(loader, "num_workers", 0), 1)
+    flow_inits = OrderedDict()
 
     with torch.no_grad():
 
         for inp, target in tqdm(dataloader):
 
-            img1, img2 = inp
-            img1, img2 = img1.to(device), img2.to(device)
+            img1, img2 = _images_to_device(*inp, device, norm_params)
             for key, val in target.items():
                 target[key] = val.to(device)
 
+            batch_size = img1.shape[0]
+            n_samples += batch_size
+
+            padder = get_padder(img1)
             img1, img2 = padder.pad(img1, img2)
 
+            kwargs = {}
+            if warm_start:
+                assert (
+                    "scene" in target and batch_size == 1
+                ), "Warm start requires scenes streamed with a batch size of 1"
+                scene = target["scene"].item()
+                if scene in flow_inits:
+                    kwargs["flow_init"] = flow_inits[scene]
+
             if torch.cuda.is_available():
                 torch.cuda.synchronize()
 
             start_time = time.time()
 
-            output = model(img1, img2)
+            output = model(img1, img2, **kwargs)
 
             if torch.cuda.is_available():
                 torch.cuda.synchronize()
@@ -98,6 +168,13 @@ def run_inference(model, dataloader, device, metric_fn, flow_scale=1.0, pad_divi
             end_time = time.time()
             times.append(end_time - start_time)
 
+            # The initialization of the next pair is not part of the inference time
+            if warm_start:
+                flow_inits.pop(scene, None)
+                flow_inits[scene] = forward_interpolate(output["flow_low"])
+                if len(flow_inits) > n_streams:
+                    flow_inits.popitem(last=False)
+
             pred = padder.unpad(output["flow_upsampled"])
             pred = pred * flow_scale
 
@@ -108,8 +185,7 @@ def run_inference(model, dataloader, device, metric_fn, flow_scale=1.0, pad_divi
 
             metric_meter.update(metric, n=batch_size)
 
-    avg_inference_time = sum(times) / len(times)
-    avg_inference_time /= batch_size  # Average inference time per sample
+    avg_inference_time = sum(times) / n_samples  # Average inference time per sample
 
     print("=" * 100)
     if avg_inference_time != 0:
@@ -134,6 +210,7 @@ def profile_inference(
     flow_scale=1.0,
     count_params=False,
     pad_divisor=1,
+    norm_params=None,
 ):
     """
     Uses a model to perform inference on a dataloader and profiles model characteristics such as memory usage, inference time, and evaluation metric
@@ -156,6 +233,8 @@ def profile_inference(
         Flag to indicate whether to count model parameters
     pad_divisor : int, optional
         The divisor to make the image dimensions evenly divisible by using padding, by default 1
+    norm_params : dict, optional
+        The parameters for normalizing images returned as uint8 by the dataloader, on the device
 
     Returns
     -------
@@ -167,11 +246,10 @@ def profile_inference(
 
     metric_meter = AverageMeter()
     times = []
+    n_samples = 0
 
-    inp, target = next(iter(dataloader))
-    batch_size = target["flow_gt"].shape[0]
-
-    padder = InputPadder(inp[0].shape, divisor=pad_divisor)
+    f1_list = []
+    get_padder = _PadderCache(pad_divisor)
 
     with profile(
         activities=profiler.activites,
@@ -185,11 +263,14 @@ def profile_inference(
 
             for inp, target in dataloader:
 
-                img1, img2 = inp
-                img1, img2 = img1.to(device), img2.to(device)
+                img1, img2 = _images_to_device(*inp, device, norm_params)
                 for key, val in target.items():
                     target[key] = val.to(device)
 
+                batch_size = img1.shape[0]
+                n_samples += batch_size
+
+                padder = get_padder(img1)
                 img1, img2 = padder.pad(img1, img2)
 
                 if torch.cuda.is_available():
@@ -239,8 +320,8 @@ def profile_inference(
         )
     )
 
-    avg_inference_time = 0 if len(times) == 0 else sum(times) / len(times)
-    avg_inference_time /= batch_size  # Average inference time per sample
+    # Average inference time per sample
+    avg_inference_time = 0 if n_samples == 0 else sum(times) / n_samples
     fps = 0 if avg_inference_time == 0 else 1 / avg_inference_time
     n_params = sum(p.numel() for p in model.parameters())
 
@@ -262,6 +343,8 @@ def eval_model(
     profiler=None,
     flow_scale=1.0,
     pad_divisor=1,
+    norm_params=None,
+    warm_start=False,
 ):
     """
     Evaluates a model on a dataloader and optionally profiles model characteristics such as memory usage, inference time, and evaluation metric
@@ -282,6 +365,11 @@ def eval_model(
         Scale factor to be applied to the predicted flow
     pad_divisor : int, optional
         The divisor to make the image dimensions evenly divisible by using padding, by default 1
+    norm_params : dict, optional
+        The parameters for normalizing images returned as uint8 by the dataloader, on the device
+    warm_start : bool, optional
+        If True, the flow of every sample is initialized with the flow of the previous sample
+        of its scene, see run_inference. Not supported with a profiler.
 
     Returns
     -------
@@ -320,9 +408,12 @@ def eval_model(
     model = model.to(device)
     model.eval()
 
+    # Batches are copied to the device while the model processes the previous batch
+    dataloader = DeviceDataLoader(dataloader, device)
+
     metric_fn = metric or endpointerror
 
-    warmup(model, dataloader, device, pad_divisor=pad_divisor)
+    warmup(model, dataloader, device, pad_divisor=pad_divisor, norm_params=norm_params)
     if torch.cuda.is_available():
         torch.cuda.synchronize()
 
@@ -334,8 +425,11 @@ def eval_model(
             metric_fn,
             flow_scale=flow_scale,
             pad_divisor=pad_divisor,
+            norm_params=norm_params,
+            warm_start=warm_start,
         )
     else:
+        assert not warm_start, "Warm start is not supported with a profiler"
         metric_meter, _ = profile_inference(
             model,
             dataloader,
@@ -344,6 +438,7 @@ def eval_model(
             profiler,
             flow_scale=flow_scale,
             pad_divisor=pad_divisor,
+            norm_params=norm_params,
         )
 
     print(f"Average evaluation metric = {metric_meter.avg}")
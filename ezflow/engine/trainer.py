@@ -1,4 +1,5 @@
 import os
+import random
 import time
 from copy import deepcopy
 from datetime import timedelta
@@ -13,9 +14,10 @@ from torch.cuda.amp import GradScaler, autocast
 from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.utils.tensorboard import SummaryWriter
 
-from ezflow.data import DataloaderCreator
+from ezflow.data import DataloaderCreator, DeviceDataLoader, sample_cache_stats
 
 from ..functional import FUNCTIONAL_REGISTRY
+from ..models import RAFT, VCN
 from ..utils import AverageMeter, endpointerror, find_free_port, is_port_available
 from .registry import loss_functions, optimizers, schedulers
 
@@ -43,6 +45,12 @@ class BaseTrainer:
 
         self.train_loader = None
         self.val_loader = None
+        self.val_loader_creator = None
+        self.batch_augmentor = None
+        self.train_normalize = None
+        self.val_normalize = None
+        self.sampler_state = None
+        self._epoch_batches = 0
 
         self.device = None
         self._trainer = None
@@ -62,6 +70,14 @@ class BaseTrainer:
         raise NotImplementedError
 
     def _setup_training(self, rank=0, loss_fn=None, optimizer=None, scheduler=None):
+        # Batches are copied to the device ahead of the step which uses them
+        if not isinstance(self.train_loader, DeviceDataLoader):
+            self.train_loader = DeviceDataLoader(self.train_loader, self.device)
+        if self.val_loader is not None and not isinstance(
+            self.val_loader, DeviceDataLoader
+        ):
+            self.val_loader = DeviceDataLoader(self.val_loader, self.device)
+
         self._trainer = self._epoch_trainer
         if self.cfg.NUM_STEPS is not None:
             self._trainer = self._step_trainer
@@ -144,6 +160,15 @@ class BaseTrainer:
             else:
                 self.model.freeze_batch_norm()
 
+    def _set_epoch(self, epoch):
+        # Iterable datasets, such as those read from tar shards, order their samples themselves
+        if hasattr(self.train_loader.sampler, "set_epoch"):
+            self.train_loader.sampler.set_epoch(epoch)
+
+        for dataset in getattr(self.train_loader.dataset, "datasets", []):
+            if hasattr(dataset, "set_epoch"):
+                dataset.set_epoch(epoch)
+
     def _epoch_trainer(self, n_epochs=None, start_epoch=None):
         self.model.train()
         self._freeze_bn()
@@ -163,8 +188,7 @@ class BaseTrainer:
             print(f"\nEpoch {epoch+1} of {start_epoch+n_epochs}")
             print("-" * 80)
 
-            if self.model_parallel:
-                self.train_loader.sampler.set_epoch(epoch)
+            self._set_epoch(epoch)
 
             loss_meter.reset()
             for iteration, (inp, target) in enumerate(self.train_loader):
@@ -221,10 +245,17 @@ class BaseTrainer:
             start_step = total_steps = 1
             n_steps += start_step
 
-        if self.model_parallel:
-            epoch = 0
-            self.train_loader.sampler.set_epoch(epoch)
+        sampler = self.train_loader.sampler
+        epoch = 0
+        if self.sampler_state is not None and hasattr(sampler, "load_state_dict"):
+            # Continue the epoch of the checkpoint after its last consumed batch
+            sampler.load_state_dict(self.sampler_state)
+            epoch = self.sampler_state["epoch"]
+            self.sampler_state = None
+        else:
+            self._set_epoch(epoch)
 
+        self._epoch_batches = 0
         train_iter = iter(self.train_loader)
 
         print(f"\nStarting step {total_steps} of {n_steps}")
@@ -232,16 +263,18 @@ class BaseTrainer:
         for step in range(start_step, n_steps):
             try:
                 inp, target = next(train_iter)
-            except:
-                if self.model_parallel:
-                    epoch += 1
-                    self.train_loader.sampler.set_epoch(epoch)
+            except StopIteration:
+                epoch += 1
+                self._set_epoch(epoch)
 
                 # Handle exception if there is no data
                 # left in train iterator to continue training.
+                self._epoch_batches = 0
                 train_iter = iter(self.train_loader)
                 inp, target = next(train_iter)
 
+            self._epoch_batches += 1
+
             loss = self._run_step(inp, target, current_iter=step)
             loss_meter.update(loss.item())
 
@@ -267,7 +300,13 @@ class BaseTrainer:
             self.writer.close()
 
     def _run_step(self, inp, target, **kwargs):
-        inp, target = self._to_device(inp, target)
+        # The batch augmentor normalizes the images after the color augmentations
+        normalize = self.train_normalize if self.batch_augmentor is None else None
+        inp, target = self._to_device(inp, target, normalize=normalize)
+
+        if self.batch_augmentor is not None:
+            inp, target = self.batch_augmentor.augment_batch(inp, target)
+
         img1, img2 = inp
 
         if self._is_main_process():
@@ -298,9 +337,15 @@ class BaseTrainer:
 
         return loss
 
-    def _to_device(self, inp, target):
+    def _to_device(self, inp, target, normalize=None):
         img1, img2 = inp
-        inp = (img1.to(self.device), img2.to(self.device))
+        img1, img2 = img1.to(self.device), img2.to(self.device)
+
+        if img1.dtype == torch.uint8 and normalize is not None:
+            # Images loaded as uint8 are converted and normalized on the device
+            img1, img2 = normalize(img1.float(), img2.float())
+
+        inp = (img1, img2)
 
         for key, val in target.items():
             target[key] = val.to(self.device)
@@ -319,21 +364,47 @@ class BaseTrainer:
                     loss_meter.val,
                     total_iters,
                 )
+                self._log_sample_cache(total_iters)
+
+    def _log_sample_cache(self, total_iters):
+        cache_stats = sample_cache_stats(self.train_loader.dataset)
+        if cache_stats is None:
+            return
+
+        for key in ["hits", "misses", "hit_rate", "bytes"]:
+            self.writer.add_scalar(f"sample_cache_{key}", cache_stats[key], total_iters)
+
+    def _get_val_loader(self):
+        # The validation datasets are indexed and loaded on the first validation
+        if self.val_loader is None:
+            self.val_loader = DeviceDataLoader(
+                self.val_loader_creator.get_dataloader(), self.device
+            )
+            self.val_normalize = self.val_loader_creator.normalize
+
+        return self.val_loader
 
     def _validate_model(self, iter_type, iterations, **kwargs):
         self.model.eval()
         metric_meter = AverageMeter()
         loss_meter = AverageMeter()
 
+        # RAFT and VCN only return their final flow in eval state unless
+        # return_all is True, the validation loss is kept over all their flows
+        model = self.model.module if self.model_parallel else self.model
+        forward_kwargs = {}
+        if isinstance(model, (RAFT, VCN)):
+            forward_kwargs["return_all"] = True
+
         with torch.no_grad():
-            for inp, target in self.val_loader:
-                inp, target = self._to_device(inp, target)
+            for inp, target in self._get_val_loader():
+                inp, target = self._to_device(inp, target, normalize=self.val_normalize)
                 img1, img2 = inp
 
                 if self.model_parallel:
-                    output = self.model.module(img1, img2)
+                    output = self.model.module(img1, img2, **forward_kwargs)
                 else:
-                    output = self.model(img1, img2)
+                    output = self.model(img1, img2, **forward_kwargs)
 
                 loss = self.loss_fn(**output, **target, **kwargs)
 
@@ -386,6 +457,25 @@ class BaseTrainer:
         if self.scheduler is not None:
             consolidated_save_dict["scheduler_state_dict"] = self.scheduler.state_dict()
 
+        sampler = self.train_loader.sampler
+        if ckpt_type == "step" and hasattr(sampler, "state_dict"):
+            # Position of the data in the epoch, from which the seeds of the
+            # data loader workers are also derived
+            consolidated_save_dict["sampler_state_dict"] = sampler.state_dict(
+                consumed=self._epoch_batches * self.train_loader.batch_size
+            )
+
+        # The state of the numpy generator is stored as a tensor to be loadable with weights_only
+        np_state = np.random.get_state()
+        consolidated_save_dict["rng_state"] = {
+            "torch": torch.get_rng_state(),
+            "numpy": (np_state[0], torch.from_numpy(np_state[1].astype(np.int64)))
+            + np_state[2:],
+            "random": random.getstate(),
+        }
+        if torch.cuda.is_available():
+            consolidated_save_dict["rng_state"]["cuda"] = torch.cuda.get_rng_state_all()
+
         torch.save(
             consolidated_save_dict,
             os.path.join(
@@ -440,6 +530,7 @@ class BaseTrainer:
 
         self._setup_device()
 
+        rng_state = None
         consolidated_ckpt = (
             self.cfg.RESUME_TRAINING.CONSOLIDATED_CKPT
             if use_cfg is True
@@ -462,6 +553,11 @@ class BaseTrainer:
             if "step" in ckpt.keys():
                 start_iteration = ckpt["step"] + 1
 
+            if "sampler_state_dict" in ckpt.keys():
+                self.sampler_state = ckpt["sampler_state_dict"]
+
+            rng_state = ckpt.get("rng_state", None)
+
         else:
 
             assert (
@@ -503,8 +599,21 @@ class BaseTrainer:
                 else self.cfg.RESUME_TRAINING.START_EPOCH
             )
 
+        if rng_state is not None:
+            self._set_rng_state(rng_state)
+
         return (total_iterations, start_iteration)
 
+    def _set_rng_state(self, rng_state):
+        torch.set_rng_state(rng_state["torch"].cpu())
+        np_state = rng_state["numpy"]
+        np.random.set_state(
+            (np_state[0], np_state[1].cpu().numpy().astype(np.uint32)) + np_state[2:]
+        )
+        random.setstate(rng_state["random"])
+        if "cuda" in rng_state and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all([state.cpu() for state in rng_state["cuda"]])
+
     def resume_training(
         self,
         consolidated_ckpt=None,
@@ -594,7 +703,13 @@ class Trainer(BaseTrainer):
         val_loader_creator.distributed = False
 
         self.train_loader = train_loader_creator.get_dataloader()
-        self.val_loader = val_loader_creator.get_dataloader()
+        self.train_normalize = train_loader_creator.normalize
+
+        # The validation dataloader is created on the first validation
+        self.val_loader_creator = val_loader_creator
+
+        if train_loader_creator.batch_augment_on_device:
+            self.batch_augmentor = train_loader_creator.batch_augmentor
 
     def _setup_device(self):
 
@@ -703,10 +818,13 @@ class DistributedTrainer(BaseTrainer):
         self.val_loader = None
 
         self.train_loader_creator = train_loader_creator
+        if train_loader_creator.batch_augment_on_device:
+            self.batch_augmentor = train_loader_creator.batch_augmentor
 
         # Validate model only on the main process.
+        # The validation dataloader is created on the first validation.
         val_loader_creator.distributed = False
-        self.val_loader = val_loader_creator.get_dataloader()
+        self.val_loader_creator = val_loader_creator
 
         self._validate_ddp_config()
 
@@ -805,6 +923,7 @@ class DistributedTrainer(BaseTrainer):
         self._setup_ddp(rank)
         self._setup_model(rank)
         self.train_loader = self.train_loader_creator.get_dataloader(rank=rank)
+        self.train_normalize = self.train_loader_creator.normalize
 
         self._setup_training(
             rank=rank, loss_fn=loss_fn, optimizer=optimizer, scheduler=scheduler
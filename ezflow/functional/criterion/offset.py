@@ -64,21 +64,69 @@ class OffsetCrossEntropyLoss(nn.Module):
             "max_iter": cfg.MAX_ITER,
         }
 
-    def __compute_loss(self, flow_logits, offset_labs, valid):
+    def __compute_loss(
+        self, flow_logits, offset_labs, valid, offset_idxs, offset_weights
+    ):
         # exlude invalid pixels and extremely large diplacements()
         valid = torch.squeeze(valid, dim=1)
         valid = valid[:, :: self.stride, :: self.stride]
         valid = valid >= 0.5
 
-        logprobs = F.log_softmax(flow_logits, dim=1)
-        loss = -(offset_labs * logprobs).sum(dim=1)
+        if offset_idxs is not None:
+            # log-probabilities of the (at most) four labels with a non-zero weight
+            logprobs = flow_logits.gather(1, offset_idxs) - torch.logsumexp(
+                flow_logits, dim=1, keepdim=True
+            )
+            loss = -(offset_weights * logprobs).sum(dim=1)
+        else:
+            logprobs = F.log_softmax(flow_logits, dim=1)
+            loss = -(offset_labs * logprobs).sum(dim=1)
+
         loss = (valid[:, None] * loss).mean()
         return loss
 
-    def forward(self, flow_logits_list, offset_labs, valid, current_iter, **kwargs):
+    def forward(
+        self,
+        flow_logits_list,
+        offset_labs,
+        valid,
+        current_iter,
+        offset_idxs=None,
+        offset_weights=None,
+        **kwargs,
+    ):
+        """
+        Parameters
+        -----------
+        flow_logits_list : List[torch.Tensor]
+            Logits of shape N x (D * O * O) x H x W
+        offset_labs : torch.Tensor or None
+            Dense bilinear interpolation weights of shape N x (D * O * O) x H x W.
+            May be None if offset_idxs and offset_weights are provided.
+        valid : torch.Tensor
+            Valid mask of the full resolution flow
+        current_iter : int
+            Current training iteration
+        offset_idxs : torch.Tensor, optional
+            Indices of the non-zero bilinear interpolation weights of shape N x 4 x H x W.
+            Used instead of offset_labs if provided.
+        offset_weights : torch.Tensor, optional
+            Non-zero bilinear interpolation weights of shape N x 4 x H x W
+
+        Returns
+        --------
+        torch.Tensor
+            The annealed cross entropy loss
+        """
+        assert (
+            offset_labs is not None or offset_idxs is not None
+        ), "Either offset_labs or offset_idxs and offset_weights are required."
+
         logit_loss = 0.0
         for i, flow_logits in enumerate(flow_logits_list):
-            loss = self.__compute_loss(flow_logits, offset_labs, valid)
+            loss = self.__compute_loss(
+                flow_logits, offset_labs, valid, offset_idxs, offset_weights
+            )
             logit_loss += (self.weight_annealers[i](current_iter)) * loss
 
         return logit_loss
@@ -152,14 +200,25 @@ class FlowOffsetLoss(nn.Module):
         flow_logits,
         flow_gt,
         valid,
-        offset_labs,
-        current_iter,
+        offset_labs=None,
+        current_iter=None,
+        offset_idxs=None,
+        offset_weights=None,
         **kwargs,
     ):
+        # offset_labs may be omitted when the targets hold offset_idxs and offset_weights,
+        # which OffsetCrossEntropyLoss checks, but the annealing needs current_iter
+        assert current_iter is not None, "current_iter is required"
 
         flow_loss = self.l1_loss(flow_preds, flow_gt, valid)
         logit_loss = self.cross_entropy_loss(
-            flow_logits, offset_labs, valid, current_iter, **kwargs
+            flow_logits,
+            offset_labs,
+            valid,
+            current_iter,
+            offset_idxs=offset_idxs,
+            offset_weights=offset_weights,
+            **kwargs,
         )
 
         self.flow_loss_meter.update(flow_loss.item())
@@ -1,2 +1,3 @@
 from .augmentor import FlowAugmentor, SparseFlowAugmentor
+from .batch_augmentor import BatchFlowAugmentor
 from .operations import *
@@ -1,3 +1,4 @@
+from ...utils import profile_stage
 from ..registry import FUNCTIONAL_REGISTRY
 from .operations import *
 
@@ -79,6 +80,9 @@ class FlowAugmentor:
             self.spatial_aug_params["enabled"] = False
             self.flip_aug_params["h_flip_prob"] = 0.0
 
+        # Records the time of every augmentation if set, see BaseDataset.set_profiler
+        self.profiler = None
+
     def __call__(self, img1, img2, flow, valid=None):
         """
         Applies the augmentations to the pair of images and the flow field.
@@ -106,18 +110,27 @@ class FlowAugmentor:
             None object
         """
 
-        img1, img2 = color_transform(img1, img2, **self.color_aug_params)
+        with profile_stage(self.profiler, "color_transform"):
+            img1, img2 = color_transform(img1, img2, **self.color_aug_params)
 
-        img1, img2, flow = self.advanced_spatial_transform(img1, img2, flow)
+        with profile_stage(self.profiler, "advanced_spatial_transform"):
+            img1, img2, flow = self.advanced_spatial_transform(img1, img2, flow)
 
-        img1, img2, flow = spatial_transform(
-            img1, img2, flow, self.crop_size, **self.spatial_aug_params
-        )
+        with profile_stage(self.profiler, "spatial_transform"):
+            img1, img2, flow = spatial_transform(
+                img1, img2, flow, self.crop_size, **self.spatial_aug_params
+            )
 
-        img1, img2, flow, _ = flip_transform(img1, img2, flow, **self.flip_aug_params)
+        with profile_stage(self.profiler, "flip_transform"):
+            img1, img2, flow, _ = flip_transform(
+                img1, img2, flow, **self.flip_aug_params
+            )
 
-        img1, img2 = noise_transform(img1, img2, **self.noise_aug_params)
-        img1, img2 = eraser_transform(img1, img2, **self.eraser_aug_params)
+        with profile_stage(self.profiler, "noise_transform"):
+            img1, img2 = noise_transform(img1, img2, **self.noise_aug_params)
+
+        with profile_stage(self.profiler, "eraser_transform"):
+            img1, img2 = eraser_transform(img1, img2, **self.eraser_aug_params)
 
         img1 = np.ascontiguousarray(img1)
         img2 = np.ascontiguousarray(img2)
@@ -171,15 +184,21 @@ class SparseFlowAugmentor(FlowAugmentor):
         valid : numpy.ndarray
             Valid Flow field
         """
-        img1, img2 = color_transform(img1, img2, **self.color_aug_params)
-        img1, img2 = eraser_transform(img1, img2, **self.eraser_aug_params)
-        img1, img2, flow, valid = sparse_spatial_transform(
-            img1, img2, flow, valid, self.crop_size, **self.spatial_aug_params
-        )
+        with profile_stage(self.profiler, "color_transform"):
+            img1, img2 = color_transform(img1, img2, **self.color_aug_params)
 
-        img1, img2, flow, valid = flip_transform(
-            img1, img2, flow, valid, **self.flip_aug_params
-        )
+        with profile_stage(self.profiler, "eraser_transform"):
+            img1, img2 = eraser_transform(img1, img2, **self.eraser_aug_params)
+
+        with profile_stage(self.profiler, "sparse_spatial_transform"):
+            img1, img2, flow, valid = sparse_spatial_transform(
+                img1, img2, flow, valid, self.crop_size, **self.spatial_aug_params
+            )
+
+        with profile_stage(self.profiler, "flip_transform"):
+            img1, img2, flow, valid = flip_transform(
+                img1, img2, flow, valid, **self.flip_aug_params
+            )
 
         img1 = np.ascontiguousarray(img1)
         img2 = np.ascontiguousarray(img2)
@@ -0,0 +1,434 @@
+import torch
+import torch.nn.functional as F
+
+from ..registry import FUNCTIONAL_REGISTRY
+from .operations import Normalize
+
+# Order of the color jitter operations, permuted for every image as in torchvision's ColorJitter
+_BRIGHTNESS, _CONTRAST, _SATURATION, _HUE = range(4)
+
+
+def _uniform(low, high, n, device):
+    return low + (high - low) * torch.rand(n, device=device)
+
+
+def _grayscale(img):
+    # ITU-R 601-2 luma transform used by PIL
+    return (0.299 * img[:, 0] + 0.587 * img[:, 1] + 0.114 * img[:, 2]).unsqueeze(1)
+
+
+def _rgb_to_hsv(img):
+    r, g, b = img.unbind(1)
+    max_c, max_idx = img.max(dim=1)
+    min_c, _ = img.min(dim=1)
+    delta = max_c - min_c
+
+    s = delta / max_c.clamp(min=1e-8)
+    delta_div = torch.where(delta > 0, delta, torch.ones_like(delta))
+
+    # hue sector of the largest channel, red first on ties
+    h = torch.stack(((g - b), 2.0 * delta + (b - r), 4.0 * delta + (r - g)), dim=1)
+    h = h.gather(1, max_idx[:, None]).squeeze(1) / delta_div
+    h = (h / 6.0) % 1.0
+
+    return torch.stack((h, s, max_c), dim=1)
+
+
+def _hsv_to_rgb(img):
+    h, s, v = img[:, 0:1], img[:, 1:2], img[:, 2:3]
+    n = torch.tensor([5.0, 3.0, 1.0], device=img.device).view(1, 3, 1, 1)
+    k = (n + h * 6.0) % 6.0
+    return v - v * s * torch.minimum(k, 4.0 - k).clamp(0.0, 1.0)
+
+
+@FUNCTIONAL_REGISTRY.register()
+class BatchFlowAugmentor:
+    """
+    Class for applying a series of augmentations to a collated batch of image pairs and flow fields
+    with torch operations. Every sample of the batch gets its own random parameters so that the
+    statistics of the augmentations match :class:`FlowAugmentor` followed by a random crop.
+    The augmentations run on the device of the inputs, either in the DataLoader after collation
+    or on the training device.
+
+    The spatial scale and stretch, the flips and the random crop are folded into a single
+    affine sampling grid per sample and applied with one grid_sample call. The color jitter,
+    noise and eraser augmentations are then applied to the crops with the parameter
+    distributions of :class:`FlowAugmentor`, the eraser rectangles being placed over
+    the uncropped image.
+
+    Parameters
+    ----------
+    crop_size : :obj:`list` of :obj:`int`
+        Size of the crop returned by the augmentor
+    eraser_aug_params : dict
+        Parameters for the eraser augmentation.
+    noise_aug_params : dict
+        Parameters for the noise augmentation.
+    flip_aug_params : dict
+        Parameters for the flip augmentation.
+    color_aug_params : dict
+        Parameters for the color augmentation.
+    spatial_aug_params : dict
+        Parameters for the spatial augmentation.
+    advanced_spatial_aug_params : dict
+        Not supported by the batched augmentor, must be disabled.
+    sparse_transform : bool, default : False
+        If True, the flow and valid mask are resampled with nearest neighbour interpolation
+    norm_params : :obj:`dict`, optional
+        The parameters for normalizing the augmented images
+    """
+
+    def __init__(
+        self,
+        crop_size,
+        eraser_aug_params={"enabled": False, "aug_prob": 0.5, "bounds": [50, 100]},
+        noise_aug_params={"enabled": False, "aug_prob": 0.5, "noise_std_range": 0.06},
+        flip_aug_params={"enabled": False, "h_flip_prob": 0.5, "v_flip_prob": 0.1},
+        color_aug_params={
+            "enabled": False,
+            "asymmetric_color_aug_prob": 0.2,
+            "brightness": 0.4,
+            "contrast": 0.4,
+            "saturation": 0.4,
+            "hue": 0.15915494309189535,
+        },
+        spatial_aug_params={
+            "enabled": False,
+            "aug_prob": 0.8,
+            "stretch_prob": 0.8,
+            "min_scale": -0.1,
+            "max_scale": 1.0,
+            "max_stretch": 0.2,
+        },
+        advanced_spatial_aug_params={"enabled": False},
+        sparse_transform=False,
+        norm_params={"use": False},
+    ):
+        assert not advanced_spatial_aug_params.get(
+            "enabled", False
+        ), "Advanced spatial augmentations are not supported by BatchFlowAugmentor."
+
+        self.crop_size = crop_size
+        self.color_aug_params = color_aug_params
+        self.eraser_aug_params = eraser_aug_params
+        self.spatial_aug_params = spatial_aug_params
+        self.noise_aug_params = noise_aug_params
+        self.flip_aug_params = flip_aug_params
+        self.sparse_transform = sparse_transform
+        self.normalize = Normalize(**norm_params)
+
+    def _color_transform(self, img1, img2):
+        params = self.color_aug_params
+        n, device = img1.shape[0], img1.device
+
+        brightness = params.get("brightness", 0.4)
+        contrast = params.get("contrast", 0.4)
+        saturation = params.get("saturation", 0.4)
+        hue = params.get("hue", 0.5 / 3.14)
+
+        # Both images of a pair share the jitter parameters unless asymmetric jitter is sampled
+        asymmetric = torch.rand(n, device=device) < params.get(
+            "asymmetric_color_aug_prob", 0.2
+        )
+        asymmetric = torch.cat((torch.zeros_like(asymmetric), asymmetric))
+
+        def sample(low, high):
+            values = _uniform(low, high, n, device).repeat(2)
+            return torch.where(asymmetric, _uniform(low, high, 2 * n, device), values)
+
+        factors = [
+            sample(max(0, 1 - brightness), 1 + brightness),
+            sample(max(0, 1 - contrast), 1 + contrast),
+            sample(max(0, 1 - saturation), 1 + saturation),
+            sample(-hue, hue),
+        ]
+        order = torch.rand(n, 4, device=device).argsort(dim=1).repeat(2, 1)
+        order = torch.where(
+            asymmetric[:, None],
+            torch.rand(2 * n, 4, device=device).argsort(dim=1),
+            order,
+        )
+
+        imgs = torch.cat((img1, img2))
+        for position in range(4):
+            # The contrast mean is taken over both images of a symmetric pair,
+            # as PIL jitters the vertically stacked pair in that case.
+            mean = _grayscale(imgs).mean(dim=(1, 2, 3))
+            pair_mean = (mean[:n] + mean[n:]).repeat(2) / 2
+            mean = torch.where(asymmetric, mean, pair_mean)
+
+            for op in range(4):
+                idx = torch.nonzero(order[:, position] == op).squeeze(1)
+                if len(idx) == 0:
+                    continue
+
+                img = imgs[idx]
+                factor = factors[op][idx].view(-1, 1, 1, 1)
+
+                if op == _BRIGHTNESS:
+                    img = img * factor
+                elif op == _CONTRAST:
+                    img = factor * img + (1 - factor) * mean[idx].view(-1, 1, 1, 1)
+                elif op == _SATURATION:
+                    img = factor * img + (1 - factor) * _grayscale(img)
+                else:
+                    hsv = _rgb_to_hsv(img.clamp(0, 255) / 255.0)
+                    hsv[:, 0] = (hsv[:, 0] + factor[:, 0]) % 1.0
+                    img = _hsv_to_rgb(hsv) * 255.0
+
+                imgs[idx] = img.clamp(0, 255)
+
+        return imgs[:n], imgs[n:]
+
+    def _spatial_params(self, n, h, w, device):
+        params = self.spatial_aug_params
+        scale_x = torch.ones(n, device=device)
+        scale_y = torch.ones(n, device=device)
+
+        if params.get("enabled", False):
+            max_stretch = params.get("max_stretch", 0.2)
+
+            scale = 2 ** _uniform(
+                params.get("min_scale", -0.2), params.get("max_scale", 0.5), n, device
+            )
+            stretch = torch.rand(n, device=device) < params.get("stretch_prob", 0.8)
+            stretch_x = 2 ** _uniform(-max_stretch, max_stretch, n, device)
+            stretch_y = 2 ** _uniform(-max_stretch, max_stretch, n, device)
+
+            min_scale = max(
+                (self.crop_size[0] + 8) / float(h), (self.crop_size[1] + 8) / float(w)
+            )
+            aug = torch.rand(n, device=device) < params.get("aug_prob", 0.8)
+
+            scale_x = torch.where(stretch, scale * stretch_x, scale).clamp(
+                min=min_scale
+            )
+            scale_y = torch.where(stretch, scale * stretch_y, scale).clamp(
+                min=min_scale
+            )
+            scale_x = torch.where(aug, scale_x, torch.ones_like(scale_x))
+            scale_y = torch.where(aug, scale_y, torch.ones_like(scale_y))
+
+        h_flip = torch.zeros(n, dtype=torch.bool, device=device)
+        v_flip = torch.zeros(n, dtype=torch.bool, device=device)
+        if self.flip_aug_params.get("enabled", False):
+            h_flip = torch.rand(n, device=device) < self.flip_aug_params.get(
+                "h_flip_prob", 0.5
+            )
+            v_flip = torch.rand(n, device=device) < self.flip_aug_params.get(
+                "v_flip_prob", 0.1
+            )
+
+        return scale_x, scale_y, h_flip, v_flip
+
+    def _sampling_grid(self, scale, flip, size, crop_size, device):
+        """
+        Returns the normalized source coordinates of the crop along one axis,
+        the size of the scaled image and the crop offsets.
+        """
+        n = scale.shape[0]
+        scaled_size = torch.round(size * scale)
+        max_offset = (scaled_size - crop_size).clamp(min=0)
+        offset = torch.floor(torch.rand(n, device=device) * max_offset)
+
+        pos = offset[:, None] + torch.arange(crop_size, device=device)[None]
+        pos = torch.where(flip[:, None], scaled_size[:, None] - 1 - pos, pos)
+
+        # pixel centers of the scaled image, mapped as by cv2.resize with align_corners=False
+        grid = 2 * (pos + 0.5) / (scale[:, None] * size) - 1
+
+        return grid, scaled_size, offset
+
+    def _spatial_transform(self, img1, img2, flow, valid):
+        n, _, h, w = img1.shape
+        ch, cw = self.crop_size
+        device = img1.device
+
+        scale_x, scale_y, h_flip, v_flip = self._spatial_params(n, h, w, device)
+
+        grid_x, scaled_w, offset_x = self._sampling_grid(scale_x, h_flip, w, cw, device)
+        grid_y, scaled_h, offset_y = self._sampling_grid(scale_y, v_flip, h, ch, device)
+
+        grid = torch.stack(
+            (
+                grid_x[:, None, :].expand(n, ch, cw),
+                grid_y[:, :, None].expand(n, ch, cw),
+            ),
+            dim=-1,
+        )
+
+        if self.sparse_transform:
+            imgs = F.grid_sample(
+                torch.cat((img1, img2), dim=1),
+                grid,
+                mode="bilinear",
+                padding_mode="border",
+                align_corners=False,
+            )
+            targets = F.grid_sample(
+                torch.cat((flow, valid), dim=1),
+                grid,
+                mode="nearest",
+                padding_mode="zeros",
+                align_corners=False,
+            )
+            img1, img2 = imgs[:, :3], imgs[:, 3:]
+        else:
+            inputs = [img1, img2, flow] + ([valid] if valid is not None else [])
+            outputs = F.grid_sample(
+                torch.cat(inputs, dim=1),
+                grid,
+                mode="bilinear",
+                padding_mode="border",
+                align_corners=False,
+            )
+            img1, img2, targets = outputs[:, :3], outputs[:, 3:6], outputs[:, 6:]
+
+        flow = targets[:, :2]
+        if valid is not None:
+            valid = (targets[:, 2:] >= 0.5).to(targets.dtype)
+
+        sign_x = torch.where(h_flip, -scale_x, scale_x)
+        sign_y = torch.where(v_flip, -scale_y, scale_y)
+        flow = flow * torch.stack((sign_x, sign_y), dim=1)[:, :, None, None]
+
+        if self.sparse_transform:
+            flow = flow * valid
+
+        crop_box = (offset_x, offset_y, scaled_w, scaled_h)
+        return img1, img2, flow, valid, crop_box
+
+    def _noise_transform(self, img1, img2):
+        params = self.noise_aug_params
+        n, device = img1.shape[0], img1.device
+
+        aug = torch.rand(n, device=device) < params.get("aug_prob", 0.5)
+        std = _uniform(0, params.get("noise_std_range", 0.06) * 255.0, n, device)
+        std = (std * aug).view(-1, 1, 1, 1)
+
+        img1 = (img1 + torch.randn_like(img1) * std).clamp(0.0, 255.0)
+        img2 = (img2 + torch.randn_like(img2) * std).clamp(0.0, 255.0)
+
+        return img1, img2
+
+    def _eraser_transform(self, img2, mean_color, crop_box):
+        params = self.eraser_aug_params
+        n, _, h, w = img2.shape
+        device = img2.device
+        low, high = params.get("bounds", [50, 100])
+        offset_x, offset_y, scaled_w, scaled_h = crop_box
+
+        aug = torch.rand(n, device=device) < params.get("aug_prob", 0.5)
+        # one or two rectangles per image, placed uniformly over the uncropped image
+        n_rects = torch.randint(1, 3, (n,), device=device)
+
+        xs = torch.arange(w, device=device)[None, None, :]
+        ys = torch.arange(h, device=device)[None, :, None]
+
+        mask = torch.zeros((n, h, w), dtype=torch.bool, device=device)
+        for i in range(2):
+            x0 = torch.floor(torch.rand(n, device=device) * scaled_w) - offset_x
+            y0 = torch.floor(torch.rand(n, device=device) * scaled_h) - offset_y
+            dx = torch.randint(low, high, (n,), device=device)
+            dy = torch.randint(low, high, (n,), device=device)
+
+            active = (aug & (n_rects > i)).view(-1, 1, 1)
+            x0, y0 = x0.view(-1, 1, 1), y0.view(-1, 1, 1)
+            dx, dy = dx.view(-1, 1, 1), dy.view(-1, 1, 1)
+
+            rect = (xs >= x0) & (xs < x0 + dx) & (ys >= y0) & (ys < y0 + dy)
+            mask |= active & rect
+
+        return torch.where(mask[:, None], mean_color[:, :, None, None], img2)
+
+    @torch.no_grad()
+    def __call__(self, img1, img2, flow, valid=None):
+        """
+        Applies the augmentations to a batch of image pairs and flow fields.
+
+        Parameters
+        ----------
+        img1 : torch.Tensor
+            First images of shape N x 3 x H x W with values in [0, 255], uint8 or float
+        img2 : torch.Tensor
+            Second images of shape N x 3 x H x W with values in [0, 255], uint8 or float
+        flow : torch.Tensor
+            Flow fields of shape N x 2 x H x W
+        valid : torch.Tensor, optional
+            Valid flow masks of shape N x H x W or N x 1 x H x W, required if sparse_transform is True
+
+        Returns
+        -------
+        img1 : torch.Tensor
+            Augmented first images of shape N x 3 x crop_size[0] x crop_size[1]
+        img2 : torch.Tensor
+            Augmented second images of shape N x 3 x crop_size[0] x crop_size[1]
+        flow : torch.Tensor
+            Augmented flow fields of shape N x 2 x crop_size[0] x crop_size[1]
+        valid : torch.Tensor
+            Augmented valid flow masks with the shape layout of the input, None if valid is None
+        """
+        if self.sparse_transform:
+            assert valid is not None, "Valid flow mask is required for sparse transform"
+
+        img1 = img1.float()
+        img2 = img2.float()
+        flow = flow.float()
+
+        valid_shape = None
+        if valid is not None:
+            valid_shape = valid.shape
+            valid = valid.float().view(valid.shape[0], 1, *valid.shape[-2:])
+
+        img1, img2, flow, valid, crop_box = self._spatial_transform(
+            img1, img2, flow, valid
+        )
+
+        if self.color_aug_params.get("enabled", False):
+            img1, img2 = self._color_transform(img1, img2)
+
+        mean_color = img2.mean(dim=(2, 3))
+
+        if self.noise_aug_params.get("enabled", False):
+            img1, img2 = self._noise_transform(img1, img2)
+
+        if self.eraser_aug_params.get("enabled", False):
+            img2 = self._eraser_transform(img2, mean_color, crop_box)
+
+        img1, img2 = self.normalize(img1, img2)
+
+        if valid is not None:
+            valid = valid.view(*valid_shape[:-2], *valid.shape[-2:])
+
+        return img1, img2, flow, valid
+
+    def augment_batch(self, inp, target):
+        """
+        Applies the augmentations to a collated batch of an optical flow dataset.
+
+        Parameters
+        ----------
+        inp : tuple
+            A tuple consisting of (img1, img2)
+        target : dict
+            dictionary containing flow_gt and, optionally, valid
+
+        Returns
+        -------
+        tuple
+            A tuple consisting of ((img1, img2), target)
+        """
+        assert (
+            "offset_idxs" not in target and "offset_labs" not in target
+        ), "Flow offset labels must be computed after the batched augmentations."
+
+        img1, img2 = inp
+        img1, img2, flow, valid = self(
+            img1, img2, target["flow_gt"], target.get("valid", None)
+        )
+
+        target["flow_gt"] = flow
+        if valid is not None:
+            target["valid"] = valid
+
+        return (img1, img2), target
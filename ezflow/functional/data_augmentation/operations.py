@@ -333,10 +333,38 @@ def flip_transform(
     return img1, img2, flow, valid
 
 
+def _sparse_resize_targets(H, W, fx, fy):
+    """
+    Returns the target columns and rows of the pixel columns and rows of a H x W map
+    resized by fx and fy, the masks of the columns and rows kept within the resized map
+    and the dtype in which the scaling is computed.
+    """
+    H1 = int(round(H * fy))
+    W1 = int(round(W * fx))
+
+    scale = np.array([fx, fy])
+    dtype = np.result_type(np.float32, scale)
+    fx, fy = scale.astype(dtype)
+
+    # Pixel coordinates scale separably, every column and row is rounded once
+    xx = np.round(np.arange(W, dtype=dtype) * fx).astype(np.int64)
+    yy = np.round(np.arange(H, dtype=dtype) * fy).astype(np.int64)
+
+    # The first row and column of the resized map are left empty, as in RAFT
+    keep_x = (xx > 0) & (xx < W1)
+    keep_y = (yy > 0) & (yy < H1)
+
+    return xx, yy, keep_x, keep_y, H1, W1, dtype
+
+
 def resize_sparse_flow_map(flow, valid, fx=1.0, fy=1.0):
     """
     Resize flow field and valid flow by the scaling factor of fx and fy
 
+    Every valid flow vector is moved to the nearest pixel of the resized map and scaled.
+    When several vectors fall on the same pixel, the last one in row-major order is kept,
+    every pixel of the resized map is written once.
+
     Parameters
     -----------
     flow : numpy.ndarray
@@ -355,38 +383,107 @@ def resize_sparse_flow_map(flow, valid, fx=1.0, fy=1.0):
     valid : numpy.ndarray
             Valid Flow field
     """
+    assert fx > 0 and fy > 0, "Scaling factors must be positive"
+
     H, W = flow.shape[:2]
-    coords = np.meshgrid(np.arange(W), np.arange(H))
-    coords = np.stack(coords, axis=-1)
+    xx, yy, keep_x, keep_y, H1, W1, dtype = _sparse_resize_targets(H, W, fx, fy)
+    rows_collide = np.any(np.diff(yy[keep_y]) == 0)
+
+    mask = (valid.reshape(H, W) >= 1) & keep_y[:, None] & keep_x[None, :]
+    index = np.flatnonzero(mask)
+    rows = index // W
+    targets = (yy * W1)[rows] + xx[index - rows * W]
+
+    # Vectors falling on the same pixel are consecutive in row-major order, unless
+    # several rows fall on the same row when downscaling. The targets are then sorted,
+    # the stable sort keeps the colliding vectors in row-major order
+    if rows_collide:
+        order = np.argsort(targets, kind="stable")
+        index, targets = index[order], targets[order]
+
+    last = np.ones(len(targets), dtype=bool)
+    last[:-1] = targets[1:] != targets[:-1]
+    index, targets = index[last], targets[last]
+
+    # Flow vectors are gathered and scattered as single 64 bit elements
+    flow = np.ascontiguousarray(flow, dtype=np.float32).view(np.int64).reshape(-1)
+    vectors = flow[index].view(np.float32).reshape(-1, 2) * np.array(
+        [fx, fy], dtype=dtype
+    )
 
-    coords = coords.reshape(-1, 2).astype(np.float32)
-    flow = flow.reshape(-1, 2).astype(np.float32)
-    valid = valid.reshape(-1).astype(np.float32)
+    flow_img = np.zeros([H1 * W1, 2], dtype=np.float32)
+    valid_img = np.zeros([H1 * W1], dtype=np.int32)
 
-    coords0 = coords[valid >= 1]
-    flow0 = flow[valid >= 1]
+    vectors = vectors.astype(np.float32).view(np.int64)[:, 0]
+    flow_img.view(np.int64)[targets, 0] = vectors
+    valid_img[targets] = 1
 
-    H1 = int(round(H * fy))
-    W1 = int(round(W * fx))
+    return flow_img.reshape(H1, W1, 2), valid_img.reshape(H1, W1)
+
+
+def resize_sparse_flow_map_batch(flow, valid, fx=1.0, fy=1.0):
+    """
+    Resize a batch of flow fields and valid flow masks by the scaling factor of fx and fy,
+    with the nearest pixel scattering of resize_sparse_flow_map.
+
+    Parameters
+    -----------
+    flow : torch.Tensor
+        Flow fields of shape N x 2 x H x W
+    valid : torch.Tensor
+        Valid flow masks of shape N x H x W or N x 1 x H x W
+    fx : float
+        Scaling factor along x
+    fy : float
+        Scaling factor along y
+
+    Returns
+    -------
+    flow : torch.Tensor
+        Flow fields of shape N x 2 x H1 x W1, as float32
+    valid : torch.Tensor
+        Valid flow masks of shape N x H1 x W1, as int32
+    """
+    assert fx > 0 and fy > 0, "Scaling factors must be positive"
+
+    N, _, H, W = flow.shape
+    xx, yy, keep_x, keep_y, H1, W1, dtype = _sparse_resize_targets(H, W, fx, fy)
+    rows_collide = np.any(np.diff(yy[keep_y]) == 0)
+    device = flow.device
+
+    xx, yy = torch.from_numpy(xx).to(device), torch.from_numpy(yy).to(device)
+    keep = torch.from_numpy(keep_y[:, None] & keep_x[None, :]).to(device)
 
-    coords1 = coords0 * [fx, fy]
-    flow1 = flow0 * [fx, fy]
+    mask = (valid.reshape(N, H, W) >= 1) & keep
+    index = mask.view(-1).nonzero().squeeze(1)
+    batch, pixel = index // (H * W), index % (H * W)
+    rows = pixel // W
+    targets = yy[rows] * W1 + xx[pixel - rows * W]
 
-    xx = np.round(coords1[:, 0]).astype(np.int32)
-    yy = np.round(coords1[:, 1]).astype(np.int32)
+    # Vectors falling on the same pixel of a sample are consecutive, unless several
+    # rows fall on the same row when downscaling. Every pixel is written once so
+    # that the result does not depend on the order of the scattered writes
+    keys = batch * (H1 * W1) + targets
+    if rows_collide:
+        keys, order = torch.sort(keys, stable=True)
+        batch, pixel, targets = batch[order], pixel[order], targets[order]
 
-    v = (xx > 0) & (xx < W1) & (yy > 0) & (yy < H1)
-    xx = xx[v]
-    yy = yy[v]
-    flow1 = flow1[v]
+    last = torch.ones_like(keys, dtype=torch.bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    batch, pixel, targets = batch[last], pixel[last], targets[last]
 
-    flow_img = np.zeros([H1, W1, 2], dtype=np.float32)
-    valid_img = np.zeros([H1, W1], dtype=np.int32)
+    flow = flow.float().reshape(N, 2, H * W)
+    flow_img = torch.zeros(N, 2, H1 * W1, dtype=torch.float32, device=device)
+    valid_img = torch.zeros(N, H1 * W1, dtype=torch.int32, device=device)
 
-    flow_img[yy, xx] = flow1
-    valid_img[yy, xx] = 1
+    # The channels are gathered and scattered in the N x 2 x H x W layout
+    torch_dtype = getattr(torch, dtype.name)
+    for channel, scale in enumerate([fx, fy]):
+        vectors = flow[batch, channel, pixel].to(torch_dtype) * scale
+        flow_img[batch, channel, targets] = vectors.float()
+    valid_img[batch, targets] = 1
 
-    return flow_img, valid_img
+    return flow_img.view(N, 2, H1, W1), valid_img.view(N, H1, W1)
 
 
 def sparse_spatial_transform(
@@ -547,6 +644,10 @@ class AdvancedSpatialTransform(object):
 
     This set of augmentations include random scaling, stretch, rotation, translation and out-of-boundary cropping.
 
+    Unless out-of-boundary cropping is enabled, the translation is sampled from the range of
+    translations which keeps the crops of both images inside the image boundaries. If no such
+    translation exists, both scales are increased by the smallest common factor for which one does.
+
     Parameters
     -----------
     crop_size : :obj:`list` of :obj:`int`
@@ -565,15 +666,12 @@ class AdvancedSpatialTransform(object):
         Stretch factor
     h_flip_prob : float, default=0.5
         Probability of applying the horizontal flip transform
-
-    Returns
-    -------
-    img1 : PIL Image or numpy.ndarray
-        Flipped image 1
-    img2 : PIL Image or numpy.ndarray
-        Flipped image 2
-    flow : numpy.ndarray
-        Flipped flow field
+    schedule_coeff : float, default : 1
+        Scales the differences between the transforms of the two images
+    order : int, default : 1
+        Interpolation order of the target, 0 for nearest and 1 for bilinear
+    enable_out_of_boundary_crop : bool, default : False
+        If True, the crops may extend beyond the image boundaries
     """
 
     def __init__(
@@ -597,284 +695,221 @@ class AdvancedSpatialTransform(object):
         self.trans = [translate, 0.03] if translate != 0 else None
         self.squeeze = [stretch, 0.0] if stretch != 0 else None
         self.h_flip_prob = h_flip_prob
-        self.t = np.zeros(6)
         self.schedule_coeff = schedule_coeff
         self.order = order
         self.black = enable_out_of_boundary_crop
 
-    def to_identity(self):
-        self.t[0] = 1
-        self.t[2] = 0
-        self.t[4] = 0
-        self.t[1] = 0
-        self.t[3] = 1
-        self.t[5] = 0
-
-    def left_multiply(self, u0, u1, u2, u3, u4, u5):
-        result = np.zeros(6)
-        result[0] = self.t[0] * u0 + self.t[1] * u2
-        result[1] = self.t[0] * u1 + self.t[1] * u3
-
-        result[2] = self.t[2] * u0 + self.t[3] * u2
-        result[3] = self.t[2] * u1 + self.t[3] * u3
-
-        result[4] = self.t[4] * u0 + self.t[5] * u2 + u4
-        result[5] = self.t[4] * u1 + self.t[5] * u3 + u5
-        self.t = result
-
-    def inverse(self):
-        result = np.zeros(6)
-        a = self.t[0]
-        c = self.t[2]
-        e = self.t[4]
-        b = self.t[1]
-        d = self.t[3]
-        f = self.t[5]
-
-        denom = a * d - b * c
-
-        result[0] = d / denom
-        result[1] = -b / denom
-        result[2] = -c / denom
-        result[3] = a / denom
-        result[4] = (c * f - d * e) / denom
-        result[5] = (b * e - a * f) / denom
-
-        return result
-
-    def grid_transform(self, meshgrid, t, normalize=True, gridsize=None):
-        if gridsize is None:
-            h, w = meshgrid[0].shape
-        else:
-            h, w = gridsize
-        vgrid = torch.cat(
-            [
-                (meshgrid[0] * t[0] + meshgrid[1] * t[2] + t[4])[:, :, np.newaxis],
-                (meshgrid[0] * t[1] + meshgrid[1] * t[3] + t[5])[:, :, np.newaxis],
-            ],
-            -1,
+        # Pixel coordinates of the crop, built on first use
+        self._xs = None
+        self._ys = None
+
+    def _transform_grid(self, transform):
+        """
+        Returns the x and y planes of shape th x tw obtained by applying
+        the 2 x 3 affine transform to the pixel coordinates of the crop.
+        """
+        if self._xs is None:
+            th, tw = self.crop
+            self._xs = torch.arange(tw, dtype=torch.float32)[None, :]
+            self._ys = torch.arange(th, dtype=torch.float32)[:, None]
+
+        return [
+            self._xs * transform[i, 0] + (self._ys * transform[i, 1] + transform[i, 2])
+            for i in range(2)
+        ]
+
+    def _sample_params(self):
+        mirror = np.random.binomial(1, self.h_flip_prob)
+
+        rot0 = rot1 = 0.0
+        if self.rot is not None:
+            rot0 = np.random.uniform(-self.rot[0], +self.rot[0])
+            rot1 = (
+                np.random.uniform(
+                    -self.rot[1] * self.schedule_coeff,
+                    self.rot[1] * self.schedule_coeff,
+                )
+                + rot0
+            )
+
+        max_trans = 0.0
+        trans_delta = np.zeros(2)
+        if self.trans is not None:
+            max_trans = self.trans[0]
+            trans_delta = np.random.uniform(
+                -self.trans[1] * self.schedule_coeff,
+                +self.trans[1] * self.schedule_coeff,
+                2,
+            )
+
+        squeeze0 = squeeze1 = 1.0
+        if self.squeeze is not None:
+            squeeze0 = np.exp(np.random.uniform(-self.squeeze[0], self.squeeze[0]))
+            squeeze1 = (
+                np.exp(
+                    np.random.uniform(
+                        -self.squeeze[1] * self.schedule_coeff,
+                        self.squeeze[1] * self.schedule_coeff,
+                    )
+                )
+                * squeeze0
+            )
+
+        scale0 = np.exp(
+            np.random.uniform(
+                self.scale[2] - self.scale[0], self.scale[2] + self.scale[0]
+            )
+        )
+        scale1 = (
+            np.exp(
+                np.random.uniform(
+                    -self.scale[1] * self.schedule_coeff,
+                    self.scale[1] * self.schedule_coeff,
+                )
+            )
+            * scale0
         )
-        if normalize:
-            vgrid[:, :, 0] = 2.0 * vgrid[:, :, 0] / max(w - 1, 1) - 1.0
-            vgrid[:, :, 1] = 2.0 * vgrid[:, :, 1] / max(h - 1, 1) - 1.0
-        return vgrid
+
+        return (
+            mirror,
+            np.array([rot0, rot1]),
+            max_trans,
+            trans_delta,
+            np.array([scale0, scale1]),
+            np.array([squeeze0, squeeze1]),
+        )
+
+    def _sample_transforms(self, h, w):
+        """
+        Returns the 2 x 2 x 3 affine transforms mapping the crop pixel coordinates
+        to the pixel coordinates of each image and the scales of the two images.
+        """
+        th, tw = self.crop
+        mirror, rot, max_trans, trans_delta, scale, squeeze = self._sample_params()
+
+        crop_size = np.array([tw, th], dtype=np.float64)
+        center = np.array([0.5 * w, 0.5 * h])
+
+        # Crop pixel coordinates centered on the crop (and mirrored), then rotated
+        flip = np.diag([-1.0 if mirror else 1.0, 1.0])
+        crop_offset = np.array([0.5 * tw if mirror else -0.5 * tw, -0.5 * th])
+        cos, sin = np.cos(rot), np.sin(rot)
+        rotation = np.stack([np.stack([cos, -sin], -1), np.stack([sin, cos], -1)], 1)
+        corners = np.array([[0, 0], [tw - 1, 0], [0, th - 1], [tw - 1, th - 1]])
+        corners = (corners @ flip.T + crop_offset) @ rotation.transpose(0, 2, 1)
+
+        # Image pixels per crop pixel along x and y
+        stretch = np.stack([1.0 / (scale * squeeze), squeeze / scale], -1)  # 2 x 2
+
+        # Crop translations of the two images, in crop pixels
+        trans_delta = np.stack([np.zeros(2), trans_delta * crop_size])
+        trans_range = max_trans * crop_size
+
+        if self.black:
+            trans = np.random.uniform(-trans_range, trans_range)
+        else:
+            # Image i stays inside [0, size - 1] along an axis for translations
+            # in [-k * a_i + l_i, k * b_i + u_i] where the scales are multiplied by k
+            size = np.array([w, h], dtype=np.float64)
+            a = np.concatenate([center / stretch, np.zeros((1, 2))])
+            b = np.concatenate([(size - 1 - center) / stretch, np.zeros((1, 2))])
+            lo = np.concatenate([-corners.min(1) - trans_delta, -trans_range[None]])
+            hi = np.concatenate([-corners.max(1) - trans_delta, trans_range[None]])
+
+            # Smallest k for which every lower bound is below every upper bound
+            denom = a[:, None] + b[None, :]
+            need = lo[:, None] - hi[None, :]
+            k = np.max(np.where(denom > 0, need / np.maximum(denom, 1e-12), 1.0))
+            k = max(k, 1.0)
+
+            stretch = stretch / k
+            scale = scale * k
+            trans = np.random.uniform(np.max(-k * a + lo, 0), np.min(k * b + hi, 0))
+
+        trans = trans + trans_delta
+
+        # q = stretch * (rotation @ (flip @ p + crop_offset) + trans) + center
+        linear = stretch[:, :, None] * (rotation @ flip)
+        offset = stretch * (rotation @ crop_offset + trans) + center
+        transforms = np.concatenate([linear, offset[:, :, None]], -1)
+
+        return transforms, scale
 
     def __call__(self, img1, img2, target):
         """
         Parameters
         -----------
-        img1 : PIL Image or numpy.ndarray
+        img1 : numpy.ndarray
             First of the pair of images
-        img2 : PIL Image or numpy.ndarray
+        img2 : numpy.ndarray
             Second of the pair of images
         target : numpy.ndarray
-            Flow field
+            Flow field of shape H x W x C, the optional third channel is the valid mask
+            and the optional remaining channels are scaled by the relative scale of the images
 
         Returns
         -------
-        img1 : PIL Image or numpy.ndarray
-            Flipped image 1
-        img2 : PIL Image or numpy.ndarray
-            Flipped image 2
-        flow : numpy.ndarray
-            Flipped flow field
+        img1 : numpy.ndarray
+            Transformed image 1
+        img2 : numpy.ndarray
+            Transformed image 2
+        target : numpy.ndarray
+            Transformed flow field
         """
         if not self.enabled:
             return img1, img2, target
 
-        inputs = [img1, img2]
-        h, w, _ = inputs[0].shape
-        th, tw = self.crop
-        meshgrid = torch.meshgrid(
-            [torch.Tensor(range(th)), torch.Tensor(range(tw))], indexing="ij"
-        )[::-1]
-        cornergrid = torch.meshgrid(
-            [torch.Tensor([0, th - 1]), torch.Tensor([0, tw - 1])], indexing="ij"
-        )[::-1]
-
-        for i in range(50):
-            # im0
-            self.to_identity()
-
-            if np.random.binomial(1, self.h_flip_prob):
-                mirror = True
-            else:
-                mirror = False
-
-            if mirror:
-                self.left_multiply(-1, 0, 0, 1, 0.5 * tw, -0.5 * th)
-            else:
-                self.left_multiply(1, 0, 0, 1, -0.5 * tw, -0.5 * th)
-            scale0 = 1
-            scale1 = 1
-            squeeze0 = 1
-            squeeze1 = 1
-            if not self.rot is None:
-                rot0 = np.random.uniform(-self.rot[0], +self.rot[0])
-                rot1 = (
-                    np.random.uniform(
-                        -self.rot[1] * self.schedule_coeff,
-                        self.rot[1] * self.schedule_coeff,
-                    )
-                    + rot0
-                )
-                self.left_multiply(
-                    np.cos(rot0), np.sin(rot0), -np.sin(rot0), np.cos(rot0), 0, 0
-                )
-            if not self.trans is None:
-                trans0 = np.random.uniform(-self.trans[0], +self.trans[0], 2)
-                trans1 = (
-                    np.random.uniform(
-                        -self.trans[1] * self.schedule_coeff,
-                        +self.trans[1] * self.schedule_coeff,
-                        2,
-                    )
-                    + trans0
-                )
-                self.left_multiply(1, 0, 0, 1, trans0[0] * tw, trans0[1] * th)
-            if not self.squeeze is None:
-                squeeze0 = np.exp(np.random.uniform(-self.squeeze[0], self.squeeze[0]))
-                squeeze1 = (
-                    np.exp(
-                        np.random.uniform(
-                            -self.squeeze[1] * self.schedule_coeff,
-                            self.squeeze[1] * self.schedule_coeff,
-                        )
-                    )
-                    * squeeze0
-                )
-            if not self.scale is None:
-                scale0 = np.exp(
-                    np.random.uniform(
-                        self.scale[2] - self.scale[0], self.scale[2] + self.scale[0]
-                    )
-                )
-                scale1 = (
-                    np.exp(
-                        np.random.uniform(
-                            -self.scale[1] * self.schedule_coeff,
-                            self.scale[1] * self.schedule_coeff,
-                        )
-                    )
-                    * scale0
-                )
-            self.left_multiply(
-                1.0 / (scale0 * squeeze0), 0, 0, 1.0 / (scale0 / squeeze0), 0, 0
-            )
+        h, w, _ = img1.shape
+        n_channels = target.shape[2]
+        transforms, scale = self._sample_transforms(h, w)
 
-            self.left_multiply(1, 0, 0, 1, 0.5 * w, 0.5 * h)
-            transmat0 = self.t.copy()
-
-            # im1
-            self.to_identity()
-            if mirror:
-                self.left_multiply(-1, 0, 0, 1, 0.5 * tw, -0.5 * th)
-            else:
-                self.left_multiply(1, 0, 0, 1, -0.5 * tw, -0.5 * th)
-            if not self.rot is None:
-                self.left_multiply(
-                    np.cos(rot1), np.sin(rot1), -np.sin(rot1), np.cos(rot1), 0, 0
-                )
-            if not self.trans is None:
-                self.left_multiply(1, 0, 0, 1, trans1[0] * tw, trans1[1] * th)
-            self.left_multiply(
-                1.0 / (scale1 * squeeze1), 0, 0, 1.0 / (scale1 / squeeze1), 0, 0
-            )
-            self.left_multiply(1, 0, 0, 1, 0.5 * w, 0.5 * h)
-            transmat1 = self.t.copy()
-            transmat1_inv = self.inverse()
-
-            if self.black:
-                # black augmentation, allowing 0 values in the input images
-                # https://github.com/lmb-freiburg/flownet2/blob/master/src/caffe/layers/black_augmentation_layer.cu
-                break
-            else:
-                if (
-                    (
-                        self.grid_transform(
-                            cornergrid, transmat0, gridsize=[float(h), float(w)]
-                        ).abs()
-                        > 1
-                    ).sum()
-                    + (
-                        self.grid_transform(
-                            cornergrid, transmat1, gridsize=[float(h), float(w)]
-                        ).abs()
-                        > 1
-                    ).sum()
-                ) == 0:
-                    break
-        if i == 49:
-            # print("max_iter in augmentation")
-            self.to_identity()
-            self.left_multiply(1, 0, 0, 1, -0.5 * tw, -0.5 * th)
-            self.left_multiply(1, 0, 0, 1, 0.5 * w, 0.5 * h)
-            transmat0 = self.t.copy()
-            transmat1 = self.t.copy()
-
-        # do the real work
-        vgrid = self.grid_transform(meshgrid, transmat0, gridsize=[float(h), float(w)])
-        inputs_0 = F.grid_sample(
-            torch.Tensor(inputs[0]).permute(2, 0, 1)[np.newaxis], vgrid[np.newaxis]
-        )[0].permute(1, 2, 0)
-        if self.order == 0:
-            target_0 = F.grid_sample(
-                torch.Tensor(target).permute(2, 0, 1)[np.newaxis],
-                vgrid[np.newaxis],
-                mode="nearest",
-            )[0].permute(1, 2, 0)
-        else:
-            target_0 = F.grid_sample(
-                torch.Tensor(target).permute(2, 0, 1)[np.newaxis], vgrid[np.newaxis]
-            )[0].permute(1, 2, 0)
-
-        mask_0 = target[:, :, 2:3].copy()
-        mask_0[mask_0 == 0] = np.nan
-        if self.order == 0:
-            mask_0 = F.grid_sample(
-                torch.Tensor(mask_0).permute(2, 0, 1)[np.newaxis],
-                vgrid[np.newaxis],
-                mode="nearest",
-            )[0].permute(1, 2, 0)
-        else:
-            mask_0 = F.grid_sample(
-                torch.Tensor(mask_0).permute(2, 0, 1)[np.newaxis], vgrid[np.newaxis]
-            )[0].permute(1, 2, 0)
-        mask_0[torch.isnan(mask_0)] = 0
-
-        vgrid = self.grid_transform(meshgrid, transmat1, gridsize=[float(h), float(w)])
-        inputs_1 = F.grid_sample(
-            torch.Tensor(inputs[1]).permute(2, 0, 1)[np.newaxis], vgrid[np.newaxis]
-        )[0].permute(1, 2, 0)
-
-        # flow
-        pos = target_0[:, :, :2] + self.grid_transform(
-            meshgrid, transmat0, normalize=False
+        # Normalized sampling coordinates of both images
+        th, tw = self.crop
+        normalize = np.array([2.0 / max(w - 1, 1), 2.0 / max(h - 1, 1)])
+        vgrids = torch.empty(2, 1, th, tw, 2)
+        for vgrid, transform in zip(vgrids, transforms * normalize[:, None]):
+            for i, plane in enumerate(self._transform_grid(transform)):
+                vgrid[0, :, :, i] = plane - 1.0
+
+        # Invalid pixels are set to NaN so that every pixel interpolated from them is invalid
+        if n_channels >= 3:
+            target = np.array(target, dtype=np.float32)
+            np.copyto(target[:, :, 2], np.nan, where=target[:, :, 2] == 0)
+
+        mode = "nearest" if self.order == 0 else "bilinear"
+        img1 = self._warp(img1, vgrids[0])
+        img2 = self._warp(img2, vgrids[1])
+        target = self._warp(target, vgrids[0], mode=mode)
+
+        # Flow of the crop pixels: the position reached in the first image is mapped
+        # back to crop coordinates of the second image
+        linear1_inv = np.linalg.inv(transforms[1, :, :2])
+        grid_to_flow = np.concatenate(
+            [
+                linear1_inv @ transforms[0, :, :2] - np.eye(2),
+                linear1_inv @ (transforms[0, :, 2:] - transforms[1, :, 2:]),
+            ],
+            1,
         )
-        pos = self.grid_transform(pos.permute(2, 0, 1), transmat1_inv, normalize=False)
-        if target_0.shape[2] >= 4:
-            # scale
-            exp = target_0[:, :, 3:] * scale1 / scale0
-            target = torch.cat(
-                [
-                    (pos[:, :, 0] - meshgrid[0]).unsqueeze(-1),
-                    (pos[:, :, 1] - meshgrid[1]).unsqueeze(-1),
-                    mask_0,
-                    exp,
-                ],
-                -1,
-            )
-        else:
-            target = torch.cat(
-                [
-                    (pos[:, :, 0] - meshgrid[0]).unsqueeze(-1),
-                    (pos[:, :, 1] - meshgrid[1]).unsqueeze(-1),
-                    mask_0,
-                ],
-                -1,
-            )
-        #                               target_0[:,:,2].unsqueeze(-1) ], -1)
-        inputs = [np.asarray(inputs_0), np.asarray(inputs_1)]
-        target = np.asarray(target)
 
-        return inputs[0], inputs[1], target
+        outputs = torch.empty(th, tw, n_channels)
+        for i, plane in enumerate(self._transform_grid(grid_to_flow)):
+            outputs[:, :, i] = (
+                plane + target[0] * linear1_inv[i, 0] + target[1] * linear1_inv[i, 1]
+            )
+        if n_channels >= 3:
+            outputs[:, :, 2] = torch.nan_to_num(target[2], nan=0.0)
+        if n_channels >= 4:
+            outputs[:, :, 3:] = target[3:].permute(1, 2, 0) * (scale[1] / scale[0])
+
+        img1 = img1.permute(1, 2, 0).contiguous().numpy()
+        img2 = img2.permute(1, 2, 0).contiguous().numpy()
+
+        return img1, img2, outputs.numpy()
+
+    @staticmethod
+    def _warp(array, vgrid, mode="bilinear"):
+        """Samples a H x W x C array at the normalized coordinates of vgrid, returns C x th x tw"""
+        inputs = torch.as_tensor(np.ascontiguousarray(array, dtype=np.float32))
+        inputs = inputs.permute(2, 0, 1)[None]
+        return F.grid_sample(inputs, vgrid, mode=mode, align_corners=True)[0]
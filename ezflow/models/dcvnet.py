@@ -41,7 +41,7 @@ class DCVNet(BaseModule):
         self.decoder = build_decoder(self.cfg.DECODER)
         self = replace_relu(self, nn.LeakyReLU(negative_slope=0.1))
 
-    def forward(self, img1, img2):
+    def forward(self, img1, img2, return_all=False):
         """
         Performs forward pass of the network
 
@@ -51,11 +51,15 @@ class DCVNet(BaseModule):
             Image to predict flow from
         img2 : torch.Tensor
             Image to predict flow to
+        return_all : bool, default : False
+            If True, all the intermediate flows are upsampled and returned in eval
+            state, as in training
 
         Returns
         -------
         :class:`dict`
-            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2
+            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2,
+            only the final one in eval state unless return_all is True
             <flow_logits> torch.Tensor : interpolated flow logits
             <flow_upsampled> torch.Tensor : if model is in eval state, return upsampled flow
         """
@@ -65,6 +69,57 @@ class DCVNet(BaseModule):
         fmap2 = [feat_i[N:] for feat_i in feat_map]
         context_fmap1 = [context_i[:N] for context_i in context_map]
 
+        return self._decode(fmap1, fmap2, context_fmap1, return_all)
+
+    def encode_frame(self, img):
+        """
+        Encodes a single frame into its feature and context maps
+
+        Parameters
+        ----------
+        img : torch.Tensor
+            The frame of shape N x 3 x H x W
+
+        Returns
+        -------
+        :class:`dict`
+            <fmap> :obj:`list` of torch.Tensor : the feature maps of the frame
+            <context> :obj:`list` of torch.Tensor : the context maps of the frame
+        """
+
+        fmap, context = self.encoder(img)
+        return {"fmap": fmap, "context": context}
+
+    def forward_features(self, features1, features2, return_all=False):
+        """
+        Performs forward pass of the network from the features of two frames
+        returned by encode_frame
+
+        Parameters
+        ----------
+        features1 : :class:`dict`
+            Features of the image to predict flow from
+        features2 : :class:`dict`
+            Features of the image to predict flow to
+        return_all : bool, default : False
+            If True, all the intermediate flows are upsampled and returned in eval
+            state, as in training
+
+        Returns
+        -------
+        :class:`dict`
+            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2,
+            only the final one in eval state unless return_all is True
+            <flow_logits> torch.Tensor : interpolated flow logits
+            <flow_upsampled> torch.Tensor : if model is in eval state, return upsampled flow
+        """
+
+        return self._decode(
+            features1["fmap"], features2["fmap"], features1["context"], return_all
+        )
+
+    def _decode(self, fmap1, fmap2, context_fmap1, return_all=False):
+
         assert len(fmap1) == len(self.cfg.SIMILARITY.DILATIONS)
         assert len(fmap1) == len(self.cfg.SIMILARITY.DILATIONS)
 
@@ -73,7 +128,9 @@ class DCVNet(BaseModule):
             1, -1, 2, 1, 1
         )
 
-        flow_list, flow_logits_list = self.decoder(cost, context_fmap1, flow_offsets)
+        flow_list, flow_logits_list = self.decoder(
+            cost, context_fmap1, flow_offsets, return_all
+        )
 
         output = {"flow_preds": flow_list, "flow_logits": flow_logits_list}
 
@@ -1,8 +1,10 @@
+import os.path as osp
+
 import torch
 from torchvision import io
 from torchvision.transforms import Normalize
 
-from ..utils import InputPadder
+from ..utils import FlowWriter, InputPadder, forward_interpolate
 from .build import build_model
 
 
@@ -79,10 +81,10 @@ class Predictor:
                 model_name, cfg=model_cfg, weights_path=model_weights_path
             )
 
-        self.model = self.model.eval()
+        self.device = torch.device(device)
+        self.model = self.model.to(self.device).eval()
         self.norm = Normalize(mean=mean, std=std)
         self.data_transform = data_transform
-        self.device = torch.device(device)
 
     def __call__(self, img1, img2):
         """
@@ -91,7 +93,8 @@ class Predictor:
         Parameters
         ----------
         img1 : torch.Tensor or str
-            The first image to predict flow from
+            The first image to predict flow from. Images read from files and uint8 tensors
+            are moved to the device before being converted to float and normalized.
         img2 : torch.Tensor or str
             The second image to predict flow to
 
@@ -101,20 +104,8 @@ class Predictor:
             The predicted flow
         """
 
-        if type(img1) == str:
-            img1 = io.read_image(img1).float()
-            img1 = img1.unsqueeze(dim=0)
-
-        if type(img2) == str:
-            img2 = io.read_image(img2).float()
-            img2 = img2.unsqueeze(dim=0)
-
-        if self.data_transform:
-            img1 = self.data_transform(img1)
-            img2 = self.data_transform(img2)
-
-        img1 = self.norm(img1)
-        img2 = self.norm(img2)
+        img1 = self._preprocess(img1)
+        img2 = self._preprocess(img2)
 
         padder = InputPadder(img1.shape, divisor=self.pad_divisor)
         img1, img2 = padder.pad(img1, img2)
@@ -123,3 +114,127 @@ class Predictor:
         flow_pred = padder.unpad(output["flow_upsampled"])
         flow_pred = flow_pred * self.flow_scale
         return flow_pred
+
+    def _preprocess(self, img):
+
+        if type(img) == str:
+            img = io.read_image(img)
+            img = img.unsqueeze(dim=0)
+
+        img = img.to(self.device).float()
+
+        if self.data_transform:
+            img = self.data_transform(img)
+
+        return self.norm(img)
+
+    @torch.no_grad()
+    def stream(self, frames, warm_start=False):
+        """
+        Predicts the flow between every pair of consecutive frames of a video.
+        Every frame is encoded once with the encode_frame method of the model and its
+        features are reused for the two pairs it belongs to, which halves the encoder
+        computation of models which support feature reuse compared to calling the predictor
+        on every pair.
+
+        Parameters
+        ----------
+        frames : iterable
+            The frames of the video, as accepted by __call__. A batch of frames of shape
+            N x 3 x H x W holds the frames of N videos at the same time step.
+        warm_start : bool, default : False
+            If True, the flow of every pair is initialized with the forward interpolated
+            low resolution flow of the previous pair, for models which return flow_low
+            and accept flow_init such as RAFT
+
+        Yields
+        ------
+        torch.Tensor
+            The predicted flow from every frame to the next one, from the second frame on
+        """
+
+        features, padder, flow_init = None, None, None
+        for frame in frames:
+            img = self._preprocess(frame)
+
+            if padder is None or img.shape[-2:] != size:
+                # A change of resolution starts a new video
+                size = img.shape[-2:]
+                padder = InputPadder(img.shape, divisor=self.pad_divisor)
+                features, flow_init = None, None
+
+            next_features = self.model.encode_frame(padder.pad(img)[0])
+
+            if features is not None:
+                kwargs = {} if flow_init is None else {"flow_init": flow_init}
+                output = self.model.forward_features(features, next_features, **kwargs)
+
+                if warm_start:
+                    assert "flow_low" in output, "The model does not support warm start"
+                    flow_init = forward_interpolate(output["flow_low"])
+
+                flow_pred = padder.unpad(output["flow_upsampled"])
+                yield flow_pred * self.flow_scale
+
+            features = next_features
+
+    def export(
+        self,
+        image_pairs,
+        output_dir,
+        names=None,
+        ext=".flo",
+        num_threads=4,
+        max_pending=16,
+        visualize=False,
+    ):
+        """
+        Predicts the flow of image pairs and writes the predictions to files with a
+        FlowWriter, which writes them in background threads while the next pairs are predicted.
+
+        Parameters
+        ----------
+        image_pairs : :obj:`list` of :obj:`tuple`
+            The pairs of images, as accepted by __call__, tensors of a single image each
+        output_dir : str
+            Directory in which the files are written
+        names : :obj:`list` of :obj:`str`, optional
+            Paths of the files relative to output_dir, without extension.
+            By default the name of the first image of every pair, or the index of the pair
+            if the images are not read from files.
+        ext : str, default : ".flo"
+            Extension of the flow files, which selects the format as in write_flow
+        num_threads : int, default : 4
+            Number of writing threads
+        max_pending : int, default : 16
+            Maximum number of predictions waiting to be written
+        visualize : bool, default : False
+            If True, a color coded image of every flow is also written
+
+        Returns
+        -------
+        dict
+            The summary of the FlowWriter: the number of samples, files and bytes written,
+            the time in seconds and the number of samples written per second
+        """
+
+        if names is None:
+            names = [
+                osp.splitext(osp.basename(img1))[0] if type(img1) == str else f"{i:06d}"
+                for i, (img1, _) in enumerate(image_pairs)
+            ]
+        assert len(names) == len(image_pairs)
+
+        writer = FlowWriter(
+            output_dir,
+            ext=ext,
+            num_threads=num_threads,
+            max_pending=max_pending,
+            visualize=visualize,
+        )
+        with writer, torch.no_grad():
+            for name, (img1, img2) in zip(names, image_pairs):
+                flow_pred = self(img1, img2)
+                writer.write(name, flow_pred[0])
+
+        return writer.close()
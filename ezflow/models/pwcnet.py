@@ -70,8 +70,54 @@ class PWCNet(BaseModule):
         feature_pyramid1 = self.encoder(img1)
         feature_pyramid2 = self.encoder(img2)
 
-        feature_pyramid1.reverse()
-        feature_pyramid2.reverse()
+        return self._decode(feature_pyramid1, feature_pyramid2, (H, W))
+
+    def encode_frame(self, img):
+        """
+        Encodes a single frame into its feature pyramid
+
+        Parameters
+        ----------
+        img : torch.Tensor
+            The frame of shape N x 3 x H x W
+
+        Returns
+        -------
+        :class:`dict`
+            <pyramid> :obj:`list` of torch.Tensor : the feature pyramid of the frame
+            <size> tuple : the height and width of the frame
+        """
+
+        return {"pyramid": self.encoder(img), "size": tuple(img.shape[-2:])}
+
+    def forward_features(self, features1, features2):
+        """
+        Performs forward pass of the network from the features of two frames
+        returned by encode_frame
+
+        Parameters
+        ----------
+        features1 : :class:`dict`
+            Features of the image to predict flow from
+        features2 : :class:`dict`
+            Features of the image to predict flow to
+
+        Returns
+        -------
+        :class:`dict`
+            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2
+            <flow_upsampled> torch.Tensor : if model is in eval state, return upsampled flow
+        """
+
+        return self._decode(
+            features1["pyramid"], features2["pyramid"], features1["size"]
+        )
+
+    def _decode(self, feature_pyramid1, feature_pyramid2, size):
+
+        # Coarsest level first, without modifying the cached pyramids
+        feature_pyramid1 = feature_pyramid1[::-1]
+        feature_pyramid2 = feature_pyramid2[::-1]
 
         flow_preds, features = self.decoder(feature_pyramid1, feature_pyramid2)
 
@@ -85,7 +131,7 @@ class PWCNet(BaseModule):
         flow_up = flow_preds[-1]
 
         flow_up = F.interpolate(
-            flow_up, size=(H, W), mode="bilinear", align_corners=False
+            flow_up, size=size, mode="bilinear", align_corners=False
         )
 
         output["flow_upsampled"] = flow_up
@@ -30,6 +30,10 @@ class RAFT(BaseModule):
     Implementation of the paper
     `RAFT: Recurrent All-Pairs Field Transforms for Optical Flow <https://arxiv.org/abs/2003.12039>`_
 
+    If cfg.EARLY_EXIT.USE is True, the update iterations of every sample stop in eval
+    mode once its flow updates fall below cfg.EARLY_EXIT.THRESHOLD pixels, and the
+    output holds the number of iterations run for every sample under "iterations".
+
     Parameters
     ----------
     cfg : :class:`CfgNode`
@@ -66,7 +70,7 @@ class RAFT(BaseModule):
 
         return coords0, coords1
 
-    def forward(self, img1, img2, flow_init=None):
+    def forward(self, img1, img2, flow_init=None, return_all=False):
         """
         Performs forward pass of the network
 
@@ -76,12 +80,20 @@ class RAFT(BaseModule):
             Image to predict flow from
         img2 : torch.Tensor
             Image to predict flow to
+        flow_init : torch.Tensor, optional
+            Initial flow at 1/8 resolution, such as the forward interpolated flow_low
+            of the previous pair of a video
+        return_all : bool, default : False
+            If True, the flows of all the update iterations are upsampled and returned
+            in eval state, as in training
 
         Returns
         -------
         :class:`dict`
-            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2
+            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2,
+            only the final one in eval state unless return_all is True
             <flow_upsampled> torch.Tensor : if model is in eval state, return upsampled flow
+            <flow_low> torch.Tensor : if model is in eval state, return flow at 1/8 resolution
         """
 
         img1 = img1.contiguous()
@@ -90,6 +102,69 @@ class RAFT(BaseModule):
         with autocast(enabled=self.cfg.MIXED_PRECISION):
             fmap1, fmap2 = self.fnet([img1, img2])
 
+        return self._decode(img1, fmap1, fmap2, flow_init, return_all)
+
+    def encode_frame(self, img):
+        """
+        Encodes a single frame with the feature encoder, the context encoder only runs
+        on the first frame of every pair in forward_features
+
+        Parameters
+        ----------
+        img : torch.Tensor
+            The frame of shape N x 3 x H x W
+
+        Returns
+        -------
+        :class:`dict`
+            <img> torch.Tensor : the frame
+            <fmap> torch.Tensor : the feature map of the frame
+        """
+
+        img = img.contiguous()
+
+        with autocast(enabled=self.cfg.MIXED_PRECISION):
+            fmap = self.fnet(img)
+
+        return {"img": img, "fmap": fmap}
+
+    def forward_features(self, features1, features2, flow_init=None, return_all=False):
+        """
+        Performs forward pass of the network from the features of two frames
+        returned by encode_frame
+
+        Parameters
+        ----------
+        features1 : :class:`dict`
+            Features of the image to predict flow from
+        features2 : :class:`dict`
+            Features of the image to predict flow to
+        flow_init : torch.Tensor, optional
+            Initial flow at 1/8 resolution, such as the forward interpolated flow_low
+            of the previous pair of a video
+        return_all : bool, default : False
+            If True, the flows of all the update iterations are upsampled and returned
+            in eval state, as in training
+
+        Returns
+        -------
+        :class:`dict`
+            <flow_preds> torch.Tensor : intermediate flow predications from img1 to img2,
+            only the final one in eval state unless return_all is True
+            <flow_upsampled> torch.Tensor : if model is in eval state, return upsampled flow
+            <flow_low> torch.Tensor : if model is in eval state, return flow at 1/8 resolution
+        """
+
+        return self._decode(
+            features1["img"],
+            features1["fmap"],
+            features2["fmap"],
+            flow_init,
+            return_all,
+        )
+
+    def _decode(self, img1, fmap1, fmap2, flow_init=None, return_all=False):
+
         fmap1 = fmap1.float()
         fmap2 = fmap2.float()
 
@@ -110,8 +185,14 @@ class RAFT(BaseModule):
         if flow_init is not None:
             coords1 = coords1 + flow_init
 
+        early_exit = self.cfg.get("EARLY_EXIT", None)
+        if not (self.training or return_all) and early_exit and early_exit.USE:
+            return self._early_exit_iterations(
+                net, inp, corr_fn, coords0, coords1, early_exit
+            )
+
         flow_predictions = []
-        for _ in range(self.cfg.UPDATE_ITERS):
+        for i in range(self.cfg.UPDATE_ITERS):
             coords1 = coords1.detach()
             corr = corr_fn(coords1)
 
@@ -120,6 +201,11 @@ class RAFT(BaseModule):
                 net, up_mask, delta_flow = self.update_block(net, inp, corr, flow)
 
             coords1 = coords1 + delta_flow
+
+            # In eval state, only the flow of the last iteration is upsampled
+            if not (self.training or return_all or i == self.cfg.UPDATE_ITERS - 1):
+                continue
+
             flow = coords1 - coords0
             if up_mask is None:
                 flow_up = upflow(flow)
@@ -134,4 +220,81 @@ class RAFT(BaseModule):
             return output
 
         output["flow_upsampled"] = flow_up
+        output["flow_low"] = flow
         return output
+
+    def _early_exit_iterations(self, net, inp, corr_fn, coords0, coords1, params):
+        """
+        Runs the update iterations of every sample until the magnitude of its flow update,
+        in pixels of the upsampled flow, falls below a threshold. Only the final flow of
+        every sample is upsampled.
+        """
+
+        N = coords1.shape[0]
+        device = coords1.device
+
+        max_iters = params.get("MAX_ITERS", None) or self.cfg.UPDATE_ITERS
+        min_iters = params.get("MIN_ITERS", 1)
+        metric = params.get("METRIC", "mean")
+        assert metric in ("mean", "max"), "EARLY_EXIT.METRIC must be mean or max"
+        reduce_fn = torch.mean if metric == "mean" else torch.amax
+        drop_converged = params.get("DROP_CONVERGED", False)
+
+        flow = torch.zeros_like(coords1)
+        up_masks = None
+        iterations = torch.zeros(N, dtype=torch.long, device=device)
+
+        # Samples of the working batch, converged samples are either dropped
+        # from the working batch or kept with their flow frozen
+        index = torch.arange(N, device=device)
+        running = torch.ones(N, dtype=torch.bool, device=device)
+
+        for i in range(1, max_iters + 1):
+            corr = corr_fn(coords1)
+
+            with autocast(enabled=self.cfg.MIXED_PRECISION):
+                net, up_mask, delta_flow = self.update_block(
+                    net, inp, corr, coords1 - coords0
+                )
+
+            delta_flow = delta_flow * running.view(-1, 1, 1, 1)
+            coords1 = coords1 + delta_flow
+
+            magnitude = 8 * delta_flow.float().norm(dim=1)
+            magnitude = reduce_fn(magnitude.flatten(1), dim=1)
+            if i == max_iters:
+                converged = running
+            elif i >= min_iters:
+                converged = running & (magnitude < params.THRESHOLD)
+            else:
+                converged = torch.zeros_like(running)
+
+            if converged.any():
+                flow[index[converged]] = (coords1 - coords0)[converged]
+                iterations[index[converged]] = i
+                if up_mask is not None:
+                    if up_masks is None:
+                        up_masks = up_mask.new_zeros(N, *up_mask.shape[1:])
+                    up_masks[index[converged]] = up_mask[converged]
+
+            running = running & ~converged
+            if not running.any():
+                break
+
+            if drop_converged and converged.any():
+                index, running = index[running], running[running]
+                net, inp = net[~converged], inp[~converged]
+                coords0, coords1 = coords0[~converged], coords1[~converged]
+                corr_fn.select(~converged)
+
+        if up_masks is None:
+            flow_up = upflow(flow)
+        else:
+            flow_up = convex_upsample_flow(8 * flow, up_masks, out_stride=8)
+
+        return {
+            "flow_preds": [flow_up],
+            "flow_upsampled": flow_up,
+            "flow_low": flow,
+            "iterations": iterations,
+        }
@@ -205,7 +205,7 @@ class VCN(BaseModule):
 
         return cost
 
-    def forward(self, img1, img2):
+    def forward(self, img1, img2, return_all=False):
 
         batch_size = img1.shape[0]
 
@@ -309,6 +309,10 @@ class VCN(BaseModule):
 
         flow_preds.reverse()
 
+        # In eval state, only the flow of the finest level is interpolated
+        if not (self.training or return_all):
+            flow_preds = flow_preds[:1]
+
         scale = 4
         for i in range(len(flow_preds)):
             flow_preds[i] = F.interpolate(
@@ -14,6 +14,46 @@ class BaseModule(nn.Module):
     def forward(self):
         pass
 
+    def encode_frame(self, img):
+        """
+        Encodes a single frame into the features used by forward_features, so that the
+        features of every frame of a video are computed once and reused for the two pairs
+        the frame belongs to. Models which support feature reuse override this method,
+        by default the frame itself is returned and the whole model runs for every pair.
+
+        Parameters
+        ----------
+        img : torch.Tensor
+            The frame of shape N x 3 x H x W
+
+        Returns
+        -------
+        :class:`dict`
+            The features of the frame
+        """
+        return {"img": img}
+
+    def forward_features(self, features1, features2, **kwargs):
+        """
+        Performs forward pass of the network from the features of two frames
+        returned by encode_frame.
+
+        Parameters
+        ----------
+        features1 : :class:`dict`
+            Features of the image to predict flow from
+        features2 : :class:`dict`
+            Features of the image to predict flow to
+        **kwargs
+            Keyword arguments of the forward method of the model
+
+        Returns
+        -------
+        :class:`dict`
+            The output of the forward method of the model
+        """
+        return self(features1["img"], features2["img"], **kwargs)
+
     def freeze_batch_norm(self):
         """
         Set Batch Norm layers to evaluation state.
@@ -34,12 +34,31 @@ class MutliScalePairwise4DCorr:
 
         batch, h1, w1, dim, h2, w2 = corr.shape
         corr = corr.reshape(batch * h1 * w1, dim, h2, w2)
+        self.batch_size = batch
 
         self.corr_pyramid.append(corr)
         for _ in range(self.num_levels - 1):
             corr = F.avg_pool2d(corr, 2, stride=2)
             self.corr_pyramid.append(corr)
 
+    def select(self, index):
+        """
+        Keeps the correlation volumes of a subset of the samples of the batch, so that
+        the samples whose flow has converged can be dropped from the lookups
+
+        Parameters
+        ----------
+        index : torch.Tensor
+            Boolean mask or indices of the samples to be kept
+        """
+        corr_pyramid = []
+        for corr in self.corr_pyramid:
+            corr = corr.view(self.batch_size, -1, *corr.shape[1:])[index]
+            corr_pyramid.append(corr.flatten(0, 1))
+
+        self.corr_pyramid = corr_pyramid
+        self.batch_size = corr.shape[0]
+
     def __call__(self, coords):
 
         r = self.corr_radius
@@ -1,7 +1,10 @@
 from .common import *
+from .flow_writer import *
 from .io import *
 from .metrics import *
+from .profiler import *
 from .registry import *
 from .resampling import *
+from .shared_arrays import *
 from .viz import *
 from .warp import *
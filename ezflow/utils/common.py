@@ -285,6 +285,78 @@ def get_bilinear_weights_per_pixel(x, y, x1, y1, x2, y2):
     return w11, w12, w21, w22
 
 
+def _offset_interval(flow_x, offsets):
+    """
+    Returns, for every flow value and dilation, the indices of the two consecutive offsets
+    enclosing the flow value and the distance to the closer of the two.
+    The flow value lies in (offsets[start], offsets[end]], or equals offsets[0].
+    Out of range flow values get start = end = 0 and a distance increased by 100000.
+
+    flow_x is of shape N, offsets of shape D x O, the outputs are of shape N x D.
+    """
+    num_dilation, num_disp = offsets.shape
+    if torch.is_tensor(flow_x):
+        lib = torch
+        dilation_idxes = torch.arange(num_dilation, device=flow_x.device)[None]
+    else:
+        lib = np
+        dilation_idxes = np.arange(num_dilation)[None]
+
+    flow_x = flow_x[:, None]
+    in_range = (flow_x >= offsets[None, :, 0]) & (flow_x <= offsets[None, :, -1])
+
+    # number of offsets smaller than the flow value, i.e. the index of the end offset
+    idxes_end = (offsets[None] < flow_x[:, :, None]).sum(2)
+    idxes_end = lib.clip(idxes_end, 1, num_disp - 1) * in_range
+    idxes_start = lib.clip(idxes_end - 1, 0, None)
+
+    diff_start = flow_x - offsets[dilation_idxes, idxes_start]
+    diff_end = flow_x - offsets[dilation_idxes, idxes_end]
+    min_diff = lib.minimum(lib.abs(diff_start), lib.abs(diff_end))
+    min_diff = min_diff + (~in_range) * 100000
+
+    return idxes_start, idxes_end, min_diff
+
+
+def _bilinear_interpolation_indices(flow, valid, flow_offsets):
+    """
+    Returns the best dilation, the enclosing offset indices and the bilinear weights
+    of every pixel. flow is of shape N x 2 and valid of shape N.
+    """
+    max_flow = flow_offsets.max()
+
+    # invalid pixels are assigned the largest offset
+    if torch.is_tensor(flow):
+        flow = torch.where(valid[:, None], flow, max_flow)
+        pixels = torch.arange(flow.shape[0], device=flow.device)
+    else:
+        flow = np.where(valid[:, None], flow, max_flow)
+        pixels = np.arange(flow.shape[0])
+
+    # the x index of the labels follows the vertical flow component
+    x_idxes_start, x_idxes_end, min_diff_x = _offset_interval(flow[:, 1], flow_offsets)
+    y_idxes_start, y_idxes_end, min_diff_y = _offset_interval(flow[:, 0], flow_offsets)
+
+    dilation_idxes = (min_diff_x + min_diff_y).argmin(1)
+
+    x_idx_start = x_idxes_start[pixels, dilation_idxes]
+    x_idx_end = x_idxes_end[pixels, dilation_idxes]
+    y_idx_start = y_idxes_start[pixels, dilation_idxes]
+    y_idx_end = y_idxes_end[pixels, dilation_idxes]
+
+    weights = get_bilinear_weights_per_pixel(
+        flow[:, 1],
+        flow[:, 0],
+        flow_offsets[dilation_idxes, x_idx_start],
+        flow_offsets[dilation_idxes, y_idx_start],
+        flow_offsets[dilation_idxes, x_idx_end],
+        flow_offsets[dilation_idxes, y_idx_end],
+    )
+    indices = (x_idx_start, x_idx_end, y_idx_start, y_idx_end)
+
+    return dilation_idxes, indices, weights
+
+
 def flow_to_bilinear_interpolation_weights(flow, valid, flow_offsets, debug=False):
     """
     Get the bilinear interpolation weights using flow_offsets.
@@ -301,6 +373,8 @@ def flow_to_bilinear_interpolation_weights(flow, valid, flow_offsets, debug=Fals
         It is assumed that:
         i)  the offsets in x and y directions are the same.
         ii) the offsets for each dilation is arranged in an ascending order.
+    debug : bool, default False
+        If True, saves the inputs to debug_data_w.pkl when the weights of a pixel do not sum to 1
 
     Returns
     --------
@@ -309,97 +383,155 @@ def flow_to_bilinear_interpolation_weights(flow, valid, flow_offsets, debug=Fals
     dilation_labs:
         In which dilation factor, are the bilinear interpolation weights found. H x W x D
     """
+    h, w, c = flow.shape
     if valid is None:
         valid = np.ones(flow.shape[:2]) > 0
 
-    invalid = np.logical_not(valid)
-    max_flow = flow_offsets.max()
-    u = flow[:, :, 0]
-    v = flow[:, :, 1]
-    u[invalid] = max_flow
-    v[invalid] = max_flow
-    flow = np.stack((u, v), axis=2)
     assert np.all(np.diff(flow_offsets, axis=1) > 0)
 
-    (
-        diff_x,
-        x_idxes_start,
-        x_idxes_end,
-        min_diff_x,
-    ) = flow_to_bilinear_interpolation_weights_helper(
-        flow[:, :, 1], flow_offsets, debug
-    )
+    flow = flow.reshape(h * w, c).astype(np.float64)
+    valid = valid.reshape(h * w) > 0
 
-    (
-        diff_y,
-        y_idxes_start,
-        y_idxes_end,
-        min_diff_y,
-    ) = flow_to_bilinear_interpolation_weights_helper(
-        flow[:, :, 0], flow_offsets, debug
+    dilation_idxes, indices, weights = _bilinear_interpolation_indices(
+        flow, valid, flow_offsets
     )
+    x_idx_start, x_idx_end, y_idx_start, y_idx_end = indices
+    w11, w12, w21, w22 = weights
 
-    min_diff = min_diff_x + min_diff_y
-    min_dilation_idxes = np.argmin(min_diff, axis=1).squeeze()
+    # sanity check
+    err = np.abs(w11 + w12 + w21 + w22 - 1)
+    if np.any(err >= 1e-10) and debug:
+        debug_data = {
+            "flow": flow.reshape(h, w, -1),
+            "offsets": flow_offsets,
+            "valid": valid.reshape(h, w),
+            "idx": np.flatnonzero(err >= 1e-10),
+        }
+        torch.save(debug_data, "debug_data_w.pkl")
+    assert np.all(err < 1e-10), err.max()
 
-    h, w, c = flow.shape
-    flow = flow.reshape(h * w, c)
     num_dilation, num_disp = flow_offsets.shape
-    offset_labs = np.zeros((h * w, num_dilation, num_disp, num_disp))
-
-    # for each pixel
-    for idx in range(h * w):
-        best_dilation_idx = min_dilation_idxes[idx]
-        x_idx_start = x_idxes_start[idx, best_dilation_idx]
-        x_idx_end = x_idxes_end[idx, best_dilation_idx]
-        y_idx_start = y_idxes_start[idx, best_dilation_idx]
-        y_idx_end = y_idxes_end[idx, best_dilation_idx]
-        x_disp_start = flow_offsets[best_dilation_idx, x_idx_start]
-        x_disp_end = flow_offsets[best_dilation_idx, x_idx_end]
-        y_disp_start = flow_offsets[best_dilation_idx, y_idx_start]
-        y_disp_end = flow_offsets[best_dilation_idx, y_idx_end]
-
-        w11, w12, w21, w22 = get_bilinear_weights_per_pixel(
-            flow[idx, 1],
-            flow[idx, 0],
-            x_disp_start,
-            y_disp_start,
-            x_disp_end,
-            y_disp_end,
-        )
-
-        if np.abs(w11 + w12 + w21 + w22 - 1) > 1e-10 and debug:
-            import pdb
-
-            pdb.set_trace()
-            debug_data = {
-                "flow": flow.reshape(h, w, -1),
-                "offsets": flow_offsets,
-                "valid": valid,
-                "idx": idx,
-                "diff_x": diff_x,
-                "x_idxes_start": x_idxes_start,
-                "x_idxes_end": x_idxes_end,
-                "min_diff_x": min_diff_x,
-                "diff_y": diff_y,
-                "y_idxes_start": y_idxes_start,
-                "y_idxes_end": y_idxes_end,
-                "min_diff_y": min_diff_y,
-            }
-            torch.save(debug_data, "debug_data_w.pkl")
-
-        assert np.abs(w11 + w12 + w21 + w22 - 1) < 1e-10
-        offset_labs[idx, best_dilation_idx, x_idx_start, y_idx_start] = w11
-        offset_labs[idx, best_dilation_idx, x_idx_start, y_idx_end] = w12
-        offset_labs[idx, best_dilation_idx, x_idx_end, y_idx_start] = w21
-        offset_labs[idx, best_dilation_idx, x_idx_end, y_idx_end] = w22
+    offset_labs = np.zeros((h * w, num_dilation, num_disp, num_disp), dtype=np.float32)
+
+    pixels = np.arange(h * w)
+    offset_labs[pixels, dilation_idxes, x_idx_start, y_idx_start] = w11
+    offset_labs[pixels, dilation_idxes, x_idx_start, y_idx_end] = w12
+    offset_labs[pixels, dilation_idxes, x_idx_end, y_idx_start] = w21
+    offset_labs[pixels, dilation_idxes, x_idx_end, y_idx_end] = w22
 
     offset_labs = offset_labs.reshape(h, w, num_dilation, num_disp, num_disp)
-    dilation_labs = min_dilation_idxes.reshape(h, w)
+    dilation_labs = dilation_idxes.reshape(h, w)
 
-    # sanity check
-    offset_labs_reshape = offset_labs.reshape(h, w, -1)
-    err = np.sum(np.abs(np.sum(offset_labs_reshape, axis=2) - 1))
-    assert err < 1e-10, err
+    return offset_labs, dilation_labs
+
+
+def flow_to_bilinear_interpolation_indices(flow, valid, flow_offsets):
+    """
+    Get the compact form of the bilinear interpolation weights using flow_offsets,
+    the four non-zero weights of every pixel and their indices in the flattened D x O x O labels.
+    `DCVNet: Dilated Cost Volume Networks for Fast Optical Flow <https://jianghz.me/files/DCVNet_camera_ready_wacv2023.pdf>`_
+
+    Parameters
+    -----------
+    flow : np.array
+        Flow vectors of shape H x W x 2
+    valid : np.array
+        Valid flag for each pixel
+    flow_offsets :  np.array
+        Flow offset of shape D x O, D is number of dilations, O is number of offsets.
+        The offsets for each dilation must be arranged in an ascending order.
+
+    Returns
+    --------
+    offset_idxs: np.array
+        Indices of the bilinear interpolation weights in the flattened D x O x O labels. H x W x 4
+    offset_weights: np.array
+        Bilinear interpolation weights for each pixel, which sum to 1. H x W x 4
+    """
+    h, w, c = flow.shape
+    if valid is None:
+        valid = np.ones(flow.shape[:2]) > 0
+
+    assert np.all(np.diff(flow_offsets, axis=1) > 0)
+
+    flow = flow.reshape(h * w, c).astype(np.float64)
+    valid = valid.reshape(h * w) > 0
+
+    dilation_idxes, indices, weights = _bilinear_interpolation_indices(
+        flow, valid, flow_offsets
+    )
+    x_idx_start, x_idx_end, y_idx_start, y_idx_end = indices
+
+    num_disp = flow_offsets.shape[1]
+    base = dilation_idxes * num_disp * num_disp
+    offset_idxs = np.stack(
+        (
+            base + x_idx_start * num_disp + y_idx_start,
+            base + x_idx_start * num_disp + y_idx_end,
+            base + x_idx_end * num_disp + y_idx_start,
+            base + x_idx_end * num_disp + y_idx_end,
+        ),
+        axis=1,
+    )
+    offset_weights = np.stack(weights, axis=1)
+
+    err = np.abs(offset_weights.sum(axis=1) - 1)
+    assert np.all(err < 1e-10), err.max()
+
+    offset_idxs = offset_idxs.reshape(h, w, 4)
+    offset_weights = offset_weights.reshape(h, w, 4).astype(np.float32)
+
+    return offset_idxs, offset_weights
+
+
+def flow_to_bilinear_interpolation_weights_torch(flow, valid, flow_offsets):
+    """
+    Batched torch version of :func:`flow_to_bilinear_interpolation_weights`
+    which can run on the device of the flow.
+    `DCVNet: Dilated Cost Volume Networks for Fast Optical Flow <https://jianghz.me/files/DCVNet_camera_ready_wacv2023.pdf>`_
+
+    Parameters
+    -----------
+    flow : torch.Tensor
+        Flow vectors of shape N x 2 x H x W
+    valid : torch.Tensor
+        Valid flag for each pixel of shape N x H x W, all pixels are valid if None
+    flow_offsets :  np.array or torch.Tensor
+        Flow offset of shape D x O, D is number of dilations, O is number of offsets.
+        The offsets for each dilation must be arranged in an ascending order.
+
+    Returns
+    --------
+    offsets_labs: torch.Tensor
+        Bilinear interpolation weights for each pixel, which sum to 1. N x H x W x D x O x O
+    dilation_labs: torch.Tensor
+        In which dilation factor, are the bilinear interpolation weights found. N x H x W
+    """
+    n, c, h, w = flow.shape
+    if valid is None:
+        valid = torch.ones((n, h, w), dtype=torch.bool, device=flow.device)
+
+    flow_offsets = torch.as_tensor(flow_offsets).to(flow)
+
+    flow = flow.permute(0, 2, 3, 1).reshape(n * h * w, c)
+    valid = valid.reshape(n * h * w) > 0
+
+    dilation_idxes, indices, weights = _bilinear_interpolation_indices(
+        flow, valid, flow_offsets
+    )
+    x_idx_start, x_idx_end, y_idx_start, y_idx_end = indices
+    w11, w12, w21, w22 = weights
+
+    num_dilation, num_disp = flow_offsets.shape
+    offset_labs = flow.new_zeros((n * h * w, num_dilation, num_disp, num_disp))
+
+    pixels = torch.arange(n * h * w, device=flow.device)
+    offset_labs[pixels, dilation_idxes, x_idx_start, y_idx_start] = w11
+    offset_labs[pixels, dilation_idxes, x_idx_start, y_idx_end] = w12
+    offset_labs[pixels, dilation_idxes, x_idx_end, y_idx_start] = w21
+    offset_labs[pixels, dilation_idxes, x_idx_end, y_idx_end] = w22
+
+    offset_labs = offset_labs.reshape(n, h, w, num_dilation, num_disp, num_disp)
+    dilation_labs = dilation_idxes.reshape(n, h, w)
 
     return offset_labs, dilation_labs
@@ -0,0 +1,186 @@
+import os
+import os.path as osp
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .io import write_flow
+from .viz import flow_to_image
+
+
+class FlowWriter:
+    """
+    Writes optical flow predictions to files with a pool of background threads, so that
+    exporting the predictions of a whole benchmark does not block the model.
+
+    The number of predictions held in memory is bounded: once max_pending predictions are
+    waiting to be written, write blocks until a thread has finished writing one of them.
+    Errors raised by the threads are raised again by the next call to write or close.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory in which the files are written
+    ext : str, default : ".flo"
+        Extension of the flow files, which selects the format as in write_flow
+    num_threads : int, default : 4
+        Number of writing threads
+    max_pending : int, default : 16
+        Maximum number of predictions waiting to be written
+    visualize : bool, default : False
+        If True, a color coded image of every flow is also written, as <name>_vis.png
+    """
+
+    def __init__(
+        self, output_dir, ext=".flo", num_threads=4, max_pending=16, visualize=False
+    ):
+
+        assert max_pending >= 1, "max_pending must be at least 1"
+
+        self.output_dir = output_dir
+        self.ext = ext
+        self.visualize = visualize
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_threads, thread_name_prefix="FlowWriter"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._closed = False
+
+        self._n_samples = 0
+        self._n_files = 0
+        self._n_bytes = 0
+        self._start_time = time.perf_counter()
+        self._summary = None
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _check_errors(self):
+        with self._lock:
+            failed = [future for future in self._futures if future.done()]
+        for future in failed:
+            # Raises the exception of a failed write
+            future.result()
+
+    def _write(self, name, flow, valid):
+        files = [osp.join(self.output_dir, name + self.ext)]
+        os.makedirs(osp.dirname(files[0]), exist_ok=True)
+        write_flow(files[0], flow, valid=valid)
+
+        if self.visualize:
+            files.append(osp.join(self.output_dir, name + "_vis.png"))
+            cv2.imwrite(files[1], flow_to_image(flow)[..., ::-1])
+
+        n_bytes = sum(osp.getsize(file) for file in files)
+        with self._lock:
+            self._n_samples += 1
+            self._n_files += len(files)
+            self._n_bytes += n_bytes
+
+    def _done(self, future):
+        with self._lock:
+            if future.exception() is None:
+                self._futures.discard(future)
+        self._slots.release()
+
+    def write(self, name, flow, valid=None):
+        """
+        Queues a prediction to be written, blocking while max_pending predictions are
+        waiting to be written.
+
+        The prediction is written as it is once the writing thread gets to it, it must not be
+        modified in place after this call.
+
+        Parameters
+        ----------
+        name : str
+            Path of the file relative to output_dir, without extension
+        flow : torch.Tensor or np.ndarray
+            Optical flow of shape 2 x H x W for tensors and H x W x 2 for arrays
+        valid : torch.Tensor or np.ndarray, optional
+            Valid flow mask of shape H x W, only stored in .png files
+        """
+        assert not self._closed, "Cannot write with a closed FlowWriter"
+        self._check_errors()
+
+        if hasattr(flow, "detach"):
+            flow = np.moveaxis(flow.detach().cpu().numpy(), 0, -1)
+        if valid is not None:
+            if hasattr(valid, "detach"):
+                valid = valid.detach().cpu().numpy()
+            valid = valid.reshape(flow.shape[:2])
+
+        self._slots.acquire()
+        future = self._executor.submit(self._write, name, flow, valid)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def write_batch(self, names, flows, valid=None):
+        """
+        Queues a batch of predictions to be written.
+
+        Parameters
+        ----------
+        names : :obj:`list` of :obj:`str`
+            Paths of the files relative to output_dir, without extension
+        flows : torch.Tensor or np.ndarray
+            Optical flows of shape N x 2 x H x W
+        valid : torch.Tensor or np.ndarray, optional
+            Valid flow masks of shape N x H x W or N x 1 x H x W, only stored in .png files
+        """
+        assert len(names) == len(flows)
+
+        # A single copy of the batch from the device
+        if hasattr(flows, "detach"):
+            flows = flows.detach().cpu().numpy()
+        if valid is not None and hasattr(valid, "detach"):
+            valid = valid.detach().cpu().numpy()
+
+        flows = np.moveaxis(flows, 1, -1)
+        for i, name in enumerate(names):
+            self.write(name, flows[i], None if valid is None else valid[i])
+
+    def close(self):
+        """
+        Waits for all the predictions to be written and stops the threads.
+
+        Returns
+        -------
+        dict
+            The number of samples, files and bytes written, the time in seconds since the writer
+            was created and the number of samples written per second
+        """
+        if self._summary is not None:
+            return self._summary
+
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        self._check_errors()
+
+        elapsed = time.perf_counter() - self._start_time
+        self._summary = {
+            "samples": self._n_samples,
+            "files": self._n_files,
+            "bytes": self._n_bytes,
+            "seconds": elapsed,
+            "samples_per_sec": self._n_samples / elapsed if elapsed > 0 else 0.0,
+        }
+        return self._summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            # Let the writes in progress finish without hiding the original exception
+            self._closed = True
+            self._executor.shutdown(wait=True)
+        return False
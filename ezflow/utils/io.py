@@ -1,4 +1,5 @@
 import re
+from io import BytesIO
 from os.path import *
 
 import cv2
@@ -6,11 +7,22 @@ import numpy as np
 import torch.nn.functional as F
 from PIL import Image
 
+from .registry import Registry
+
 cv2.setNumThreads(0)
 cv2.ocl.setUseOpenCL(False)
 
 TAG_CHAR = np.array([202021.25], np.float32)
 
+# Magic number of the half precision .flo16 format
+TAG_FLO16 = b"FL16"
+
+IMAGE_DECODER_REGISTRY = Registry("IMAGE_DECODER")
+
+# Leading bytes of encoded PNG and JPEG images
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_JPEG_SIGNATURE = b"\xff\xd8"
+
 
 def read_flow_middlebury(fn):
     """
@@ -45,28 +57,47 @@ def read_flow_middlebury(fn):
             return np.resize(data, (int(h), int(w), 2))
 
 
-def read_flow_pfm(file):
+def read_flow_middlebury_mmap(fn):
     """
-    Read optical flow from a .pfm file
+    Read .flo file in Middlebury format as a memory-mapped array.
+    Only the pages of the file which are accessed are read from disk.
 
     Parameters
     -----------
-    file : str
-        Path to flow file
+    fn : str
+        Absolute path to flow file
 
     Returns
     --------
-    flow : np.ndarray
-        Optical flow map
+    flow : np.memmap
+        Optical flow map of shape H x W x 2
     """
 
-    file = open(file, "rb")
+    with open(fn, "rb") as f:
+        header = f.read(12)
+
+    magic = np.frombuffer(header[:4], np.float32)[0]
+    if 202021.25 != magic:
+        print("Magic number incorrect. Invalid .flo file")
+        return None
+
+    w, h = np.frombuffer(header[4:12], np.int32)
 
-    color = None
-    width = None
-    height = None
-    scale = None
-    endian = None
+    # Copy-on-write mapping, in-place operations never modify the file on disk
+    return np.memmap(fn, dtype=np.float32, mode="c", offset=12, shape=(h, w, 2))
+
+
+def _read_pfm_header(file):
+    """
+    Parses the header of an open .pfm file
+
+    Returns
+    --------
+    shape : tuple
+        Shape of the data
+    endian : str
+        Byte order of the data
+    """
 
     header = file.readline().rstrip()
     if header == b"PF":
@@ -85,19 +116,96 @@ def read_flow_pfm(file):
     scale = float(file.readline().rstrip())
     if scale < 0:  # little-endian
         endian = "<"
-        scale = -scale
     else:
         endian = ">"  # big-endian
 
-    data = np.fromfile(file, endian + "f")
     shape = (height, width, 3) if color else (height, width)
 
+    return shape, endian
+
+
+def read_flow_pfm(file):
+    """
+    Read optical flow from a .pfm file
+
+    Parameters
+    -----------
+    file : str
+        Path to flow file
+
+    Returns
+    --------
+    flow : np.ndarray
+        Optical flow map
+    """
+
+    file = open(file, "rb")
+
+    shape, endian = _read_pfm_header(file)
+
+    data = np.fromfile(file, endian + "f")
+
     data = np.reshape(data, shape)
     data = np.flipud(data)
 
     return data
 
 
+def read_flow_pfm_mmap(file):
+    """
+    Read optical flow from a .pfm file as a memory-mapped array.
+    The vertical flip of the PFM layout is returned as a view, so
+    only the rows which are accessed are read from disk.
+
+    Parameters
+    -----------
+    file : str
+        Path to flow file
+
+    Returns
+    --------
+    flow : np.memmap
+        Optical flow map
+    """
+
+    with open(file, "rb") as f:
+        shape, endian = _read_pfm_header(f)
+        offset = f.tell()
+
+    data = np.memmap(file, dtype=endian + "f", mode="c", offset=offset, shape=shape)
+
+    return data[::-1]
+
+
+def read_flow_flo16(fn, mmap=False):
+    """
+    Read a .flo16 file, which stores the flow in half precision in the layout of the
+    Middlebury format: a magic number, the width and height as int32, and the flow of
+    shape H x W x 2 as float16.
+
+    Parameters
+    -----------
+    fn : str
+        Path to flow file
+    mmap : bool, default : False
+        If True, the flow is returned as a memory-mapped float16 array
+
+    Returns
+    --------
+    flow : np.ndarray
+        Optical flow map of shape H x W x 2, as float16
+    """
+    with open(fn, "rb") as f:
+        header = f.read(12)
+        assert header[:4] == TAG_FLO16, f"Invalid .flo16 file {fn}"
+        w, h = np.frombuffer(header[4:12], "<i4")
+
+        if not mmap:
+            return np.fromfile(f, "<f2", count=2 * int(w) * int(h)).reshape(h, w, 2)
+
+    return np.memmap(fn, dtype="<f2", mode="c", offset=12, shape=(h, w, 2))
+
+
 def read_flow_png(filename):
     """
     Read optical flow from a png file.
@@ -122,12 +230,17 @@ def read_flow_png(filename):
     return flow, valid
 
 
-def write_flow(filename, uv, v=None):
+def write_flow(filename, uv, v=None, valid=None):
     """Write optical flow to file.
 
     If v is None, uv is assumed to contain both u and v channels,
     stacked in depth.
 
+    The format is selected by the extension of the file:
+    .flo for the Middlebury format in single precision, .flo16 for the same layout
+    in half precision and .png for the 16-bit PNG format of KITTI, which also stores
+    the valid mask. The compact formats are read back by read_flow.
+
     Parameters
     ----------
     filename : str
@@ -136,53 +249,222 @@ def write_flow(filename, uv, v=None):
         Optical flow
     v : np.ndarray, optional
         Optional second channel
+    valid : np.ndarray, optional
+        Valid flow mask of shape H x W, only stored in .png files.
+        By default every pixel is valid.
     """
 
-    # Original code by Deqing Sun, adapted from Daniel Scharstein.
-
-    n_bands = 2
-
     if v is None:
         assert uv.ndim == 3
         assert uv.shape[2] == 2
-        u = uv[:, :, 0]
-        v = uv[:, :, 1]
+        flow = uv
     else:
-        u = uv
-
-    assert u.shape == v.shape
-    height, width = u.shape
-    f = open(filename, "wb")
-    # write the header
-    f.write(TAG_CHAR)
-    np.array(width).astype(np.int32).tofile(f)
-    np.array(height).astype(np.int32).tofile(f)
-    # arrange into matrix form
-    tmp = np.zeros((height, width * n_bands))
-    tmp[:, np.arange(width) * 2] = u
-    tmp[:, np.arange(width) * 2 + 1] = v
-    tmp.astype(np.float32).tofile(f)
-    f.close()
-
-
-def read_image(file_name):
+        assert uv.shape == v.shape
+        flow = np.stack([uv, v], axis=-1)
+
+    height, width = flow.shape[:2]
+    ext = splitext(filename)[-1]
+
+    if ext == ".png":
+        write_flow_png(filename, flow, valid)
+        return
+
+    if ext == ".flo16":
+        tag, dtype = TAG_FLO16, "<f2"
+    else:
+        tag, dtype = TAG_CHAR.tobytes(), "<f4"
+
+    with open(filename, "wb") as f:
+        f.write(tag)
+        np.array([width, height], dtype="<i4").tofile(f)
+        # Interleaved u and v values, row by row
+        np.ascontiguousarray(flow, dtype=dtype).tofile(f)
+
+
+def write_flow_png(filename, flow, valid=None):
+    """
+    Write optical flow to a 16-bit PNG file in the format of KITTI.
+    The flow is stored with a precision of 1/64 pixel in the range [-512, 512].
+
+    Parameters
+    ----------
+    filename : str
+        Path to file
+    flow : np.ndarray
+        Optical flow of shape H x W x 2
+    valid : np.ndarray, optional
+        Valid flow mask of shape H x W, by default every pixel is valid
+    """
+    height, width = flow.shape[:2]
+
+    # Blue, green and red channels for OpenCV: valid, v and u
+    data = np.empty((height, width, 3), dtype=np.uint16)
+    encoded = np.rint(flow[..., ::-1] * 64.0 + 2**15)
+    np.clip(encoded, 0, 2**16 - 1, out=data[..., 1:], casting="unsafe")
+    data[..., 0] = 1 if valid is None else valid > 0
+
+    cv2.imwrite(filename, data)
+
+
+def write_flow_batch(filenames, flows, valid=None):
+    """
+    Write a batch of optical flows, for example the flows predicted by a model, to files.
+
+    Parameters
+    ----------
+    filenames : :obj:`list` of :obj:`str`
+        Paths to the files, whose extensions select the formats as in write_flow
+    flows : torch.Tensor or np.ndarray
+        Optical flows of shape N x 2 x H x W
+    valid : torch.Tensor or np.ndarray, optional
+        Valid flow masks of shape N x H x W or N x 1 x H x W, only stored in .png files
+    """
+    if hasattr(flows, "detach"):
+        flows = flows.detach().cpu().numpy()
+    if valid is not None and hasattr(valid, "detach"):
+        valid = valid.detach().cpu().numpy()
+
+    assert len(filenames) == len(flows)
+    # A single conversion of the batch to the H x W x 2 layout of the files
+    flows = np.moveaxis(flows, 1, -1)
+
+    for i, filename in enumerate(filenames):
+        write_flow(
+            filename,
+            flows[i],
+            valid=None if valid is None else valid[i].reshape(flows.shape[1:3]),
+        )
+
+
+def _to_uint8(img):
+    if img.dtype == np.uint16:
+        # 16-bit images are reduced to their 8 most significant bits
+        return (img >> 8).astype(np.uint8)
+
+    return img.astype(np.uint8, copy=False)
+
+
+@IMAGE_DECODER_REGISTRY.register(name="pil")
+def decode_image_pil(file_name):
+    """
+    Decodes an image file with PIL.
+
+    Parameters
+    -----------
+    file_name : str or bytes
+        Path to the image file, or the encoded image
+
+    Returns
+    --------
+    np.ndarray
+        Image of shape H x W x C or H x W for grayscale images, as uint8
+    """
+    if isinstance(file_name, bytes):
+        file_name = BytesIO(file_name)
+
+    with Image.open(file_name) as img:
+        return _to_uint8(np.array(img))
+
+
+@IMAGE_DECODER_REGISTRY.register(name="opencv")
+def decode_image_opencv(file_name):
+    """
+    Decodes an image file with OpenCV, keeping its channels with IMREAD_UNCHANGED.
+
+    Parameters
+    -----------
+    file_name : str or bytes
+        Path to the image file, or the encoded image
+
+    Returns
+    --------
+    np.ndarray
+        Image of shape H x W x C in RGB(A) order or H x W for grayscale images, as uint8
+    """
+    if isinstance(file_name, bytes):
+        img = cv2.imdecode(np.frombuffer(file_name, np.uint8), cv2.IMREAD_UNCHANGED)
+        assert img is not None, "Could not decode the image bytes"
+    else:
+        img = cv2.imread(file_name, cv2.IMREAD_UNCHANGED)
+        assert img is not None, f"Could not decode {file_name}"
+
+    if img.ndim == 3 and img.shape[2] == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+
+    return _to_uint8(img)
+
+
+@IMAGE_DECODER_REGISTRY.register(name="torchvision")
+def decode_image_torchvision(file_name):
+    """
+    Decodes a PNG or JPEG file from its bytes with torchvision.io.decode_png or decode_jpeg.
+    Other formats are decoded with PIL.
+
+    Parameters
+    -----------
+    file_name : str or bytes
+        Path to the image file, or the encoded image
+
+    Returns
+    --------
+    np.ndarray
+        Image of shape H x W x C or H x W for grayscale images, as uint8
+    """
+    import torch
+    from torchvision import io
+
+    if isinstance(file_name, bytes):
+        is_png = file_name.startswith(_PNG_SIGNATURE)
+        is_jpeg = file_name.startswith(_JPEG_SIGNATURE)
+    else:
+        ext = splitext(file_name)[-1].lower()
+        is_png, is_jpeg = ext == ".png", ext in [".jpg", ".jpeg"]
+
+    if not (is_png or is_jpeg):
+        return decode_image_pil(file_name)
+
+    if isinstance(file_name, bytes):
+        data = torch.from_numpy(np.frombuffer(file_name, np.uint8).copy())
+    else:
+        data = io.read_file(file_name)
+
+    img = io.decode_png(data) if is_png else io.decode_jpeg(data)
+
+    # A view of the decoded tensor in H x W x C order
+    img = _to_uint8(img.permute(1, 2, 0).numpy())
+    if img.shape[2] == 1:
+        return img[..., 0]
+
+    return img
+
+
+def read_image(file_name, decoder=None):
     """
     Read images from a variety of file formats
 
     Parameters
     -----------
     file_name : str
-        Path to flow file
+        Path to image file
+    decoder : str, optional
+        Name of an image decoder of IMAGE_DECODER_REGISTRY, one of "pil", "opencv" and
+        "torchvision", used for .png, .jpeg, .jpg and .ppm files. If None, these files are
+        returned as PIL images.
 
     Returns
     --------
-    flow : np.ndarray
-        Optical flow map
+    img : PIL.Image.Image or np.ndarray
+        Image, as a uint8 array of shape H x W x C or H x W if decoder is set
     """
 
     ext = splitext(file_name)[-1]
 
     if ext == ".png" or ext == ".jpeg" or ext == ".ppm" or ext == ".jpg":
+        if decoder is not None:
+            return IMAGE_DECODER_REGISTRY.get(decoder)(file_name)
+
         return Image.open(file_name)
 
     elif ext == ".bin" or ext == ".raw":
@@ -191,7 +473,7 @@ def read_image(file_name):
     return []
 
 
-def read_flow(file_name):
+def read_flow(file_name, mmap=False):
     """
     Read ground truth flow from a variety of file formats
 
@@ -199,6 +481,10 @@ def read_flow(file_name):
     -----------
     file_name : str
         Path to flow file
+    mmap : bool, default : False
+        If True, .flo and .pfm files are returned as memory-mapped views
+        which are only read from disk when accessed, and .flo16 files are
+        converted to float32 from memory-mapped views
 
     Returns
     --------
@@ -212,18 +498,29 @@ def read_flow(file_name):
     ext = splitext(file_name)[-1]
 
     if ext == ".flo":
-        flow = read_flow_middlebury(file_name).astype(np.float32)
-        return flow, None
+        if mmap:
+            flow = read_flow_middlebury_mmap(file_name)
+        else:
+            flow = read_flow_middlebury(file_name)
+
+        return flow.astype(np.float32, copy=not mmap), None
 
     elif ext == ".pfm":
 
-        flow = read_flow_pfm(file_name).astype(np.float32)
+        if mmap:
+            flow = read_flow_pfm_mmap(file_name).astype(np.float32, copy=False)
+        else:
+            flow = read_flow_pfm(file_name).astype(np.float32)
 
         if len(flow.shape) == 2:
             return flow, None
         else:
             return flow[:, :, :-1], None
 
+    elif ext == ".flo16":
+        flow = read_flow_flo16(file_name, mmap=mmap)
+        return flow.astype(np.float32), None
+
     elif ext == ".png":
         return read_flow_png(file_name)
 
@@ -0,0 +1,237 @@
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from .shared_arrays import SharedArraysMixin, stable_hash
+
+# Columns of the stage table
+_KEY, _CALLS, _NANOSECONDS, _BYTES = range(4)
+_N_COLUMNS = 4
+
+# Stage names are stored as fixed size byte strings
+_NAME_BYTES = 32
+
+
+def _nbytes(data):
+    if isinstance(data, (list, tuple)):
+        return sum(_nbytes(x) for x in data)
+
+    if isinstance(data, dict):
+        return sum(_nbytes(x) for x in data.values())
+
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+
+    if hasattr(data, "element_size") and hasattr(data, "nelement"):
+        # torch.Tensor
+        return data.element_size() * data.nelement()
+
+    return 0
+
+
+class _Stage:
+    """
+    A timed stage of a StageProfiler, used as a context manager.
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = 0
+
+    def output(self, *data):
+        """
+        Counts the bytes of the arrays or tensors produced by the stage.
+
+        Parameters
+        ----------
+        *data : numpy.ndarray, torch.Tensor, list, tuple or dict
+            The data produced by the stage
+        """
+        self.nbytes += _nbytes(data)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(
+            self.name, time.perf_counter_ns() - self.start, nbytes=self.nbytes
+        )
+        return False
+
+
+class _NullStage:
+    """
+    A stage which does not record anything, used when profiling is disabled.
+    """
+
+    def output(self, *data):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def profile_stage(profiler, name):
+    """
+    Returns a context manager timing a stage of a data pipeline with a profiler.
+
+    Parameters
+    ----------
+    profiler : StageProfiler or None
+        The profiler, if None the stage is not recorded
+    name : str
+        The name of the stage
+
+    Returns
+    -------
+    context manager
+        Its output method counts the bytes produced by the stage
+    """
+    if profiler is None:
+        return _NULL_STAGE
+
+    return _Stage(profiler, name)
+
+
+class StageProfiler(SharedArraysMixin):
+    """
+    Records the time and the bytes produced by the stages of a data pipeline.
+    The records are kept in shared memory, so that a profiler created in the main process
+    aggregates the stages executed by all the DataLoader worker processes.
+
+    Parameters
+    ----------
+    max_stages : int, default : 64
+        The maximum number of distinct stages
+    """
+
+    _attached_attrs = ("_table", "_names", "_rows")
+
+    def __init__(self, max_stages=64):
+
+        self.max_stages = int(max_stages)
+
+        self._lock = mp.Lock()
+        self._create_shared_memory(self.max_stages * (8 * _N_COLUMNS + _NAME_BYTES))
+
+        self._table[:, _KEY] = -1
+        self._table[:, 1:] = 0
+
+    def _attach(self):
+        buf = self._shm.buf
+        self._table = np.ndarray(
+            (self.max_stages, _N_COLUMNS), dtype=np.int64, buffer=buf
+        )
+        self._names = np.ndarray(
+            (self.max_stages,),
+            dtype=f"S{_NAME_BYTES}",
+            buffer=buf,
+            offset=8 * self._table.size,
+        )
+        # Row of every stage seen by this process
+        self._rows = {}
+
+    def _row(self, name):
+        row = self._rows.get(name)
+        if row is not None:
+            return row
+
+        key = stable_hash(name)
+        with self._lock:
+            rows = np.flatnonzero(self._table[:, _KEY] == key)
+            if len(rows) > 0:
+                row = rows[0]
+            else:
+                free = np.flatnonzero(self._table[:, _KEY] < 0)
+                assert len(free) > 0, f"More than {self.max_stages} profiled stages"
+                row = free[0]
+                self._table[row] = (key, 0, 0, 0)
+                self._names[row] = name.encode()[:_NAME_BYTES]
+
+        self._rows[name] = row
+        return row
+
+    def stage(self, name):
+        """
+        Returns a context manager timing a stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+
+        Returns
+        -------
+        context manager
+            Its output method counts the bytes produced by the stage
+        """
+        return _Stage(self, name)
+
+    def record(self, name, nanoseconds, nbytes=0):
+        """
+        Records an execution of a stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+        nanoseconds : int
+            The duration of the stage in nanoseconds
+        nbytes : int, default : 0
+            The number of bytes produced by the stage
+        """
+        row = self._row(name)
+        with self._lock:
+            self._table[row, _CALLS] += 1
+            self._table[row, _NANOSECONDS] += nanoseconds
+            self._table[row, _BYTES] += nbytes
+
+    def reset(self):
+        """
+        Clears the records of all the processes, the stages keep their order.
+        """
+        with self._lock:
+            self._table[:, 1:] = 0
+
+    def stats(self, n_samples=None):
+        """
+        Returns the records of the stages summed over all processes.
+
+        Parameters
+        ----------
+        n_samples : int, optional
+            The number of samples over which the records are averaged
+
+        Returns
+        -------
+        dict
+            For every stage in the order in which they were first recorded, the number of calls,
+            the total time in ms and, if n_samples is given, the time in ms and the bytes
+            produced per sample
+        """
+        with self._lock:
+            table = self._table.copy()
+            names = self._names.copy()
+
+        stats = {}
+        for row in np.flatnonzero(table[:, _KEY] >= 0):
+            stage = {
+                "calls": int(table[row, _CALLS]),
+                "total_ms": table[row, _NANOSECONDS] / 1e6,
+            }
+            if n_samples:
+                stage["ms_per_sample"] = stage["total_ms"] / n_samples
+                stage["bytes_per_sample"] = table[row, _BYTES] / n_samples
+
+            stats[names[row].decode()] = stage
+
+        return stats
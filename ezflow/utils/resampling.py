@@ -1,56 +1,70 @@
-import numpy as np
 import torch
 import torch.nn.functional as F
-from scipy import interpolate
 
 
 def forward_interpolate(flow):
     """
-    Forward interpolation of flow field
+    Forward interpolation of flow field, used to initialize the flow of a frame
+    with the flow of the previous frame as in RAFT. Every flow vector is moved to the
+    nearest pixel of its end point, the pixels reached by no vector take the flow of the
+    nearest reached pixels. The interpolation runs on the device of the flow.
 
     Parameters
     ----------
     flow : torch.Tensor
-        Flow field to be interpolated
+        Flow field to be interpolated of shape 2 x H x W or N x 2 x H x W
 
     Returns
     -------
     torch.Tensor
-        Forward interpolated flow field
+        Forward interpolated flow field of the shape of the input, as float
 
     """
 
-    flow = flow.detach().cpu().numpy()
-    dx, dy = flow[0], flow[1]
+    is_batch = flow.dim() == 4
+    flow = flow.detach().float()
+    if not is_batch:
+        flow = flow.unsqueeze(0)
 
-    ht, wd = dx.shape
-    x0, y0 = np.meshgrid(np.arange(wd), np.arange(ht))
+    N, _, H, W = flow.shape
+    device = flow.device
 
-    x1 = x0 + dx
-    y1 = y0 + dy
+    y0, x0 = torch.meshgrid(
+        torch.arange(H, device=device), torch.arange(W, device=device), indexing="ij"
+    )
+    x1 = x0 + flow[:, 0]
+    y1 = y0 + flow[:, 1]
 
-    x1 = x1.reshape(-1)
-    y1 = y1.reshape(-1)
-    dx = dx.reshape(-1)
-    dy = dy.reshape(-1)
+    valid = (x1 > 0) & (x1 < W) & (y1 > 0) & (y1 < H)
 
-    valid = (x1 > 0) & (x1 < wd) & (y1 > 0) & (y1 < ht)
-    x1 = x1[valid]
-    y1 = y1[valid]
-    dx = dx[valid]
-    dy = dy[valid]
+    # Vectors moved to the same pixel are averaged
+    batch = torch.arange(N, device=device).view(N, 1, 1).expand(N, H, W)
+    x1 = x1.round().long().clamp(max=W - 1)
+    y1 = y1.round().long().clamp(max=H - 1)
+    index = ((batch * H + y1) * W + x1)[valid]
 
-    flow_x = interpolate.griddata(
-        (x1, y1), dx, (x0, y0), method="nearest", fill_value=0
+    vectors = flow.permute(0, 2, 3, 1)[valid]
+    flow_sum = torch.zeros(N * H * W, 2, device=device).index_add_(0, index, vectors)
+    count = torch.zeros(N * H * W, device=device).index_add_(
+        0, index, torch.ones_like(index, dtype=torch.float32)
     )
 
-    flow_y = interpolate.griddata(
-        (x1, y1), dy, (x0, y0), method="nearest", fill_value=0
-    )
+    flow = (flow_sum / count.clamp(min=1).unsqueeze(1)).view(N, H, W, 2)
+    flow = flow.permute(0, 3, 1, 2).contiguous()
+    filled = (count > 0).view(N, 1, H, W)
+
+    # The holes are filled ring by ring with the mean of their filled neighbours
+    while True:
+        weight = F.avg_pool2d(filled.float(), 3, stride=1, padding=1)
+        fill = ~filled & (weight > 0)
+        if not fill.any():
+            break
 
-    flow = np.stack([flow_x, flow_y], axis=0)
+        neighbours = F.avg_pool2d(flow * filled, 3, stride=1, padding=1)
+        flow = torch.where(fill, neighbours / weight.clamp(min=1e-6), flow)
+        filled = filled | fill
 
-    return torch.from_numpy(flow).float()
+    return flow if is_batch else flow[0]
 
 
 def bilinear_sampler(img, coords, mask=False):
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+
+def stable_hash(key):
+    """
+    Returns a non-negative 63 bit hash of the string representation of a key.
+    Unlike hash() of str objects, it is the same in every process.
+
+    Parameters
+    ----------
+    key : object
+        The key to hash
+
+    Returns
+    -------
+    int
+        The hash of the key
+    """
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & (2**63 - 1)
+
+
+def _release_shared_memory(shm, owner_pid):
+    # Forked DataLoader workers inherit this finalizer, only the creating process unlinks.
+    try:
+        shm.close()
+    except BufferError:
+        # Views of the shared memory are still alive at interpreter exit
+        pass
+
+    if os.getpid() == owner_pid:
+        shm.unlink()
+
+
+class SharedArraysMixin:
+    """
+    Shared memory bookkeeping of objects which keep numpy arrays in a shared memory block,
+    created in the main process and visible to all the DataLoader worker processes.
+
+    Classes create the block with _create_shared_memory and implement _attach, which creates
+    the views of self._shm.buf. The attributes set by _attach are listed in _attached_attrs,
+    they are not pickled: worker processes started with the spawn method attach to the block
+    by name instead. The block is owned and unlinked by the creating process.
+    """
+
+    _attached_attrs = ()
+
+    def _create_shared_memory(self, size):
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._attach()
+
+        self._finalizer = weakref.finalize(
+            self, _release_shared_memory, self._shm, os.getpid()
+        )
+
+    def _attach(self):
+        raise NotImplementedError
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_shm", "_finalizer") + tuple(self._attached_attrs):
+            state.pop(key, None)
+        state["_shm_name"] = self._shm.name
+        return state
+
+    def __setstate__(self, state):
+        shm_name = state.pop("_shm_name")
+        self.__dict__.update(state)
+
+        self._shm = shared_memory.SharedMemory(name=shm_name)
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._attach()
+        self._finalizer = None
@@ -1 +1,83 @@
-pass
+import numpy as np
+
+
+def make_colorwheel():
+    """
+    Returns the color wheel of the Middlebury flow color coding, Baker et al.,
+    "A Database and Evaluation Methodology for Optical Flow", ICCV 2007.
+
+    Returns
+    --------
+    np.ndarray
+        Colors of the wheel of shape 55 x 3, in the range [0, 255]
+    """
+
+    # Number of hues from red to yellow, green, cyan, blue, magenta and back to red,
+    # with the saturated channel and the channel ramped up (+1) or down (-1)
+    segments = [
+        (15, 0, 1, 1),
+        (6, 1, 0, -1),
+        (4, 1, 2, 1),
+        (11, 2, 1, -1),
+        (13, 2, 0, 1),
+        (6, 0, 2, -1),
+    ]
+
+    colorwheel = []
+    for n_colors, channel, ramp_channel, direction in segments:
+        ramp = np.floor(255 * np.arange(n_colors) / n_colors)
+
+        colors = np.zeros((n_colors, 3))
+        colors[:, channel] = 255
+        colors[:, ramp_channel] = ramp if direction > 0 else 255 - ramp
+        colorwheel.append(colors)
+
+    return np.concatenate(colorwheel)
+
+
+def flow_to_image(flow, max_flow=None):
+    """
+    Converts an optical flow map to a color image with the Middlebury color coding,
+    in which the hue encodes the direction and the saturation the magnitude of the flow.
+
+    Parameters
+    -----------
+    flow : np.ndarray
+        Optical flow of shape H x W x 2
+    max_flow : float, optional
+        Magnitude mapped to full saturation, by default the largest magnitude of the flow
+
+    Returns
+    --------
+    np.ndarray
+        RGB image of shape H x W x 3, as uint8
+    """
+
+    # Diverged predictions are shown as zero flow
+    flow = np.nan_to_num(flow, nan=0.0, posinf=0.0, neginf=0.0)
+
+    u, v = flow[..., 0], flow[..., 1]
+    magnitude = np.sqrt(u**2 + v**2)
+
+    if max_flow is None:
+        max_flow = magnitude.max()
+    scale = 1.0 / (max_flow + 1e-5)
+    u, v, magnitude = u * scale, v * scale, magnitude * scale
+
+    colorwheel = make_colorwheel()
+    n_colors = colorwheel.shape[0]
+
+    angle = np.arctan2(-v, -u) / np.pi
+    position = (angle + 1) / 2 * (n_colors - 1)
+    k0 = np.floor(position).astype(np.int32)
+    k1 = (k0 + 1) % n_colors
+    weight = (position - k0)[..., None]
+
+    color = ((1 - weight) * colorwheel[k0] + weight * colorwheel[k1]) / 255
+
+    # Desaturate small flows, dim the flows beyond max_flow
+    inside = (magnitude <= 1)[..., None]
+    saturation = magnitude[..., None]
+    color = np.where(inside, 1 - saturation * (1 - color), color * 0.75)
+
+    return np.floor(255 * color).astype(np.uint8)
@@ -0,0 +1,632 @@
+import functools
+import os
+import os.path as osp
+from unittest import mock
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader
+
+from ezflow.data import (
+    BaseDataset,
+    BucketBatchSampler,
+    DataloaderCreator,
+    DeviceDataLoader,
+    FrameStreamDataset,
+    MixtureSampler,
+    MPISintel,
+    ResumableSampler,
+    ShardedFlowDataset,
+    SharedSampleCache,
+    TarFlowDataset,
+    WorkerSeeder,
+    get_image_sizes,
+    sample_cache_stats,
+    write_flow_shards,
+    write_tar_shards,
+)
+from ezflow.functional import Normalize
+from ezflow.utils import StageProfiler, write_flow
+
+
+def _create_dataset(root_dir, n_samples=3, size=(32, 48), **kwargs):
+
+    dataset = BaseDataset(augment=False, **kwargs)
+
+    for i in range(n_samples):
+        img1 = np.random.randint(0, 255, (*size, 3), dtype=np.uint8)
+        img2 = np.random.randint(0, 255, (*size, 3), dtype=np.uint8)
+        flow = np.random.randn(*size, 2).astype(np.float32)
+
+        img1_path = osp.join(root_dir, f"{i:03d}_img1.png")
+        img2_path = osp.join(root_dir, f"{i:03d}_img2.png")
+        flow_path = osp.join(root_dir, f"{i:03d}_flow.flo")
+
+        Image.fromarray(img1).save(img1_path)
+        Image.fromarray(img2).save(img2_path)
+        write_flow(flow_path, flow)
+
+        dataset.image_list.append([img1_path, img2_path])
+        dataset.flow_list.append(flow_path)
+
+    return dataset
+
+
+def test_ShardedFlowDataset(tmp_path):
+
+    dataset = _create_dataset(str(tmp_path))
+    shard_dir = str(tmp_path / "shards")
+
+    meta = write_flow_shards(
+        dataset, shard_dir, samples_per_shard=2, flow_dtype="float32"
+    )
+    assert meta["num_samples"] == 3
+    assert len(meta["shards"]) == 2
+
+    sharded_dataset = ShardedFlowDataset(shard_dir, augment=False)
+    assert len(sharded_dataset) == len(dataset)
+
+    for i in range(len(dataset)):
+        (img1, img2), target = dataset[i]
+        (s_img1, s_img2), s_target = sharded_dataset[i]
+
+        assert torch.equal(img1, s_img1)
+        assert torch.equal(img2, s_img2)
+        assert torch.equal(target["flow_gt"], s_target["flow_gt"])
+
+    sharded_dataset = 2 * sharded_dataset
+    assert len(sharded_dataset) == 2 * len(dataset)
+
+
+def test_TarFlowDataset(tmp_path):
+
+    dataset = _create_dataset(str(tmp_path), n_samples=5)
+    tar_dir = str(tmp_path / "tar_shards")
+
+    meta = write_tar_shards(dataset, tar_dir, samples_per_shard=2, flow_dtype="float32")
+    assert meta["num_samples"] == 5
+    assert len(meta["shards"]) == 3
+
+    tar_dataset = TarFlowDataset(tar_dir, augment=False, shuffle=False)
+    assert len(tar_dataset) == len(dataset)
+
+    samples = list(tar_dataset)
+    assert len(samples) == len(dataset)
+    for i, ((img1, img2), target) in enumerate(samples):
+        (d_img1, d_img2), d_target = dataset[i]
+
+        assert torch.equal(img1, d_img1)
+        assert torch.equal(img2, d_img2)
+        assert torch.equal(target["flow_gt"], d_target["flow_gt"])
+
+    # The frames are decoded with the decoder of io_params
+    for decoder in ["opencv", "torchvision"]:
+        io_params = {"mmap_flow": False, "image_decoder": decoder}
+        decoded = TarFlowDataset(
+            tar_dir, augment=False, shuffle=False, io_params=io_params
+        )
+        for ((img1, img2), _), ((s_img1, s_img2), _) in zip(decoded, samples):
+            assert torch.equal(img1, s_img1) and torch.equal(img2, s_img2)
+
+    flow_sums = sorted(target["flow_gt"].sum().item() for _, target in samples)
+
+    # The shards and the samples are shuffled, every sample is read once per repetition
+    tar_dataset = 2 * TarFlowDataset(tar_dir, augment=False, shuffle_buffer=3)
+    assert len(tar_dataset) == 2 * len(dataset)
+    shuffled = [target["flow_gt"].sum().item() for _, target in tar_dataset]
+    assert sorted(shuffled) == sorted(2 * flow_sums)
+
+    dataloader_creator = DataloaderCreator(batch_size=2, num_workers=0, shuffle=False)
+    dataloader_creator.add_TarFlowDataset(tar_dir)
+    data_loader = dataloader_creator.get_dataloader()
+    assert len(data_loader) == 2
+    assert all(target["flow_gt"].shape[0] == 2 for _, target in data_loader)
+
+    # Distributed processes read disjoint shards and yield the same number of samples
+    rank_sums = []
+    for rank in range(2):
+        rank_dataset = TarFlowDataset(
+            tar_dir, augment=False, shuffle=False, num_replicas=2, rank=rank
+        )
+        assert len(rank_dataset) == 2
+        rank_sums.append({t["flow_gt"].sum().item() for _, t in rank_dataset})
+        assert len(rank_sums[-1]) == 2
+
+    assert not rank_sums[0] & rank_sums[1]
+
+
+def test_SharedSampleCache(tmp_path):
+
+    dataset = _create_dataset(str(tmp_path), io_params={"cache_size_mb": 1})
+    assert sample_cache_stats(dataset)["misses"] == 0
+
+    dataset = 4 * dataset
+    data_loader = DataLoader(dataset, batch_size=1, shuffle=False, num_workers=2)
+    samples = [target["flow_gt"] for _, target in data_loader]
+
+    stats = sample_cache_stats(dataset)
+    assert stats["misses"] + stats["hits"] == len(dataset)
+    assert stats["entries"] == 3
+    assert stats["hits"] >= len(dataset) - 2 * 3
+
+    for i in range(3):
+        assert torch.equal(samples[i], samples[i + 3])
+
+    # The least recently used sample is evicted when the budget is exhausted
+    img = np.zeros((16, 16, 3), dtype=np.uint8)
+    cache = SharedSampleCache(capacity_bytes=2 * 2 * img.size, max_entries=4)
+    cache.put(0, img, img)
+    cache.put(1, img, img)
+    assert cache.get(0) is not None
+    cache.put(2, img, img)
+
+    assert cache.get(1) is None
+    assert cache.get(0) is not None
+    assert cache.get(2) is not None
+    assert cache.stats()["entries"] == 2
+
+
+def _create_sintel(root_dir, scenes=("alley_1", "market_2"), n_frames=3):
+
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    for scene in scenes:
+        os.makedirs(osp.join(root_dir, "training", "clean", scene))
+        os.makedirs(osp.join(root_dir, "training", "flow", scene))
+        for i in range(n_frames):
+            Image.fromarray(img).save(
+                osp.join(root_dir, "training", "clean", scene, f"frame_{i:04d}.png")
+            )
+        for i in range(n_frames - 1):
+            write_flow(
+                osp.join(root_dir, "training", "flow", scene, f"frame_{i:04d}.flo"),
+                np.zeros((8, 8, 2), dtype=np.float32),
+            )
+
+
+def test_dataset_manifest(tmp_path, monkeypatch):
+
+    root_dir = str(tmp_path / "sintel")
+    manifest_dir = str(tmp_path / "manifests")
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    _create_sintel(root_dir)
+
+    io_params = {"manifest_dir": manifest_dir}
+    dataset = MPISintel(root_dir, augment=False, io_params=io_params)
+    assert len(dataset) == 4
+    assert len(os.listdir(manifest_dir)) == 1
+
+    scan_files = MPISintel._scan_files
+    n_scans = []
+
+    @functools.wraps(scan_files)
+    def counting_scan_files(**kwargs):
+        n_scans.append(1)
+        return scan_files(**kwargs)
+
+    monkeypatch.setattr(MPISintel, "_scan_files", counting_scan_files)
+    cached = MPISintel(root_dir, augment=False, io_params=io_params)
+    assert len(n_scans) == 0
+    assert cached.image_list == dataset.image_list
+    assert cached.flow_list == dataset.flow_list
+
+    # The manifest is rebuilt when a scanned directory changes or on request
+    scene_dir = osp.join(root_dir, "training", "clean", "alley_1")
+    Image.fromarray(img).save(osp.join(scene_dir, "frame_0003.png"))
+    os.utime(scene_dir, ns=(0, os.stat(scene_dir).st_mtime_ns + 10**9))
+
+    dataset = MPISintel(root_dir, augment=False, io_params=io_params)
+    assert len(dataset.image_list) == 5
+    assert len(n_scans) == 1
+
+    dataset = MPISintel(
+        root_dir,
+        augment=False,
+        io_params={"manifest_dir": manifest_dir, "rebuild_manifest": True},
+    )
+    assert len(dataset.image_list) == 5
+    assert len(n_scans) == 2
+    assert len(os.listdir(manifest_dir)) == 1
+
+    # A new scene only changes the modification time of its parent directory
+    _create_sintel(root_dir, scenes=("cave_2",))
+    for d in ["clean", "flow"]:
+        parent_dir = osp.join(root_dir, "training", d)
+        os.utime(parent_dir, ns=(0, os.stat(parent_dir).st_mtime_ns + 10**9))
+
+    dataset = MPISintel(root_dir, augment=False, io_params=io_params)
+    assert len(dataset.image_list) == 7
+    assert len(n_scans) == 3
+
+
+def test_lazy_index(tmp_path, monkeypatch):
+
+    root_dir = str(tmp_path / "sintel")
+    _create_sintel(root_dir)
+
+    scan_files = MPISintel._scan_files
+    n_scans = []
+
+    @functools.wraps(scan_files)
+    def counting_scan_files(**kwargs):
+        n_scans.append(1)
+        return scan_files(**kwargs)
+
+    monkeypatch.setattr(MPISintel, "_scan_files", counting_scan_files)
+
+    dataset = 3 * MPISintel(root_dir, augment=False)
+    assert len(n_scans) == 0
+    assert len(dataset) == 12
+    assert len(dataset.flow_list) == 12 and len(n_scans) == 1
+    assert dataset[5][0][0].shape == (3, 8, 8)
+
+    dataset = MPISintel(root_dir, augment=False, io_params={"lazy_index": False})
+    assert len(n_scans) == 2
+
+    # Datasets which are never iterated are never scanned
+    dataloader_creator = DataloaderCreator(batch_size=2, num_workers=0)
+    dataloader_creator.add_dataset(MPISintel(root_dir, augment=False))
+    assert len(n_scans) == 2
+    assert len(dataloader_creator.get_dataloader()) == 2
+    assert len(n_scans) == 3
+
+
+def test_distributed_index_files(tmp_path):
+
+    root_dir = str(tmp_path / "sintel")
+    _create_sintel(root_dir)
+    io_params = {"manifest_dir": str(tmp_path / "manifests"), "rebuild_manifest": True}
+
+    # The file lists are built on rank 0 before the other ranks pass the barrier
+    for rank in [0, 1]:
+        dataloader_creator = DataloaderCreator(
+            batch_size=2, num_workers=0, distributed=True, world_size=2
+        )
+        dataset = MPISintel(root_dir, augment=False, io_params=io_params)
+        dataloader_creator.add_dataset(dataset)
+
+        with mock.patch.object(
+            torch.distributed, "is_initialized", return_value=True
+        ), mock.patch.object(
+            torch.distributed, "broadcast_object_list"
+        ), mock.patch.object(
+            torch.distributed, "barrier"
+        ) as mock_barrier:
+            dataloader_creator.get_dataloader(rank=rank)
+
+        mock_barrier.assert_called_once()
+        assert dataset._pending_index is None
+        assert dataset.rebuild_manifest == (rank == 0)
+
+
+def test_uint8_images(tmp_path):
+
+    norm_params = {"use": True, "mean": [127.5] * 3, "std": [127.5] * 3}
+    dataset = _create_dataset(str(tmp_path), norm_params=norm_params)
+    uint8_dataset = _create_dataset(
+        str(tmp_path), norm_params=norm_params, io_params={"uint8_images": True}
+    )
+
+    # Normalizing the uint8 images on the device gives the same model inputs
+    normalize = Normalize(**norm_params)
+    for i in range(len(dataset)):
+        (img1, img2), target = dataset[i]
+        (u_img1, u_img2), u_target = uint8_dataset[i]
+
+        assert u_img1.dtype == torch.uint8 and u_img2.dtype == torch.uint8
+        u_img1, u_img2 = normalize(u_img1.float(), u_img2.float())
+        assert torch.equal(img1, u_img1)
+        assert torch.equal(img2, u_img2)
+        assert torch.equal(target["flow_gt"], u_target["flow_gt"])
+
+    (expected_img1, _), _ = dataset[0]
+    dataloader_creator = DataloaderCreator(
+        batch_size=2, shuffle=False, num_workers=0, uint8_images=True
+    )
+    dataloader_creator.add_dataset(dataset)
+    (img1, img2), _ = next(iter(dataloader_creator.get_dataloader()))
+    assert img1.dtype == torch.uint8 and img1.shape == (2, 3, 32, 48)
+
+    img1, _ = dataloader_creator.normalize(img1.float(), img2.float())
+    assert torch.equal(img1[0], expected_img1)
+
+
+def test_DeviceDataLoader(tmp_path):
+
+    dataset = _create_dataset(str(tmp_path), append_valid_mask=True)
+    data_loader = DataLoader(dataset, batch_size=2, shuffle=False)
+
+    device_data_loader = DeviceDataLoader(data_loader, torch.device("cpu"))
+    assert len(device_data_loader) == len(data_loader)
+    assert device_data_loader.dataset is dataset
+
+    for batch, device_batch in zip(data_loader, device_data_loader):
+        (img1, img2), target = batch
+        (d_img1, d_img2), d_target = device_batch
+
+        assert torch.equal(img1, d_img1) and torch.equal(img2, d_img2)
+        assert d_target.keys() == target.keys()
+        assert torch.equal(target["flow_gt"], d_target["flow_gt"])
+
+    # Without a device, the batches are yielded unchanged
+    device_data_loader = DeviceDataLoader(data_loader, None)
+    for batch, device_batch in zip(data_loader, device_data_loader):
+        assert torch.equal(batch[1]["flow_gt"], device_batch[1]["flow_gt"])
+
+
+def test_MixtureSampler(tmp_path):
+
+    sampler = MixtureSampler([10, 30], repeat_factors=[3, 1])
+    assert len(sampler) == 60
+    rates = sampler.sampling_rates()
+    assert np.isclose(rates[0]["fraction"], 0.5)
+    assert np.isclose(rates[0]["passes_per_epoch"], 3.0)
+    assert np.isclose(rates[1]["passes_per_epoch"], 1.0)
+
+    sampler = MixtureSampler([10, 30], weights=[0.25, 0.75], num_samples=20000)
+    indices = np.array(list(sampler))
+    assert len(indices) == 20000
+    assert indices.min() >= 0 and indices.max() < 40
+    assert abs(np.mean(indices < 10) - 0.25) < 0.02
+
+    # Every index of a dataset is drawn before any index is repeated
+    counts = np.bincount(indices[indices < 10], minlength=10)
+    assert counts.max() - counts.min() <= 1
+
+    # Distributed processes draw disjoint parts of the same sequence
+    samplers = [
+        MixtureSampler([10, 30], num_samples=41, num_replicas=2, rank=rank, seed=1)
+        for rank in range(2)
+    ]
+    for s in samplers:
+        s.set_epoch(3)
+    rank_indices = [list(s) for s in samplers]
+    assert len(rank_indices[0]) == len(rank_indices[1]) == 20
+    samplers[0].set_epoch(3)
+    assert rank_indices[0] == list(samplers[0])
+    assert rank_indices[0] != rank_indices[1]
+
+    dataloader_creator = DataloaderCreator(batch_size=2, num_workers=0)
+    dataloader_creator.add_dataset(_create_dataset(str(tmp_path), n_samples=2))
+    dataloader_creator.add_dataset(_create_dataset(str(tmp_path), n_samples=3))
+    dataloader_creator.set_mixture(repeat_factors=[2, 1])
+    data_loader = dataloader_creator.get_dataloader()
+    assert len(data_loader) == 3
+    for (img1, _), target in data_loader:
+        assert img1.shape == (2, 3, 32, 48)
+
+
+def test_ResumableSampler():
+
+    sampler = ResumableSampler(range(10), seed=3)
+    epoch0 = list(sampler)
+    epoch1 = list(sampler)
+    assert sorted(epoch0) == sorted(epoch1) == list(range(10))
+    assert epoch0 != epoch1
+    assert sampler.epoch == 2
+
+    # The state of an exhausted epoch refers to that epoch until the next one starts
+    sampler.set_epoch(0)
+    assert list(sampler) == epoch0
+    state = sampler.state_dict(consumed=4)
+    assert state == {"seed": 3, "epoch": 0, "start_index": 4}
+
+    resumed = ResumableSampler(range(10))
+    resumed.load_state_dict(state)
+    assert len(resumed) == 6
+    assert list(resumed) == epoch0[4:]
+    assert list(resumed) == epoch1
+
+    # Resuming twice within an epoch
+    resumed.load_state_dict(state)
+    iter(resumed)
+    assert resumed.state_dict(consumed=3)["start_index"] == 7
+
+    samplers = [
+        ResumableSampler(range(11), num_replicas=2, rank=rank) for rank in range(2)
+    ]
+    rank_indices = [list(s) for s in samplers]
+    for s in samplers:
+        s.load_state_dict(s.state_dict(consumed=2))
+    assert [list(s) for s in samplers] == [indices[2:] for indices in rank_indices]
+
+    sampler = MixtureSampler([10, 30], weights=[0.5, 0.5], num_samples=10000)
+    indices = list(sampler)
+    sampler.set_epoch(0)
+    for _ in zip(range(5000), sampler):
+        pass
+    resumed = MixtureSampler([10, 30], weights=[0.5, 0.5], num_samples=10000)
+    resumed.load_state_dict(sampler.state_dict(consumed=5000))
+    assert list(resumed) == indices[5000:]
+
+
+def test_shuffle_seed(tmp_path):
+
+    dataset = _create_dataset(str(tmp_path), n_samples=8)
+
+    # Without distributed training, the shuffling order follows the global torch seed
+    seeds = []
+    for torch_seed in [1, 1, 2]:
+        torch.manual_seed(torch_seed)
+        dataloader_creator = DataloaderCreator(batch_size=2, num_workers=0)
+        dataloader_creator.add_dataset(dataset)
+        seeds.append(dataloader_creator.get_dataloader().sampler.seed)
+
+    assert seeds[0] == seeds[1] != seeds[2]
+
+    # With distributed training, all the ranks use the seed of rank 0
+    def broadcast_rank_zero_seed(seeds, src):
+        seeds[0] = 1234
+
+    dataloader_creator = DataloaderCreator(
+        batch_size=2, num_workers=0, distributed=True, world_size=2
+    )
+    dataloader_creator.add_dataset(dataset)
+
+    with mock.patch.object(
+        torch.distributed, "is_initialized", return_value=True
+    ), mock.patch.object(
+        torch.distributed, "broadcast_object_list", side_effect=broadcast_rank_zero_seed
+    ), mock.patch.object(
+        torch.distributed, "barrier"
+    ):
+        sampler = dataloader_creator.get_dataloader(rank=1).sampler
+
+    assert sampler.seed == 1234
+
+    # The dataset mixture is drawn from the global torch seed as well
+    seeds = []
+    for torch_seed in [1, 1, 2]:
+        torch.manual_seed(torch_seed)
+        dataloader_creator = DataloaderCreator(batch_size=2, num_workers=0)
+        dataloader_creator.add_dataset(dataset)
+        dataloader_creator.add_dataset(dataset)
+        dataloader_creator.set_mixture(repeat_factors=[2, 1])
+        seeds.append(dataloader_creator.get_dataloader().sampler.seed)
+
+    assert seeds[0] == seeds[1] != seeds[2]
+
+
+def test_WorkerSeeder():
+
+    sampler = ResumableSampler(range(10))
+    seeder = WorkerSeeder(sampler)
+
+    def draw(worker_id):
+        seeder(worker_id)
+        return np.random.rand(), torch.rand(1).item()
+
+    assert draw(0) == draw(0)
+    assert draw(0) != draw(1)
+
+    seed0 = draw(0)
+    sampler.set_epoch(1)
+    assert draw(0) != seed0
+    sampler.load_state_dict({"seed": 0, "epoch": 0, "start_index": 4})
+    assert draw(0) != seed0
+
+
+def test_StageProfiler(tmp_path):
+
+    dataset = _create_dataset(str(tmp_path), n_samples=4, crop=True, crop_size=(16, 16))
+    profiler = StageProfiler()
+    dataset.set_profiler(profiler)
+
+    # Stages executed by the workers are recorded in the profiler of the main process
+    data_loader = DataLoader(dataset, batch_size=2, num_workers=2)
+    for _ in data_loader:
+        pass
+
+    stats = profiler.stats(n_samples=len(dataset))
+    assert list(stats) == ["read_image", "read_flow", "crop", "to_tensor", "sample"]
+    assert stats["sample"]["calls"] == 4
+    assert stats["read_image"]["bytes_per_sample"] == 2 * 32 * 48 * 3
+    assert stats["read_flow"]["bytes_per_sample"] == 32 * 48 * 2 * 4
+    assert stats["sample"]["total_ms"] > 0
+
+    profiler.reset()
+    assert profiler.stats()["sample"]["calls"] == 0
+
+    dataset.set_profiler(None)
+    dataset[0]
+    assert profiler.stats()["sample"]["calls"] == 0
+
+    # A profiler unpickled in a spawned worker records into the same table
+    # and can be pickled again
+    worker_profiler = StageProfiler.__new__(StageProfiler)
+    with mock.patch("multiprocessing.resource_tracker.unregister"):
+        worker_profiler.__setstate__(profiler.__getstate__())
+        worker_profiler.__setstate__(worker_profiler.__getstate__())
+    worker_profiler.record("sample", 1000)
+    assert profiler.stats()["sample"]["calls"] == 1
+
+
+def test_FrameStreamDataset(tmp_path):
+
+    dataset = BaseDataset(augment=False)
+    for scene, n_frames in [("a", 4), ("b", 3)]:
+        frames = []
+        for i in range(n_frames):
+            frames.append(osp.join(str(tmp_path), f"{scene}_{i}.png"))
+            img = np.random.randint(0, 255, (16, 24, 3), dtype=np.uint8)
+            Image.fromarray(img).save(frames[-1])
+
+        for i in range(n_frames - 1):
+            flow_path = osp.join(str(tmp_path), f"{scene}_{i}.flo")
+            write_flow(flow_path, np.random.randn(16, 24, 2).astype(np.float32))
+            dataset.image_list.append([frames[i], frames[i + 1]])
+            dataset.flow_list.append(flow_path)
+
+    stream = FrameStreamDataset(dataset)
+    assert [list(scene) for scene in stream.scenes] == [[0, 1, 2], [3, 4]]
+    assert len(stream) == 5
+
+    profiler = StageProfiler()
+    dataset.set_profiler(profiler)
+    samples = list(stream)
+    # Every frame is decoded once
+    assert profiler.stats()["read_image"]["calls"] == 7
+    dataset.set_profiler(None)
+
+    for index, ((img1, img2), target) in enumerate(samples):
+        (expected_img1, expected_img2), expected_target = dataset[index]
+        assert torch.equal(img1, expected_img1)
+        assert torch.equal(img2, expected_img2)
+        assert torch.equal(target["flow_gt"], expected_target["flow_gt"])
+
+    assert [target["scene"].item() for _, target in samples] == [0, 0, 0, 1, 1]
+
+    # Scenes are sharded across processes and workers
+    streams = [
+        FrameStreamDataset(dataset, num_replicas=2, rank=rank) for rank in range(2)
+    ]
+    assert [len(s) for s in streams] == [3, 2]
+
+    data_loader = DataLoader(stream, batch_size=1, num_workers=2)
+    flows = sorted(target["flow_gt"][0, :, 0, 0].tolist() for _, target in data_loader)
+    assert flows == sorted(t["flow_gt"][:, 0, 0].tolist() for _, t in samples)
+
+    dataloader_creator = DataloaderCreator(
+        batch_size=2, num_workers=0, drop_last=False, stream_frames=True
+    )
+    dataloader_creator.add_dataset(dataset)
+    data_loader = dataloader_creator.get_dataloader()
+    assert len(data_loader) == 3
+    assert sum(img1.shape[0] for (img1, _), _ in data_loader) == 5
+
+
+def test_BucketBatchSampler(tmp_path):
+
+    sizes = [(2, 2), (3, 3), (2, 2), (2, 2), (3, 3)]
+    sampler = BucketBatchSampler(sizes, batch_size=2)
+    assert list(sampler) == [[0, 2], [3], [1, 4]]
+    assert len(sampler) == 3
+
+    sampler = BucketBatchSampler(sizes, batch_size=2, drop_last=True, shuffle=True)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 2
+    assert all(len({sizes[i] for i in batch}) == 1 for batch in batches)
+
+    samplers = [
+        BucketBatchSampler(sizes, batch_size=2, num_replicas=2, rank=rank)
+        for rank in range(2)
+    ]
+    assert [len(s) for s in samplers] == [2, 1]
+    assert sorted(sum([sum(list(s), []) for s in samplers], [])) == list(range(5))
+
+    os.makedirs(str(tmp_path / "large"))
+    os.makedirs(str(tmp_path / "small"))
+    large = _create_dataset(str(tmp_path / "large"), n_samples=3)
+    small = _create_dataset(str(tmp_path / "small"), n_samples=2, size=(20, 36))
+    assert get_image_sizes(large + small) == [(32, 48)] * 3 + [(20, 36)] * 2
+
+    dataloader_creator = DataloaderCreator(
+        batch_size=2, num_workers=0, shuffle=False, drop_last=False, bucket_by_size=True
+    )
+    dataloader_creator.add_dataset(large)
+    dataloader_creator.add_dataset(small)
+    data_loader = dataloader_creator.get_dataloader()
+
+    shapes = [tuple(img1.shape) for (img1, _), _ in data_loader]
+    assert shapes == [(2, 3, 32, 48), (1, 3, 32, 48), (2, 3, 20, 36)]
@@ -296,6 +296,38 @@ class TestTrainer(TestCase):
 
         del trainer
 
+    @mock.patch.object(torch, "save")
+    @mock.patch("ezflow.engine.trainer.SummaryWriter")
+    @mock.patch("ezflow.engine.trainer.os")
+    def test_step_trainer_sampler_state(self, mock_os, mock_writer, mock_save_model):
+        cfg = get_training_cfg(
+            cfg_path="./tests/configs/custom_loss_trainer.yaml", custom=True
+        )
+        cfg.NUM_STEPS = 6
+
+        trainer = Trainer(
+            cfg, self.mock_model, self.train_loader_creator, self.val_loader_creator
+        )
+        trainer._trainer = Trainer._step_trainer
+
+        trainer.train()
+
+        ckpts = [
+            call.args[0]
+            for call in torch.save.call_args_list
+            if isinstance(call.args[0], dict) and "step" in call.args[0]
+        ]
+        assert [ckpt["step"] for ckpt in ckpts] == [1, 2, 3, 4, 5, 6]
+
+        # 4 batches per epoch
+        assert ckpts[2]["sampler_state_dict"]["epoch"] == 0
+        assert ckpts[2]["sampler_state_dict"]["start_index"] == 3
+        assert ckpts[5]["sampler_state_dict"]["epoch"] == 1
+        assert ckpts[5]["sampler_state_dict"]["start_index"] == 2
+        assert "rng_state" in ckpts[5]
+
+        del trainer
+
 
 class TestDistributedTrainer(TestCase):
     def setUp(self):
@@ -441,6 +473,69 @@ def test_eval_model():
     _ = eval_model(mock_model, dataloader_creator.get_dataloader(), device="cpu")
 
 
+def test_eval_model_variable_sizes():
+
+    # Batches of different sizes and image sizes, as batched by BucketBatchSampler
+    batches = [
+        (
+            (torch.rand(n, 3, h, w), torch.rand(n, 3, h, w)),
+            {"flow_gt": torch.rand(n, 2, h, w)},
+        )
+        for n, h, w in [(2, 30, 44), (1, 30, 44), (2, 20, 36)]
+    ]
+    metric = eval_model(mock_model, batches, device="cpu", pad_divisor=8)
+    assert metric > 0
+
+
+def test_eval_model_warm_start():
+    class WarmStartModel(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.conv = nn.Conv2d(3, 2, 1)
+            self.flow_inits = []
+
+        def forward(self, img1, img2, flow_init=None):
+            self.flow_inits.append(flow_init)
+            flow = self.conv(img1)
+            return {"flow_upsampled": flow, "flow_low": flow[:, :, ::8, ::8]}
+
+    class StreamBatches(list):
+        def __init__(self, scenes, num_workers):
+            super().__init__(
+                (
+                    (torch.rand(1, 3, 32, 48), torch.rand(1, 3, 32, 48)),
+                    {
+                        "flow_gt": torch.rand(1, 2, 32, 48),
+                        "scene": torch.tensor([scene]),
+                    },
+                )
+                for scene in scenes
+            )
+            self.num_workers = num_workers
+
+    # Samples of scenes interleaved, as streamed by two DataLoader workers
+    model = WarmStartModel()
+    batches = StreamBatches([0, 1, 0, 0, 1, 2, 1, 2, 0], num_workers=2)
+    metric = eval_model(model, batches, device="cpu", warm_start=True)
+    assert metric > 0
+
+    # The first call warms the device up, the first sample of every scene starts from zero
+    # and only the flows of the last scene of every worker are kept
+    flow_inits = model.flow_inits[1:]
+    assert [f is not None for f in flow_inits] == [
+        False,
+        False,
+        True,
+        True,
+        True,
+        False,
+        True,
+        True,
+        False,
+    ]
+    assert flow_inits[2].shape == (1, 2, 4, 6)
+
+
 def test_l1_pruning():
 
     model = nn.Sequential(
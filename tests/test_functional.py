@@ -1,8 +1,12 @@
+import itertools
+
 import numpy as np
+import pytest
 import torch
 import torchvision.transforms as transforms
 
 from ezflow.functional import (
+    BatchFlowAugmentor,
     FlowAugmentor,
     FlowOffsetLoss,
     MultiScaleLoss,
@@ -12,6 +16,16 @@ from ezflow.functional import (
     SparseFlowAugmentor,
     crop,
 )
+from ezflow.functional.data_augmentation.operations import (
+    AdvancedSpatialTransform,
+    resize_sparse_flow_map,
+    resize_sparse_flow_map_batch,
+)
+from ezflow.utils import (
+    flow_to_bilinear_interpolation_indices,
+    flow_to_bilinear_interpolation_weights,
+    get_flow_offsets,
+)
 
 img1 = np.random.rand(256, 256, 3).astype(np.uint8)
 img2 = np.random.rand(256, 256, 3).astype(np.uint8)
@@ -115,6 +129,103 @@ def test_FlowAugmentor():
     del augmentor
 
 
+def test_AdvancedSpatialTransform():
+
+    # Images storing their own pixel coordinates and a constant flow with a valid mask
+    ys, xs = np.mgrid[0:200, 0:300].astype(np.float32)
+    coords = np.stack([xs, ys, np.zeros_like(xs)], -1)
+    uv = np.array([3.5, -2.0], dtype=np.float32)
+    target = np.concatenate(
+        [np.broadcast_to(uv, (200, 300, 2)), np.ones((200, 300, 1), np.float32)], -1
+    )
+
+    for order in [0, 1]:
+        transform = AdvancedSpatialTransform(
+            crop=(96, 160), enabled=True, h_flip_prob=0.5, order=order
+        )
+        for _ in range(10):
+            aug_img1, aug_img2, aug_target = transform(coords, coords, target)
+            assert aug_img1.shape == aug_img2.shape == (96, 160, 3)
+            assert aug_target.shape == (96, 160, 3)
+            assert aug_img1.flags["C_CONTIGUOUS"] and aug_target.flags["C_CONTIGUOUS"]
+
+            # Crops stay inside the images
+            for aug_img in [aug_img1, aug_img2]:
+                assert aug_img[..., 0].min() >= -1e-3
+                assert aug_img[..., 0].max() <= 299 + 1e-3
+                assert aug_img[..., 1].min() >= -1e-3
+                assert aug_img[..., 1].max() <= 199 + 1e-3
+            assert np.allclose(aug_target[..., 2], 1.0)
+
+            # Following the flow from the first crop leads to the same point of the second image
+            linear = np.stack(
+                [
+                    aug_img2[0, 1, :2] - aug_img2[0, 0, :2],
+                    aug_img2[1, 0, :2] - aug_img2[0, 0, :2],
+                ],
+                1,
+            )
+            assert np.allclose(
+                aug_img2[..., :2] + aug_target[..., :2] @ linear.T,
+                aug_img1[..., :2] + uv,
+                atol=1e-2,
+            )
+
+    transform = AdvancedSpatialTransform(
+        crop=(300, 400), enabled=True, enable_out_of_boundary_crop=True
+    )
+    aug_img1, aug_img2, aug_target = transform(coords, coords, target[..., :2])
+    assert aug_img1.shape == (300, 400, 3)
+    assert aug_target.shape == (300, 400, 2)
+
+
+def test_BatchFlowAugmentor():
+
+    imgs = torch.randint(0, 255, (2, 3, 256, 256), dtype=torch.uint8)
+    flows = torch.randn(2, 2, 256, 256)
+    valid = (torch.rand(2, 256, 256) > 0.5).float()
+
+    augmentor = BatchFlowAugmentor(
+        crop_size=(224, 224),
+        noise_aug_params={"enabled": True, "aug_prob": 1.0},
+        eraser_aug_params={"enabled": True, "aug_prob": 1.0},
+        color_aug_params={"enabled": True, "asymmetric_color_aug_prob": 0.5},
+        flip_aug_params={"enabled": True, "h_flip_prob": 0.5, "v_flip_prob": 0.5},
+        spatial_aug_params={"enabled": True, "aug_prob": 1.0, "stretch_prob": 1.0},
+    )
+    aug_img1, aug_img2, aug_flow, _ = augmentor(imgs, imgs, flows)
+    assert aug_img1.shape == aug_img2.shape == (2, 3, 224, 224)
+    assert aug_flow.shape == (2, 2, 224, 224)
+    assert aug_img1.min() >= 0 and aug_img1.max() <= 255
+
+    augmentor.sparse_transform = True
+    _, _, aug_flow, aug_valid = augmentor(imgs, imgs, flows, valid)
+    assert aug_valid.shape == (2, 224, 224)
+    assert torch.all(aug_flow[aug_valid[:, None].expand_as(aug_flow) == 0] == 0)
+
+    # Flips and scaling are applied to the flow vectors
+    augmentor = BatchFlowAugmentor(
+        crop_size=(256, 256),
+        flip_aug_params={"enabled": True, "h_flip_prob": 1.0, "v_flip_prob": 1.0},
+    )
+    aug_img1, _, aug_flow, _ = augmentor(imgs, imgs, flows)
+    assert torch.allclose(aug_img1, imgs.float().flip(2, 3), atol=1e-3)
+    assert torch.allclose(aug_flow, -flows.flip(2, 3), atol=1e-5)
+
+    augmentor = BatchFlowAugmentor(
+        crop_size=(224, 224),
+        spatial_aug_params={
+            "enabled": True,
+            "aug_prob": 1.0,
+            "stretch_prob": 0.0,
+            "min_scale": 1.0,
+            "max_scale": 1.0,
+        },
+    )
+    _, _, aug_flow, _ = augmentor(imgs, imgs, torch.ones(2, 2, 256, 256))
+    assert torch.allclose(aug_flow, torch.full_like(aug_flow, 2.0))
+
+
 def test_SparseFlowAugmentor():
 
     valid = np.random.rand(256, 256).astype(np.float32)
@@ -138,6 +249,46 @@ def test_SparseFlowAugmentor():
     del augmentor
 
 
+def test_resize_sparse_flow_map():
+
+    # Rows collide when downscaling by less than 0.5
+    for (H, W), scale in itertools.product(
+        [(20, 30), (10, 200)], [0.3, 0.4, 0.6, 1.0, 1.7]
+    ):
+        sparse_flow = np.random.randn(H, W, 2).astype(np.float32)
+        sparse_valid = (np.random.rand(H, W) > 0.3).astype(np.float32)
+
+        H1, W1 = int(round(H * scale)), int(round(W * scale))
+        flow_img = np.zeros((H1, W1, 2), dtype=np.float32)
+        valid_img = np.zeros((H1, W1), dtype=np.int32)
+
+        # Valid vectors are moved to the nearest pixel, the last one wins on collisions
+        for y, x in zip(*np.nonzero(sparse_valid)):
+            x1, y1 = int(np.round(x * scale)), int(np.round(y * scale))
+            if 0 < x1 < W1 and 0 < y1 < H1:
+                flow_img[y1, x1] = sparse_flow[y, x] * scale
+                valid_img[y1, x1] = 1
+
+        resized_flow, resized_valid = resize_sparse_flow_map(
+            sparse_flow, sparse_valid, fx=scale, fy=scale
+        )
+        assert np.allclose(resized_flow, flow_img)
+        assert np.array_equal(resized_valid, valid_img)
+
+        batch_flow, batch_valid = resize_sparse_flow_map_batch(
+            torch.from_numpy(sparse_flow).permute(2, 0, 1)[None].repeat(2, 1, 1, 1),
+            torch.from_numpy(sparse_valid)[None].repeat(2, 1, 1),
+            fx=scale,
+            fy=scale,
+        )
+        assert batch_flow.shape == (2, 2, H1, W1)
+        for i in range(2):
+            assert torch.equal(
+                batch_flow[i], torch.from_numpy(resized_flow).permute(2, 0, 1)
+            )
+            assert torch.equal(batch_valid[i], torch.from_numpy(resized_valid))
+
+
 def test_SequenceLoss():
 
     valid_mask = torch.randn(4, 1, 256, 256)
@@ -201,3 +352,53 @@ def test_OffsetCrossEntropyLoss():
     loss_fn = OffsetCrossEntropyLoss(weight_anneal_fn="PolyAnnealer", **params)
     _ = loss_fn(flow_logits, offset_labs, valid, current_iter=0)
     del loss_fn, _
+
+
+def test_OffsetCrossEntropyLoss_sparse_labels():
+
+    flow_offsets = get_flow_offsets()
+    offset_labs, offset_idxs, offset_weights = [], [], []
+    for _ in range(2):
+        flow_ds = (np.random.randn(16, 16, 2) * 50).astype(np.float32)
+
+        labs, _ = flow_to_bilinear_interpolation_weights(flow_ds, None, flow_offsets)
+        offset_labs.append(torch.from_numpy(labs).reshape(16, 16, -1).permute(2, 0, 1))
+
+        idxs, weights = flow_to_bilinear_interpolation_indices(
+            flow_ds, None, flow_offsets
+        )
+        offset_idxs.append(torch.from_numpy(idxs).permute(2, 0, 1))
+        offset_weights.append(torch.from_numpy(weights).permute(2, 0, 1))
+
+    flow_logits = [torch.randn(2, 567, 16, 16)]
+    valid = torch.randint(0, 2, (2, 1, 128, 128))
+
+    loss_fn = OffsetCrossEntropyLoss(offset_loss_weight=[1])
+    dense_loss = loss_fn(flow_logits, torch.stack(offset_labs), valid, current_iter=0)
+    sparse_loss = loss_fn(
+        flow_logits,
+        None,
+        valid,
+        current_iter=0,
+        offset_idxs=torch.stack(offset_idxs),
+        offset_weights=torch.stack(offset_weights),
+    )
+    assert torch.allclose(dense_loss, sparse_loss)
+
+    # FlowOffsetLoss gets the sparse labels as keywords of the targets
+    loss_fn = FlowOffsetLoss(offset_loss_weight=[1])
+    flow_preds = [torch.randn(2, 2, 128, 128)]
+    flow_gt = torch.randn(2, 2, 128, 128)
+    targets = {
+        "flow_gt": flow_gt,
+        "valid": valid,
+        "offset_idxs": torch.stack(offset_idxs),
+        "offset_weights": torch.stack(offset_weights),
+    }
+    _ = loss_fn(flow_preds, flow_logits, current_iter=0, **targets)
+
+    with pytest.raises(AssertionError):
+        loss_fn(flow_preds, flow_logits, **targets)
+
+    with pytest.raises(AssertionError):
+        loss_fn(flow_preds, flow_logits, flow_gt, valid, current_iter=0)
@@ -27,6 +27,68 @@ def test_Predictor():
     assert flow.shape == (2, 2, 224, 224)
 
 
+def test_Predictor_export(tmp_path):
+
+    predictor = Predictor("RAFT", (0.0, 0.0, 0.0), (255.0, 255.0, 255.0), "raft.yaml")
+    image_pairs = [(img1[i : i + 1], img2[i : i + 1]) for i in range(2)]
+
+    summary = predictor.export(image_pairs, str(tmp_path), visualize=True)
+    assert summary["samples"] == 2 and summary["files"] == 4
+    assert (tmp_path / "000001.flo").exists()
+    assert (tmp_path / "000001_vis.png").exists()
+
+
+def test_Predictor_stream():
+
+    frames = [torch.randint(0, 256, (1, 3, 128, 128)).float() for _ in range(3)]
+
+    for model_name, encoder_name in [
+        ("RAFT", "fnet"),
+        ("PWCNet", "encoder"),
+        ("DCVNet", "encoder"),
+    ]:
+        predictor = Predictor(
+            model_name,
+            (0.0, 0.0, 0.0),
+            (255.0, 255.0, 255.0),
+            model_name.lower() + ".yaml",
+            pad_divisor=64,
+        )
+
+        n_encoded = []
+
+        def count_images(module, inputs, output):
+            x = inputs[0]
+            n_encoded.append(sum(i.shape[0] for i in x) if isinstance(x, list) else 1)
+
+        encoder = getattr(predictor.model, encoder_name)
+        handle = encoder.register_forward_hook(count_images)
+
+        flows = list(predictor.stream(frames))
+        assert len(flows) == len(frames) - 1
+        # Every frame is encoded once
+        assert sum(n_encoded) == len(frames)
+
+        with torch.no_grad():
+            for i, flow in enumerate(flows):
+                assert flow.shape == (1, 2, 128, 128)
+                assert torch.allclose(
+                    flow,
+                    predictor(frames[i], frames[i + 1]),
+                    atol=1e-4,
+                    equal_nan=True,
+                )
+
+        handle.remove()
+
+    predictor = Predictor(
+        "RAFT", (0.0, 0.0, 0.0), (255.0, 255.0, 255.0), "raft.yaml", pad_divisor=64
+    )
+    flows = list(predictor.stream(frames, warm_start=True))
+    assert len(flows) == 2
+    assert torch.equal(flows[0], predictor(frames[0], frames[1]))
+
+
 def test_RAFT():
 
     model = build_model("RAFT", "raft.yaml")
@@ -39,12 +101,60 @@ def test_RAFT():
     model.eval()
     output = model(img1, img2)
     assert output["flow_upsampled"].shape == (2, 2, 256, 256)
+    assert len(output["flow_preds"]) == 1
 
-    del model, output
+    all_output = model(img1, img2, return_all=True)
+    assert len(all_output["flow_preds"]) == model.cfg.UPDATE_ITERS
+    assert torch.allclose(all_output["flow_upsampled"], output["flow_upsampled"])
+
+    del model, output, all_output
 
     _ = build_model("RAFT", default=True)
 
 
+def test_RAFT_early_exit():
+
+    torch.manual_seed(0)
+    model = build_model("RAFT", "raft.yaml").eval()
+
+    frame1 = torch.randn(3, 3, 128, 128)
+    frame2 = torch.randn(3, 3, 128, 128)
+    frame1[0], frame2[0] = 0, 0
+    frame1[2] *= 5
+
+    with torch.no_grad():
+        reference = model(frame1, frame2)
+
+        params = model.cfg.EARLY_EXIT
+        params.USE = True
+        params.MIN_ITERS = 4
+        params.MAX_ITERS = model.cfg.UPDATE_ITERS
+
+        # Without convergence, the flow is the one of the full iterations
+        params.THRESHOLD = 0.0
+        output = model(frame1, frame2)
+        assert torch.equal(output["iterations"], torch.full((3,), params.MAX_ITERS))
+        assert torch.allclose(output["flow_upsampled"], reference["flow_upsampled"])
+        assert len(output["flow_preds"]) == 1
+
+        params.THRESHOLD = 1e9
+        output = model(frame1, frame2)
+        assert torch.equal(output["iterations"], torch.full((3,), params.MIN_ITERS))
+
+        # Converged samples give the same flow whether frozen or dropped
+        params.THRESHOLD = 0.5
+        outputs = []
+        for drop_converged in (False, True):
+            params.DROP_CONVERGED = drop_converged
+            outputs.append(model(frame1, frame2))
+
+        assert len(outputs[0]["iterations"].unique()) > 1
+        assert torch.equal(outputs[0]["iterations"], outputs[1]["iterations"])
+        assert torch.allclose(
+            outputs[0]["flow_upsampled"], outputs[1]["flow_upsampled"]
+        )
+
+
 def test_DICL():
 
     model = build_model("DICL", "dicl.yaml")
@@ -132,6 +242,7 @@ def test_VCN():
     model.eval()
     output = model(img, img)
     assert output["flow_upsampled"].shape == (16, 2, 256, 256)
+    assert len(output["flow_preds"]) == 1
 
     del model, output
 
@@ -148,11 +259,18 @@ def test_DCVNet():
         output["flow_logits"], list
     )
 
+    n_preds = len(output["flow_preds"])
+
     model.eval()
     output = model(img1, img2)
     assert output["flow_upsampled"].shape == (2, 2, 256, 256)
+    assert len(output["flow_preds"]) == 1
 
-    del model, output
+    all_output = model(img1, img2, return_all=True)
+    assert len(all_output["flow_preds"]) == n_preds
+    assert torch.allclose(all_output["flow_upsampled"], output["flow_upsampled"])
+
+    del model, output, all_output
 
     model = build_model("DCVNet", default=True)
     del model
@@ -5,17 +5,27 @@ import torch
 import torch.nn as nn
 
 from ezflow.utils import (
+    IMAGE_DECODER_REGISTRY,
     AverageMeter,
+    FlowWriter,
     concentric_offsets,
     coords_grid,
     endpointerror,
     find_free_port,
     flow_to_bilinear_interpolation_weights,
+    flow_to_bilinear_interpolation_weights_helper,
+    flow_to_bilinear_interpolation_weights_torch,
+    flow_to_image,
     forward_interpolate,
+    get_bilinear_weights_per_pixel,
     get_flow_offsets,
     is_port_available,
+    read_flow,
+    read_image,
     replace_relu,
     upflow,
+    write_flow,
+    write_flow_batch,
 )
 
 
@@ -40,6 +50,17 @@ def test_forward_interpolate():
     flow = torch.rand(2, 256, 256)
     _ = forward_interpolate(flow)
 
+    # A uniform motion is preserved, the uncovered border takes the nearest flow
+    flow = torch.zeros(2, 32, 48)
+    flow[0] = 2.0
+    assert torch.equal(forward_interpolate(flow), flow)
+
+    flow_batch = torch.stack([torch.randn(2, 32, 48), flow])
+    interpolated = forward_interpolate(flow_batch)
+    assert interpolated.shape == (2, 2, 32, 48)
+    assert torch.equal(interpolated[1], flow)
+    assert torch.equal(interpolated[0], forward_interpolate(flow_batch[0]))
+
 
 def test_upflow():
 
@@ -154,3 +175,176 @@ def test_flow_to_bilinear_interpolation_weights():
     assert err < 1e-10, err
 
     del flow, valid, offset_labs, dilation_labs
+
+
+def test_flow_to_bilinear_interpolation_weights_random_flows():
+
+    flow_offsets = get_flow_offsets(
+        dilations=[[1], [1, 2, 3, 5, 9, 16]], feat_strides=[2, 8], search_radius=4
+    )
+    max_flow = flow_offsets.max()
+
+    h, w = 12, 16
+    flow = (np.random.randn(h, w, 2) * 60).astype(np.float32)
+    flow[0, 0] = flow_offsets[3, 0]
+    valid = np.random.rand(h, w) > 0.1
+    valid &= np.all(np.abs(flow) <= max_flow, axis=2)
+
+    # per-pixel reference
+    ref_flow = flow.copy()
+    ref_flow[~valid] = max_flow
+    _, x_start, x_end, min_diff_x = flow_to_bilinear_interpolation_weights_helper(
+        ref_flow[:, :, 1], flow_offsets
+    )
+    _, y_start, y_end, min_diff_y = flow_to_bilinear_interpolation_weights_helper(
+        ref_flow[:, :, 0], flow_offsets
+    )
+    dilations = np.argmin(min_diff_x + min_diff_y, axis=1).reshape(-1)
+
+    ref_flow = ref_flow.reshape(h * w, 2)
+    ref_labs = np.zeros((h * w,) + flow_offsets.shape + flow_offsets.shape[1:])
+    for idx in range(h * w):
+        d = dilations[idx]
+        xs, xe, ys, ye = x_start[idx, d], x_end[idx, d], y_start[idx, d], y_end[idx, d]
+        weights = get_bilinear_weights_per_pixel(
+            ref_flow[idx, 1],
+            ref_flow[idx, 0],
+            flow_offsets[d, xs],
+            flow_offsets[d, ys],
+            flow_offsets[d, xe],
+            flow_offsets[d, ye],
+        )
+        for (i, j), weight in zip([(xs, ys), (xs, ye), (xe, ys), (xe, ye)], weights):
+            ref_labs[idx, d, i, j] = weight
+    ref_labs = ref_labs.reshape(h, w, *ref_labs.shape[1:]).astype(np.float32)
+
+    offset_labs, dilation_labs = flow_to_bilinear_interpolation_weights(
+        flow, valid, flow_offsets
+    )
+    assert offset_labs.dtype == np.float32
+    assert np.array_equal(offset_labs, ref_labs)
+    assert np.array_equal(dilation_labs, dilations.reshape(h, w))
+
+    batch_labs, batch_dilation_labs = flow_to_bilinear_interpolation_weights_torch(
+        torch.from_numpy(flow).permute(2, 0, 1)[None].repeat(2, 1, 1, 1),
+        torch.from_numpy(valid)[None].repeat(2, 1, 1),
+        flow_offsets,
+    )
+    assert batch_labs.shape == (2,) + offset_labs.shape
+    assert torch.allclose(batch_labs[1], torch.from_numpy(offset_labs), atol=1e-5)
+    assert torch.equal(batch_dilation_labs[0], torch.from_numpy(dilation_labs))
+
+
+def test_read_flow_mmap(tmp_path):
+
+    flow = np.random.randn(24, 40, 3).astype(np.float32)
+
+    flo_file = str(tmp_path / "flow.flo")
+    write_flow(flo_file, flow[..., :2])
+
+    pfm_file = str(tmp_path / "flow.pfm")
+    with open(pfm_file, "wb") as f:
+        f.write(b"PF\n40 24\n-1.0\n")
+        np.flipud(flow).astype("<f4").tofile(f)
+
+    for file_name in [flo_file, pfm_file]:
+        flow_default, _ = read_flow(file_name)
+        flow_mmap, _ = read_flow(file_name, mmap=True)
+
+        assert flow_mmap.dtype == np.float32
+        assert np.array_equal(flow_default, flow_mmap)
+        assert np.array_equal(flow_mmap, flow[..., :2])
+
+
+def test_image_decoders(tmp_path):
+
+    from PIL import Image
+
+    img = np.random.randint(0, 255, (20, 30, 3), dtype=np.uint8)
+    rgba = np.dstack([img, img[..., :1]])
+
+    for ext in [".png", ".ppm"]:
+        Image.fromarray(img).save(str(tmp_path / f"rgb{ext}"))
+        Image.fromarray(img[..., 0]).save(str(tmp_path / f"gray{ext}"))
+    Image.fromarray(rgba).save(str(tmp_path / "rgba.png"))
+    Image.fromarray(img).save(str(tmp_path / "rgb.jpg"))
+    jpeg = np.array(Image.open(str(tmp_path / "rgb.jpg")))
+
+    assert set(IMAGE_DECODER_REGISTRY.get_list()) == {"pil", "opencv", "torchvision"}
+    for decoder in IMAGE_DECODER_REGISTRY.get_list():
+        for ext in [".png", ".ppm"]:
+            decoded = read_image(str(tmp_path / f"rgb{ext}"), decoder=decoder)
+            assert decoded.dtype == np.uint8 and decoded.flags.writeable
+            assert np.array_equal(decoded, img)
+
+            decoded = read_image(str(tmp_path / f"gray{ext}"), decoder=decoder)
+            assert np.array_equal(decoded, img[..., 0])
+
+        decoded = read_image(str(tmp_path / "rgba.png"), decoder=decoder)
+        assert np.array_equal(decoded, rgba)
+
+        decoded = read_image(str(tmp_path / "rgb.jpg"), decoder=decoder)
+        assert np.abs(decoded.astype(int) - jpeg).max() <= 2
+
+        # Encoded images are decoded from their bytes, as read from tar shards
+        decode = IMAGE_DECODER_REGISTRY.get(decoder)
+        for name, expected in [("rgb.ppm", img), ("gray.png", img[..., 0])]:
+            with open(str(tmp_path / name), "rb") as f:
+                assert np.array_equal(decode(f.read()), expected)
+
+        with open(str(tmp_path / "rgb.jpg"), "rb") as f:
+            assert np.abs(decode(f.read()).astype(int) - jpeg).max() <= 2
+
+
+def test_write_flow_formats(tmp_path):
+
+    flow = (np.random.randn(2, 24, 40, 2) * 20).astype(np.float32)
+    valid = np.random.rand(2, 24, 40) > 0.5
+
+    flo_file = str(tmp_path / "flow.flo")
+    write_flow(flo_file, flow[0, ..., 0], flow[0, ..., 1])
+    assert np.array_equal(read_flow(flo_file)[0], flow[0])
+
+    file_names = [str(tmp_path / f"flow_{i}.flo16") for i in range(2)]
+    write_flow_batch(file_names, torch.from_numpy(flow).permute(0, 3, 1, 2))
+    for i, file_name in enumerate(file_names):
+        flow_default, valid_default = read_flow(file_name)
+        flow_mmap, _ = read_flow(file_name, mmap=True)
+
+        assert valid_default is None
+        assert flow_default.dtype == np.float32
+        assert np.array_equal(flow_default, flow_mmap)
+        assert np.abs(flow_default - flow[i]).max() < 0.05
+
+    file_names = [str(tmp_path / f"flow_{i}.png") for i in range(2)]
+    write_flow_batch(file_names, flow.transpose(0, 3, 1, 2), valid=valid)
+    for i, file_name in enumerate(file_names):
+        flow_png, valid_png = read_flow(file_name)
+
+        assert np.abs(flow_png - flow[i]).max() < 1 / 64
+        assert np.array_equal(valid_png > 0, valid[i])
+
+
+def test_FlowWriter(tmp_path):
+
+    flows = torch.randn(6, 2, 12, 16) * 5
+    names = [f"scene_{i % 2}/frame_{i:04d}" for i in range(6)]
+
+    with FlowWriter(str(tmp_path), num_threads=2, max_pending=2) as writer:
+        writer.write_batch(names[:4], flows[:4])
+        writer.write(names[4], flows[4])
+        writer.write(names[5], flows[5].permute(1, 2, 0).numpy())
+    summary = writer.close()
+
+    assert summary["samples"] == 6 and summary["files"] == 6
+    for name, flow in zip(names, flows):
+        flow_file, _ = read_flow(str(tmp_path / (name + ".flo")))
+        assert np.array_equal(flow_file, flow.permute(1, 2, 0).numpy())
+
+    writer = FlowWriter(str(tmp_path), ext=".png", visualize=True)
+    writer.write("valid", flows[0], valid=torch.ones(1, 12, 16))
+    assert writer.close()["files"] == 2
+
+    image = flow_to_image(flows[0].permute(1, 2, 0).numpy())
+    assert image.shape == (12, 16, 3) and image.dtype == np.uint8
+    assert np.array_equal(flow_to_image(np.zeros((4, 4, 2))), np.full((4, 4, 3), 255))
@@ -0,0 +1,191 @@
+import argparse
+import json
+import time
+
+from torch.utils.data import ConcatDataset
+from torch.utils.data.dataloader import default_collate
+
+from ezflow.data import build_dataloader, get_dataset_list
+from ezflow.engine import get_training_cfg
+from ezflow.utils import StageProfiler
+
+
+class ProfiledCollate:
+    """Records the time and the bytes of the collation of a batch"""
+
+    def __init__(self, collate_fn, profiler):
+        self.collate_fn = collate_fn
+        self.profiler = profiler
+
+    def __call__(self, batch):
+        with self.profiler.stage("collate") as stage:
+            batch = self.collate_fn(batch)
+            stage.output(batch)
+
+        return batch
+
+
+def set_profiler(dataset, profiler):
+    if isinstance(dataset, ConcatDataset):
+        for ds in dataset.datasets:
+            set_profiler(ds, profiler)
+    elif hasattr(dataset, "set_profiler"):
+        dataset.set_profiler(profiler)
+
+
+def benchmark(dataloader_creator, num_workers, n_batches, warmup_batches):
+    dataloader_creator.num_workers = num_workers
+
+    profiler = StageProfiler()
+    for dataset in dataloader_creator.dataset_list:
+        set_profiler(dataset, profiler)
+
+    data_loader = dataloader_creator.get_dataloader()
+    data_loader.collate_fn = ProfiledCollate(
+        data_loader.collate_fn or default_collate, profiler
+    )
+
+    n_batches = min(n_batches, len(data_loader) - warmup_batches)
+    assert n_batches > 0, "Not enough batches for the warm up and the benchmark"
+
+    data_iter = iter(data_loader)
+    for _ in range(warmup_batches):
+        next(data_iter)
+
+    # Workers keep preparing batches during the warm up, the records start from here
+    profiler.reset()
+    start_time = time.perf_counter()
+
+    n_samples = 0
+    for _ in range(n_batches):
+        (img1, _), _ = next(data_iter)
+        n_samples += img1.shape[0]
+
+    elapsed = time.perf_counter() - start_time
+
+    # Shuts the workers down, the stage times are summed over the workers and
+    # averaged over all the samples they prepared, including the prefetched ones
+    del data_iter
+    stages = profiler.stats()
+    n_profiled = stages["sample"]["calls"] if "sample" in stages else n_samples
+
+    return {
+        "num_workers": num_workers,
+        "batches": n_batches,
+        "samples": n_samples,
+        "seconds": elapsed,
+        "samples_per_sec": n_samples / elapsed,
+        "stages": profiler.stats(n_samples=n_profiled),
+    }
+
+
+def print_result(result):
+    print(
+        f"\nnum_workers: {result['num_workers']}, "
+        f"{result['samples_per_sec']:.2f} samples/sec "
+        f"({result['samples']} samples in {result['seconds']:.2f} s)"
+    )
+    print(f"{'stage':<30}{'ms/sample':>12}{'MB/sample':>12}{'calls':>10}")
+    for name, stage in result["stages"].items():
+        print(
+            f"{name:<30}{stage['ms_per_sample']:>12.3f}"
+            f"{stage['bytes_per_sample'] / 1024**2:>12.3f}{stage['calls']:>10}"
+        )
+
+
+def main(args):
+
+    cfg = get_training_cfg(args.train_cfg)
+    if args.dataset is not None and args.data_dir is not None:
+        if args.split == "training":
+            cfg.DATA.TRAIN_DATASET[args.dataset].ROOT_DIR = args.data_dir
+        else:
+            cfg.DATA.VAL_DATASET[args.dataset].ROOT_DIR = args.data_dir
+
+    dataloader_creator = build_dataloader(cfg.DATA, split=args.split)
+
+    print(
+        f"Config: {args.train_cfg}, split: {args.split}, "
+        f"batch size: {dataloader_creator.batch_size}"
+    )
+    print("-" * 80)
+
+    results = []
+    for num_workers in args.num_workers:
+        result = benchmark(
+            dataloader_creator, num_workers, args.n_batches, args.warmup_batches
+        )
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "train_cfg": args.train_cfg,
+        "split": args.split,
+        "batch_size": dataloader_creator.batch_size,
+        "results": results,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the throughput and the stages of the data pipeline of a training config"
+    )
+    parser.add_argument(
+        "--train_cfg",
+        type=str,
+        required=True,
+        help="Path to the training configuration file",
+    )
+    parser.add_argument(
+        "--split",
+        type=str,
+        default="training",
+        choices=["training", "validation"],
+        help="Data split to benchmark",
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default=None,
+        choices=get_dataset_list(),
+        help="Name of the dataset whose root directory is set by --data_dir",
+    )
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default=None,
+        help="Root directory of the dataset",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        nargs="+",
+        default=[0, 2, 4, 8],
+        help="Numbers of DataLoader workers to benchmark",
+    )
+    parser.add_argument(
+        "--n_batches", type=int, default=50, help="Number of benchmarked batches"
+    )
+    parser.add_argument(
+        "--warmup_batches",
+        type=int,
+        default=5,
+        help="Number of batches loaded before the benchmark",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Path of the JSON report, printed if not set",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,127 @@
+import argparse
+import os
+import os.path as osp
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from ezflow.functional import crop
+from ezflow.utils import read_flow, write_flow
+
+
+def write_pfm(file_name, data):
+    """Writes a H x W x 3 float32 array as a little-endian .pfm file"""
+    with open(file_name, "wb") as f:
+        f.write(b"PF\n")
+        f.write(f"{data.shape[1]} {data.shape[0]}\n".encode())
+        f.write(b"-1.0\n")
+        np.flipud(data).astype("<f4").tofile(f)
+
+
+def io_counters():
+    """Returns the bytes read through read() system calls and the number of page faults"""
+    rchar = 0
+    if osp.exists("/proc/self/io"):
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar"):
+                    rchar = int(line.split()[1])
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return rchar, usage.ru_minflt + usage.ru_majflt
+
+
+def benchmark(file_names, mmap, crop_size, repeats):
+    page_size = resource.getpagesize()
+
+    start_rchar, start_faults = io_counters()
+    start_time = time.perf_counter()
+
+    for _ in range(repeats):
+        for file_name in file_names:
+            flow, _ = read_flow(file_name, mmap=mmap)
+            if crop_size is not None:
+                flow = crop(flow, flow, None, crop_size=crop_size)[0]
+            # Materialize the flow so that every reader touches the data it returns
+            flow = np.array(flow)
+
+    elapsed = time.perf_counter() - start_time
+    end_rchar, end_faults = io_counters()
+
+    n_reads = repeats * len(file_names)
+    return {
+        "ms_per_file": 1000 * elapsed / n_reads,
+        "syscall_kb_per_file": (end_rchar - start_rchar) / 1024 / n_reads,
+        "page_fault_kb_per_file": (end_faults - start_faults)
+        * page_size
+        / 1024
+        / n_reads,
+    }
+
+
+def main(args):
+
+    height, width = args.size
+    tmp_dir = tempfile.mkdtemp()
+
+    files = {".pfm": [], ".flo": []}
+    for i in range(args.n_files):
+        flow = np.random.randn(height, width, 3).astype(np.float32)
+
+        files[".pfm"].append(osp.join(tmp_dir, f"{i:04d}.pfm"))
+        write_pfm(files[".pfm"][-1], flow)
+
+        files[".flo"].append(osp.join(tmp_dir, f"{i:04d}.flo"))
+        write_flow(files[".flo"][-1], flow[..., :2])
+
+    print(f"Flow size: {height} x {width}, files per format: {args.n_files}")
+    print("-" * 80)
+
+    for ext, file_names in files.items():
+        for crop_size in [None, args.crop_size]:
+            for mmap in [False, True]:
+                result = benchmark(file_names, mmap, crop_size, args.repeats)
+                print(
+                    f"{ext} reader: {'mmap' if mmap else 'default':<8}"
+                    f"crop: {str(crop_size):<12}"
+                    f"time: {result['ms_per_file']:8.3f} ms/file  "
+                    f"read(): {result['syscall_kb_per_file']:10.1f} KB/file  "
+                    f"page faults: {result['page_fault_kb_per_file']:10.1f} KB/file"
+                )
+
+    for file_names in files.values():
+        for file_name in file_names:
+            os.remove(file_name)
+    os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the default and memory-mapped flow readers"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs=2,
+        default=[540, 960],
+        help="Height and width of the flow files, FlyingThings3D size by default",
+    )
+    parser.add_argument(
+        "--crop_size",
+        type=int,
+        nargs=2,
+        default=[384, 768],
+        help="Height and width of the crop applied after reading",
+    )
+    parser.add_argument(
+        "--n_files", type=int, default=20, help="Number of flow files per format"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Number of times each file is read"
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os.path as osp
+import shutil
+import tempfile
+import time
+from glob import glob
+
+import numpy as np
+import torch
+from PIL import Image
+
+from ezflow.utils import IMAGE_DECODER_REGISTRY, read_image
+
+# Formats of the supported datasets: .ppm for FlyingChairs, .png for the other datasets
+# and .jpg for custom datasets
+FORMATS = [".png", ".jpg", ".ppm"]
+
+
+def write_images(tmp_dir, size, n_images):
+    height, width = size
+
+    # Smooth images compress like natural images, unlike uniform noise
+    y, x = np.mgrid[0:height, 0:width]
+    files = {ext: [] for ext in FORMATS}
+    for i in range(n_images):
+        phase = np.random.rand(3) * 2 * np.pi
+        img = np.stack(
+            [127.5 + 100 * np.sin(x / 37.0 + y / 53.0 + p) for p in phase], axis=-1
+        )
+        img = (img + np.random.randn(height, width, 3) * 10).clip(0, 255)
+        img = img.astype(np.uint8)
+
+        for ext in FORMATS:
+            files[ext].append(osp.join(tmp_dir, f"{i:04d}{ext}"))
+            Image.fromarray(img).save(files[ext][-1])
+
+    return files
+
+
+def benchmark(file_names, decoder, repeats):
+
+    # Warm up the decoder and the page cache
+    for file_name in file_names:
+        read_image(file_name, decoder=decoder)
+
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for file_name in file_names:
+            img = read_image(file_name, decoder=decoder)
+            # The datasets use contiguous H x W x 3 arrays
+            np.ascontiguousarray(img[..., :3])
+    elapsed = time.perf_counter() - start_time
+
+    return 1000 * elapsed / (repeats * len(file_names))
+
+
+def main(args):
+
+    np.random.seed(0)
+    torch.set_num_threads(args.num_threads)
+
+    tmp_dir = None
+    if args.image_dir is not None:
+        files = {}
+        for ext in FORMATS:
+            pattern = osp.join(args.image_dir, "**", "*" + ext)
+            file_names = sorted(glob(pattern, recursive=True))
+            if len(file_names) > 0:
+                files[ext] = file_names[: args.n_images]
+        source = args.image_dir
+    else:
+        tmp_dir = tempfile.mkdtemp()
+        files = write_images(tmp_dir, args.size, args.n_images)
+        source = f"synthetic {args.size[0]} x {args.size[1]} images"
+
+    print(f"Images: {source}, threads: {args.num_threads}")
+    print("-" * 80)
+
+    results = []
+    for ext, file_names in files.items():
+        for decoder in IMAGE_DECODER_REGISTRY.get_list():
+            ms_per_image = benchmark(file_names, decoder, args.repeats)
+            results.append(
+                {"format": ext, "decoder": decoder, "ms_per_image": ms_per_image}
+            )
+            print(
+                f"format: {ext:<6}decoder: {decoder:<14}"
+                f"time: {ms_per_image:8.3f} ms/image"
+            )
+
+    if tmp_dir is not None:
+        shutil.rmtree(tmp_dir)
+
+    fastest = {}
+    for result in results:
+        best = fastest.get(result["format"])
+        if best is None or result["ms_per_image"] < best["ms_per_image"]:
+            fastest[result["format"]] = result
+
+    print("-" * 80)
+    for ext, result in fastest.items():
+        print(f"Fastest decoder for {ext} files: {result['decoder']}")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "source": source,
+                    "num_threads": args.num_threads,
+                    "results": results,
+                    "fastest": {ext: r["decoder"] for ext, r in fastest.items()},
+                },
+                f,
+                indent=2,
+            )
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the image decoders of ezflow.utils.IMAGE_DECODER_REGISTRY"
+    )
+    parser.add_argument(
+        "--image_dir",
+        type=str,
+        default=None,
+        help="Directory searched recursively for .png, .jpg and .ppm images, "
+        "synthetic images are used if not set",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs=2,
+        default=[436, 1024],
+        help="Height and width of the synthetic images, MPI Sintel size by default",
+    )
+    parser.add_argument(
+        "--n_images", type=int, default=20, help="Number of images per format"
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Number of times each image is decoded"
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=1, help="Number of torch threads"
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="Path of the JSON results"
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,146 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from ezflow.functional.data_augmentation.operations import (
+    resize_sparse_flow_map,
+    resize_sparse_flow_map_batch,
+)
+
+
+def reference_resize_sparse_flow_map(flow, valid, fx=1.0, fy=1.0):
+    """The meshgrid based implementation that resize_sparse_flow_map replaced"""
+
+    H, W = flow.shape[:2]
+    coords = np.meshgrid(np.arange(W), np.arange(H))
+    coords = np.stack(coords, axis=-1)
+
+    coords = coords.reshape(-1, 2).astype(np.float32)
+    flow = flow.reshape(-1, 2).astype(np.float32)
+    valid = valid.reshape(-1).astype(np.float32)
+
+    coords0 = coords[valid >= 1]
+    flow0 = flow[valid >= 1]
+
+    H1 = int(round(H * fy))
+    W1 = int(round(W * fx))
+
+    coords1 = coords0 * [fx, fy]
+    flow1 = flow0 * [fx, fy]
+
+    xx = np.round(coords1[:, 0]).astype(np.int32)
+    yy = np.round(coords1[:, 1]).astype(np.int32)
+
+    v = (xx > 0) & (xx < W1) & (yy > 0) & (yy < H1)
+    xx = xx[v]
+    yy = yy[v]
+    flow1 = flow1[v]
+
+    flow_img = np.zeros([H1, W1, 2], dtype=np.float32)
+    valid_img = np.zeros([H1, W1], dtype=np.int32)
+
+    flow_img[yy, xx] = flow1
+    valid_img[yy, xx] = 1
+
+    return flow_img, valid_img
+
+
+def benchmark(fn, inputs):
+
+    start_time = time.perf_counter()
+    outputs = [fn(*args) for args in inputs]
+    elapsed = time.perf_counter() - start_time
+
+    return outputs, 1000 * elapsed / len(inputs)
+
+
+def main(args):
+
+    rng = np.random.default_rng(0)
+    torch.set_num_threads(args.num_threads)
+
+    height, width = args.size
+    flow = rng.standard_normal((height, width, 2)).astype(np.float32)
+    valid = (rng.random((height, width)) < args.density).astype(np.float32)
+
+    # Scales of sparse_spatial_transform, from downsampling to upsampling
+    scales = 2 ** rng.uniform(-0.2, 0.5, args.n_samples)
+    inputs = [(flow, valid, scale, scale) for scale in scales]
+
+    print(
+        f"Flow size: {height} x {width}, valid density: {args.density:.2f}, "
+        f"samples: {args.n_samples}"
+    )
+    print("-" * 80)
+
+    reference, reference_ms = benchmark(reference_resize_sparse_flow_map, inputs)
+    outputs, ms = benchmark(resize_sparse_flow_map, inputs)
+
+    for (flow_img, valid_img), (ref_flow, ref_valid) in zip(outputs, reference):
+        assert np.array_equal(flow_img, ref_flow) and np.array_equal(
+            valid_img, ref_valid
+        ), "resize_sparse_flow_map differs from the reference implementation"
+
+    print(f"{'reference':<30}{reference_ms:8.2f} ms/sample")
+    print(
+        f"{'resize_sparse_flow_map':<30}{ms:8.2f} ms/sample, "
+        f"{reference_ms / ms:.1f}x faster"
+    )
+
+    # The batched variant resizes all the samples of a batch with the same scale
+    flow_batch = torch.from_numpy(flow).permute(2, 0, 1)[None]
+    flow_batch = flow_batch.repeat(args.batch_size, 1, 1, 1)
+    valid_batch = torch.from_numpy(valid)[None].repeat(args.batch_size, 1, 1)
+    batch_inputs = [(flow_batch, valid_batch, scale, scale) for scale in scales]
+
+    batch_outputs, batch_ms = benchmark(resize_sparse_flow_map_batch, batch_inputs)
+
+    for (flow_img, valid_img), (ref_flow, ref_valid) in zip(batch_outputs, reference):
+        ref_flow = torch.from_numpy(ref_flow).permute(2, 0, 1)[None]
+        ref_valid = torch.from_numpy(ref_valid)[None]
+        assert torch.equal(flow_img, ref_flow.expand_as(flow_img)) and torch.equal(
+            valid_img, ref_valid.expand_as(valid_img)
+        ), "resize_sparse_flow_map_batch differs from the reference implementation"
+
+    print(
+        f"{'resize_sparse_flow_map_batch':<30}"
+        f"{batch_ms / args.batch_size:8.2f} ms/sample, batch size {args.batch_size}"
+    )
+    print("Outputs are identical to the reference implementation")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the resizing of the sparse flow maps of KITTI and HD1K"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs=2,
+        default=[375, 1242],
+        help="Height and width of the flow maps, KITTI size by default",
+    )
+    parser.add_argument(
+        "--density",
+        type=float,
+        default=0.2,
+        help="Fraction of valid flow vectors, about 0.2 for KITTI",
+    )
+    parser.add_argument(
+        "--n_samples", type=int, default=20, help="Number of resized samples"
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=4,
+        help="Batch size of the torch batched variant",
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=1, help="Number of torch threads"
+    )
+
+    args = parser.parse_args()
+    main(args)
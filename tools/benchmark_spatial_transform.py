@@ -0,0 +1,452 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from ezflow.functional.data_augmentation.operations import AdvancedSpatialTransform
+
+
+class ReferenceAdvancedSpatialTransform(object):
+    """
+    The implementation of AdvancedSpatialTransform that the closed form sampling replaced,
+    with the crops sampled by rejection. Sampling uses align_corners=False as before unless
+    align_corners is True, which matches the sampling of AdvancedSpatialTransform.
+    """
+
+    def __init__(
+        self,
+        crop,
+        enabled=False,
+        scale1=0.3,
+        scale2=0.1,
+        rotate=0.4,
+        translate=0.4,
+        stretch=0.3,
+        h_flip_prob=0.5,
+        schedule_coeff=1,
+        order=1,
+        enable_out_of_boundary_crop=False,
+        align_corners=False,
+    ):
+        self.enabled = enabled
+        self.crop = crop
+        self.scale = [scale1, 0.03, scale2]
+        self.rot = [rotate, 0.03] if rotate != 0 else None
+        self.trans = [translate, 0.03] if translate != 0 else None
+        self.squeeze = [stretch, 0.0] if stretch != 0 else None
+        self.h_flip_prob = h_flip_prob
+        self.t = np.zeros(6)
+        self.schedule_coeff = schedule_coeff
+        self.order = order
+        self.black = enable_out_of_boundary_crop
+        self.align_corners = align_corners
+
+    def to_identity(self):
+        self.t[0] = 1
+        self.t[2] = 0
+        self.t[4] = 0
+        self.t[1] = 0
+        self.t[3] = 1
+        self.t[5] = 0
+
+    def left_multiply(self, u0, u1, u2, u3, u4, u5):
+        result = np.zeros(6)
+        result[0] = self.t[0] * u0 + self.t[1] * u2
+        result[1] = self.t[0] * u1 + self.t[1] * u3
+
+        result[2] = self.t[2] * u0 + self.t[3] * u2
+        result[3] = self.t[2] * u1 + self.t[3] * u3
+
+        result[4] = self.t[4] * u0 + self.t[5] * u2 + u4
+        result[5] = self.t[4] * u1 + self.t[5] * u3 + u5
+        self.t = result
+
+    def inverse(self):
+        result = np.zeros(6)
+        a = self.t[0]
+        c = self.t[2]
+        e = self.t[4]
+        b = self.t[1]
+        d = self.t[3]
+        f = self.t[5]
+
+        denom = a * d - b * c
+
+        result[0] = d / denom
+        result[1] = -b / denom
+        result[2] = -c / denom
+        result[3] = a / denom
+        result[4] = (c * f - d * e) / denom
+        result[5] = (b * e - a * f) / denom
+
+        return result
+
+    def grid_transform(self, meshgrid, t, normalize=True, gridsize=None):
+        if gridsize is None:
+            h, w = meshgrid[0].shape
+        else:
+            h, w = gridsize
+        vgrid = torch.cat(
+            [
+                (meshgrid[0] * t[0] + meshgrid[1] * t[2] + t[4])[:, :, np.newaxis],
+                (meshgrid[0] * t[1] + meshgrid[1] * t[3] + t[5])[:, :, np.newaxis],
+            ],
+            -1,
+        )
+        if normalize:
+            vgrid[:, :, 0] = 2.0 * vgrid[:, :, 0] / max(w - 1, 1) - 1.0
+            vgrid[:, :, 1] = 2.0 * vgrid[:, :, 1] / max(h - 1, 1) - 1.0
+        return vgrid
+
+    def __call__(self, img1, img2, target):
+        if not self.enabled:
+            return img1, img2, target
+
+        inputs = [img1, img2]
+        h, w, _ = inputs[0].shape
+        th, tw = self.crop
+        meshgrid = torch.meshgrid(
+            [torch.Tensor(range(th)), torch.Tensor(range(tw))], indexing="ij"
+        )[::-1]
+        cornergrid = torch.meshgrid(
+            [torch.Tensor([0, th - 1]), torch.Tensor([0, tw - 1])], indexing="ij"
+        )[::-1]
+
+        for i in range(50):
+            # im0
+            self.to_identity()
+
+            if np.random.binomial(1, self.h_flip_prob):
+                mirror = True
+            else:
+                mirror = False
+
+            if mirror:
+                self.left_multiply(-1, 0, 0, 1, 0.5 * tw, -0.5 * th)
+            else:
+                self.left_multiply(1, 0, 0, 1, -0.5 * tw, -0.5 * th)
+            scale0 = 1
+            scale1 = 1
+            squeeze0 = 1
+            squeeze1 = 1
+            if not self.rot is None:
+                rot0 = np.random.uniform(-self.rot[0], +self.rot[0])
+                rot1 = (
+                    np.random.uniform(
+                        -self.rot[1] * self.schedule_coeff,
+                        self.rot[1] * self.schedule_coeff,
+                    )
+                    + rot0
+                )
+                self.left_multiply(
+                    np.cos(rot0), np.sin(rot0), -np.sin(rot0), np.cos(rot0), 0, 0
+                )
+            if not self.trans is None:
+                trans0 = np.random.uniform(-self.trans[0], +self.trans[0], 2)
+                trans1 = (
+                    np.random.uniform(
+                        -self.trans[1] * self.schedule_coeff,
+                        +self.trans[1] * self.schedule_coeff,
+                        2,
+                    )
+                    + trans0
+                )
+                self.left_multiply(1, 0, 0, 1, trans0[0] * tw, trans0[1] * th)
+            if not self.squeeze is None:
+                squeeze0 = np.exp(np.random.uniform(-self.squeeze[0], self.squeeze[0]))
+                squeeze1 = (
+                    np.exp(
+                        np.random.uniform(
+                            -self.squeeze[1] * self.schedule_coeff,
+                            self.squeeze[1] * self.schedule_coeff,
+                        )
+                    )
+                    * squeeze0
+                )
+            if not self.scale is None:
+                scale0 = np.exp(
+                    np.random.uniform(
+                        self.scale[2] - self.scale[0], self.scale[2] + self.scale[0]
+                    )
+                )
+                scale1 = (
+                    np.exp(
+                        np.random.uniform(
+                            -self.scale[1] * self.schedule_coeff,
+                            self.scale[1] * self.schedule_coeff,
+                        )
+                    )
+                    * scale0
+                )
+            self.left_multiply(
+                1.0 / (scale0 * squeeze0), 0, 0, 1.0 / (scale0 / squeeze0), 0, 0
+            )
+
+            self.left_multiply(1, 0, 0, 1, 0.5 * w, 0.5 * h)
+            transmat0 = self.t.copy()
+
+            # im1
+            self.to_identity()
+            if mirror:
+                self.left_multiply(-1, 0, 0, 1, 0.5 * tw, -0.5 * th)
+            else:
+                self.left_multiply(1, 0, 0, 1, -0.5 * tw, -0.5 * th)
+            if not self.rot is None:
+                self.left_multiply(
+                    np.cos(rot1), np.sin(rot1), -np.sin(rot1), np.cos(rot1), 0, 0
+                )
+            if not self.trans is None:
+                self.left_multiply(1, 0, 0, 1, trans1[0] * tw, trans1[1] * th)
+            self.left_multiply(
+                1.0 / (scale1 * squeeze1), 0, 0, 1.0 / (scale1 / squeeze1), 0, 0
+            )
+            self.left_multiply(1, 0, 0, 1, 0.5 * w, 0.5 * h)
+            transmat1 = self.t.copy()
+            transmat1_inv = self.inverse()
+
+            if self.black:
+                # black augmentation, allowing 0 values in the input images
+                # https://github.com/lmb-freiburg/flownet2/blob/master/src/caffe/layers/black_augmentation_layer.cu
+                break
+            else:
+                if (
+                    (
+                        self.grid_transform(
+                            cornergrid, transmat0, gridsize=[float(h), float(w)]
+                        ).abs()
+                        > 1
+                    ).sum()
+                    + (
+                        self.grid_transform(
+                            cornergrid, transmat1, gridsize=[float(h), float(w)]
+                        ).abs()
+                        > 1
+                    ).sum()
+                ) == 0:
+                    break
+        if i == 49:
+            # print("max_iter in augmentation")
+            self.to_identity()
+            self.left_multiply(1, 0, 0, 1, -0.5 * tw, -0.5 * th)
+            self.left_multiply(1, 0, 0, 1, 0.5 * w, 0.5 * h)
+            transmat0 = self.t.copy()
+            transmat1 = self.t.copy()
+
+        # do the real work
+        vgrid = self.grid_transform(meshgrid, transmat0, gridsize=[float(h), float(w)])
+        inputs_0 = F.grid_sample(
+            torch.Tensor(inputs[0]).permute(2, 0, 1)[np.newaxis],
+            vgrid[np.newaxis],
+            align_corners=self.align_corners,
+        )[0].permute(1, 2, 0)
+        if self.order == 0:
+            target_0 = F.grid_sample(
+                torch.Tensor(target).permute(2, 0, 1)[np.newaxis],
+                vgrid[np.newaxis],
+                align_corners=self.align_corners,
+                mode="nearest",
+            )[0].permute(1, 2, 0)
+        else:
+            target_0 = F.grid_sample(
+                torch.Tensor(target).permute(2, 0, 1)[np.newaxis],
+                vgrid[np.newaxis],
+                align_corners=self.align_corners,
+            )[0].permute(1, 2, 0)
+
+        mask_0 = target[:, :, 2:3].copy()
+        mask_0[mask_0 == 0] = np.nan
+        if self.order == 0:
+            mask_0 = F.grid_sample(
+                torch.Tensor(mask_0).permute(2, 0, 1)[np.newaxis],
+                vgrid[np.newaxis],
+                align_corners=self.align_corners,
+                mode="nearest",
+            )[0].permute(1, 2, 0)
+        else:
+            mask_0 = F.grid_sample(
+                torch.Tensor(mask_0).permute(2, 0, 1)[np.newaxis],
+                vgrid[np.newaxis],
+                align_corners=self.align_corners,
+            )[0].permute(1, 2, 0)
+        mask_0[torch.isnan(mask_0)] = 0
+
+        vgrid = self.grid_transform(meshgrid, transmat1, gridsize=[float(h), float(w)])
+        inputs_1 = F.grid_sample(
+            torch.Tensor(inputs[1]).permute(2, 0, 1)[np.newaxis],
+            vgrid[np.newaxis],
+            align_corners=self.align_corners,
+        )[0].permute(1, 2, 0)
+
+        # flow
+        pos = target_0[:, :, :2] + self.grid_transform(
+            meshgrid, transmat0, normalize=False
+        )
+        pos = self.grid_transform(pos.permute(2, 0, 1), transmat1_inv, normalize=False)
+        if target_0.shape[2] >= 4:
+            # scale
+            exp = target_0[:, :, 3:] * scale1 / scale0
+            target = torch.cat(
+                [
+                    (pos[:, :, 0] - meshgrid[0]).unsqueeze(-1),
+                    (pos[:, :, 1] - meshgrid[1]).unsqueeze(-1),
+                    mask_0,
+                    exp,
+                ],
+                -1,
+            )
+        else:
+            target = torch.cat(
+                [
+                    (pos[:, :, 0] - meshgrid[0]).unsqueeze(-1),
+                    (pos[:, :, 1] - meshgrid[1]).unsqueeze(-1),
+                    mask_0,
+                ],
+                -1,
+            )
+        #                               target_0[:,:,2].unsqueeze(-1) ], -1)
+        inputs = [np.asarray(inputs_0), np.asarray(inputs_1)]
+        target = np.asarray(target)
+
+        return inputs[0], inputs[1], target
+
+
+def benchmark(transform, img1, img2, target, n_samples):
+
+    # Warm up the cached sampling grids
+    transform(img1, img2, target)
+
+    np.random.seed(0)
+    start_time = time.perf_counter()
+    for _ in range(n_samples):
+        transform(img1, img2, target)
+    elapsed = time.perf_counter() - start_time
+
+    return 1000 * elapsed / n_samples
+
+
+def check_outputs(img1, img2, target, crop_size):
+    """
+    Compares the outputs of both implementations with the augmentations disabled, for which
+    both transforms take the center crop of the images. The reference samples with
+    align_corners=True so that both implementations sample the same pixels.
+    """
+
+    params = dict(
+        crop=crop_size,
+        enabled=True,
+        scale1=0.0,
+        scale2=0.0,
+        rotate=0.0,
+        translate=0.0,
+        stretch=0.0,
+        h_flip_prob=0.0,
+        schedule_coeff=0,
+    )
+    reference = ReferenceAdvancedSpatialTransform(align_corners=True, **params)
+    transform = AdvancedSpatialTransform(**params)
+
+    ref_outputs = reference(img1, img2, target)
+    outputs = transform(img1, img2, target)
+
+    # Up to rounding errors of the float32 sampling coordinates
+    for ref_output, output in zip(ref_outputs[:2], outputs[:2]):
+        assert ref_output.shape == output.shape and np.allclose(
+            ref_output, output, atol=0.1
+        ), "AdvancedSpatialTransform images differ from the reference implementation"
+
+    ref_target, target_out = ref_outputs[2], outputs[2]
+    assert ref_target.shape == target_out.shape and np.allclose(
+        ref_target[:, :, :2], target_out[:, :, :2], atol=1e-3
+    ), "AdvancedSpatialTransform flows differ from the reference implementation"
+
+    if target.shape[2] >= 3:
+        # A pixel next to an invalid pixel is invalidated or not depending on the
+        # rounding errors, the masks are compared where the neighbourhood is uniform
+        h, w = target.shape[:2]
+        th, tw = crop_size
+        y0, x0 = (h - th) // 2, (w - tw) // 2
+        windows = np.lib.stride_tricks.sliding_window_view(
+            target[y0 - 1 : y0 + th + 1, x0 - 1 : x0 + tw + 1, 2], (3, 3)
+        )
+        uniform = windows.min((-2, -1)) == windows.max((-2, -1))
+        assert np.array_equal(
+            ref_target[:, :, 2][uniform], target_out[:, :, 2][uniform]
+        ), "AdvancedSpatialTransform masks differ from the reference implementation"
+
+
+def main(args):
+
+    np.random.seed(0)
+    torch.set_num_threads(args.num_threads)
+
+    height, width = args.size
+    img1 = np.random.randint(0, 255, (height, width, 3)).astype(np.float32)
+    img2 = np.random.randint(0, 255, (height, width, 3)).astype(np.float32)
+    flow = np.random.randn(height, width, 2).astype(np.float32)
+    valid = (np.random.rand(height, width, 1) > 0.1).astype(np.float32)
+
+    print(
+        f"Image size: {height} x {width}, crop size: {args.crop_size[0]} x {args.crop_size[1]}, "
+        f"threads: {args.num_threads}"
+    )
+    print("-" * 80)
+
+    for out_of_boundary_crop in [False, True]:
+        for name, target in [
+            ("flow", flow),
+            ("flow + valid", np.concatenate([flow, valid], -1)),
+        ]:
+            if not out_of_boundary_crop:
+                check_outputs(img1, img2, target, args.crop_size)
+
+            times = []
+            for transform_cls in [
+                ReferenceAdvancedSpatialTransform,
+                AdvancedSpatialTransform,
+            ]:
+                transform = transform_cls(
+                    crop=args.crop_size,
+                    enabled=True,
+                    enable_out_of_boundary_crop=out_of_boundary_crop,
+                )
+                times.append(benchmark(transform, img1, img2, target, args.n_samples))
+
+            print(
+                f"target: {name:<14}out of boundary crop: {str(out_of_boundary_crop):<7}"
+                f"reference: {times[0]:8.2f} ms/sample, "
+                f"new: {times[1]:8.2f} ms/sample, {times[0] / times[1]:.1f}x faster"
+            )
+
+    print("Outputs of the center crops match the reference implementation")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the advanced spatial transform per sample"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs=2,
+        default=[540, 960],
+        help="Height and width of the input images, FlyingThings3D size by default",
+    )
+    parser.add_argument(
+        "--crop_size",
+        type=int,
+        nargs=2,
+        default=[384, 768],
+        help="Height and width of the crop",
+    )
+    parser.add_argument(
+        "--n_samples", type=int, default=20, help="Number of transformed samples"
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=1, help="Number of torch threads"
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import os.path as osp
+
+from ezflow.models import Predictor
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".ppm")
+
+
+def get_image_pairs(image_dir):
+    """
+    Pairs consecutive frames of every directory under image_dir, as in the test splits
+    of MPI Sintel, and names every pair after the path of its first frame.
+    """
+
+    image_pairs, names = [], []
+    for root, dirs, files in sorted(os.walk(image_dir)):
+        dirs.sort()
+        frames = sorted(f for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+
+        for frame1, frame2 in zip(frames[:-1], frames[1:]):
+            image_pairs.append((osp.join(root, frame1), osp.join(root, frame2)))
+            names.append(osp.splitext(osp.relpath(image_pairs[-1][0], image_dir))[0])
+
+    return image_pairs, names
+
+
+def main(args):
+
+    image_pairs, names = get_image_pairs(args.image_dir)
+    assert len(image_pairs) > 0, f"No image pairs found in {args.image_dir}"
+
+    predictor = Predictor(
+        args.model,
+        mean=args.mean,
+        std=args.std,
+        model_cfg_path=args.model_cfg,
+        model_weights_path=args.weights,
+        custom_cfg_file=args.custom_cfg,
+        default=args.model_cfg is None,
+        device=args.device,
+        flow_scale=args.flow_scale,
+        pad_divisor=args.pad_divisor,
+    )
+
+    print(f"Predicting the flow of {len(image_pairs)} image pairs")
+    summary = predictor.export(
+        image_pairs,
+        args.output_dir,
+        names=names,
+        ext=args.ext,
+        num_threads=args.num_threads,
+        max_pending=args.max_pending,
+        visualize=args.visualize,
+    )
+
+    print(
+        f"{summary['files']} files ({summary['bytes'] / 1024**2:.1f} MB) written to "
+        f"{args.output_dir} in {summary['seconds']:.2f} s, "
+        f"{summary['samples_per_sec']:.2f} samples/sec"
+    )
+
+    if args.summary is not None:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Predict the flow between consecutive frames and write it to files"
+    )
+    parser.add_argument("--model", type=str, required=True, help="Name of the model")
+    parser.add_argument(
+        "--model_cfg",
+        type=str,
+        default=None,
+        help="Path to the model config file, the default config is used if not set",
+    )
+    parser.add_argument(
+        "--custom_cfg",
+        action="store_true",
+        help="Whether the model config file is a custom config file",
+    )
+    parser.add_argument(
+        "--weights", type=str, default=None, help="Path to the model weights"
+    )
+    parser.add_argument(
+        "--image_dir",
+        type=str,
+        required=True,
+        help="Directory whose subdirectories hold the frames of the sequences",
+    )
+    parser.add_argument(
+        "--output_dir", type=str, required=True, help="Directory of the flow files"
+    )
+    parser.add_argument(
+        "--ext",
+        type=str,
+        default=".flo",
+        choices=[".flo", ".flo16", ".png"],
+        help="Format of the flow files",
+    )
+    parser.add_argument(
+        "--visualize",
+        action="store_true",
+        help="Also write color coded images of the flows",
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=4, help="Number of writing threads"
+    )
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        default=16,
+        help="Maximum number of predictions waiting to be written",
+    )
+    parser.add_argument(
+        "--mean",
+        type=float,
+        nargs=3,
+        default=[0.0, 0.0, 0.0],
+        help="Mean of the image channels used for normalization",
+    )
+    parser.add_argument(
+        "--std",
+        type=float,
+        nargs=3,
+        default=[255.0, 255.0, 255.0],
+        help="Standard deviation of the image channels used for normalization",
+    )
+    parser.add_argument(
+        "--device", type=str, default="cpu", help="Device used for prediction"
+    )
+    parser.add_argument(
+        "--flow_scale", type=float, default=1.0, help="Scale of the predicted flow"
+    )
+    parser.add_argument(
+        "--pad_divisor",
+        type=int,
+        default=1,
+        help="Divisor to which the image dimensions are padded",
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        default=None,
+        help="Path of a JSON file in which the summary of the export is saved",
+    )
+
+    args = parser.parse_args()
+    main(args)
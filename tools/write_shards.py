@@ -0,0 +1,97 @@
+import argparse
+import os.path as osp
+
+from ezflow.data import DATASET_REGISTRY, write_flow_shards, write_tar_shards
+from ezflow.engine import get_training_cfg
+
+
+def main(args):
+
+    # Load training configuration
+    cfg = get_training_cfg(args.train_cfg)
+
+    data_cfg = (
+        cfg.DATA.TRAIN_DATASET
+        if args.split.lower() == "training"
+        else cfg.DATA.VAL_DATASET
+    )
+
+    for key in data_cfg:
+        if args.dataset is not None and key != args.dataset:
+            continue
+
+        data_cfg[key].INIT_SEED = cfg.DATA.INIT_SEED
+        data_cfg[key].NORM_PARAMS = cfg.DATA.NORM_PARAMS
+        data_cfg[key].APPEND_VALID_MASK = cfg.DATA.APPEND_VALID_MASK
+
+        dataset = DATASET_REGISTRY.get(key)(data_cfg[key])
+
+        shard_dir = osp.join(args.output_dir, key)
+        write_fn = write_tar_shards if args.format == "tar" else write_flow_shards
+        meta = write_fn(
+            dataset,
+            shard_dir,
+            samples_per_shard=args.samples_per_shard,
+            flow_dtype=args.flow_dtype,
+        )
+
+        print(
+            f"{key}: {meta['num_samples']} samples written to "
+            f"{len(meta['shards'])} {args.format} shards in {shard_dir}"
+        )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Pack the datasets of a training configuration into shards"
+    )
+    parser.add_argument(
+        "--train_cfg",
+        type=str,
+        required=True,
+        help="Path to the training configuration file",
+    )
+    parser.add_argument(
+        "--split",
+        type=str,
+        default="training",
+        choices=["training", "validation"],
+        help="Dataset split of the training configuration to be packed",
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default=None,
+        help="Name of a single dataset of the split to be packed",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Path to the output directory, one sub-directory is created per dataset",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default="binary",
+        choices=["binary", "tar"],
+        help="Shard format, binary shards are read with random access by ShardedFlowDataset "
+        "and tar shards sequentially by TarFlowDataset",
+    )
+    parser.add_argument(
+        "--samples_per_shard",
+        type=int,
+        default=1000,
+        help="Maximum number of samples per shard",
+    )
+    parser.add_argument(
+        "--flow_dtype",
+        type=str,
+        default="float16",
+        choices=["float16", "float32"],
+        help="Data type used to store the flow",
+    )
+
+    args = parser.parse_args()
+    main(args)